@@ -0,0 +1,382 @@
+"""Архивация старых месячных партиций games: отсоединение, потоковый экспорт частями в S3 или ARCHIVE_DIR и удаление"""
+import csv
+import gzip
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from db import get_pool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+COLUMNS = ('id', 'player_id', 'bet_amount', 'selected_side', 'result_side', 'won', 'win_amount',
+           'created_at', 'server_seed_hash', 'nonce')
+
+PARTITIONS_SQL = '''
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'games'::regclass
+'''
+
+RANGE_END = re.compile(r"TO \('([^']+)'\)")
+
+# Порядок (created_at, id) задаёт ключ, с которого продолжается прерванная выгрузка
+PART_SQL = f'SELECT {", ".join(COLUMNS)} FROM "{{name}}" {{where}} ORDER BY created_at, id'
+
+PROGRESS_SQL = 'SELECT parts, COALESCE(rows, 0), last_created_at, last_id FROM games_archives WHERE partition_name = %s'
+
+PURGE_IDEMPOTENCY_KEYS_SQL = '''
+    DELETE FROM idempotency_keys
+    WHERE ctid = ANY(ARRAY(
+        SELECT ctid FROM idempotency_keys
+        WHERE created_at < LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+        LIMIT %s
+    ))
+'''
+
+
+def _parquet_schema():
+    return pa.schema([
+        ('id', pa.int32()),
+        ('player_id', pa.int32()),
+        ('bet_amount', pa.decimal128(18, 8)),
+        ('selected_side', pa.string()),
+        ('result_side', pa.string()),
+        ('won', pa.bool_()),
+        ('win_amount', pa.decimal128(18, 8)),
+        ('created_at', pa.timestamp('us')),
+        ('server_seed_hash', pa.string()),
+        ('nonce', pa.int64())
+    ])
+
+
+class ParquetSink:
+    """Каждая порция строк становится отдельной row group, в памяти держится только она"""
+    extension = 'parquet'
+
+    def __init__(self, path: str):
+        self._schema = _parquet_schema()
+        self._writer = pq.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write(self, rows: list):
+        columns = list(zip(*rows))
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+            schema=self._schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+
+class CsvGzipSink:
+    extension = 'csv.gz'
+
+    def __init__(self, path: str):
+        self._file = gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+def _sink_class(fmt: str):
+    if fmt == 'parquet' or (fmt == 'auto' and pa is not None):
+        if pa is None:
+            raise RuntimeError('ARCHIVE_FORMAT=parquet requires pyarrow')
+        return ParquetSink
+    return CsvGzipSink
+
+
+class Archiver:
+    def __init__(self, pool=None, keep_months: int = None, local_dir: str = None, bucket: str = None,
+                 prefix: str = None, fmt: str = None, chunk_size: int = 50000, part_rows: int = None):
+        self.pool = pool or get_pool()
+        self.keep_months = keep_months or int(os.environ.get('ARCHIVE_KEEP_MONTHS', '12'))
+        # Диск функции временный: локальный каталог — только явно заданный ARCHIVE_DIR
+        self.local_dir = local_dir or os.environ.get('ARCHIVE_DIR')
+        self.bucket = bucket or os.environ.get('ARCHIVE_S3_BUCKET')
+        self.prefix = prefix if prefix is not None else os.environ.get('ARCHIVE_S3_PREFIX', 'archive/games/')
+        self.sink_class = _sink_class(fmt or os.environ.get('ARCHIVE_FORMAT', 'auto'))
+        self.chunk_size = chunk_size
+        self.part_rows = part_rows or int(os.environ.get('ARCHIVE_PART_ROWS', '1000000'))
+
+    def destination(self):
+        """Куда сохраняются части: s3://bucket/prefix, ARCHIVE_DIR или None, если надёжного места нет"""
+        if self.bucket:
+            return f's3://{self.bucket}/{self.prefix}'
+        if self.local_dir:
+            return os.path.join(self.local_dir, '')
+        return None
+
+    def _require_destination(self):
+        if self.destination() is None:
+            raise RuntimeError('No durable archive destination: set ARCHIVE_S3_BUCKET or ARCHIVE_DIR')
+
+    def ensure_partitions(self, months_ahead: int = 3) -> int:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('SELECT games_ensure_partitions(%s)', (months_ahead,))
+            created = cur.fetchone()[0]
+            conn.commit()
+        return created
+
+    def expired_partitions(self) -> list:
+        """Партиции, целиком лежащие раньше начала месяца (текущий - keep_months)"""
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)",
+                (self.keep_months,)
+            )
+            cutoff = cur.fetchone()[0]
+            cur.execute(PARTITIONS_SQL)
+            partitions = cur.fetchall()
+            conn.rollback()
+        expired = []
+        for name, bound in partitions:
+            match = RANGE_END.search(bound)
+            if not match:
+                continue
+            range_end = datetime.fromisoformat(match.group(1))
+            if range_end <= cutoff:
+                expired.append((name, range_end))
+        return sorted(expired, key=lambda partition: partition[1])
+
+    def detach(self, name: str, range_end: datetime):
+        self._require_destination()
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                'INSERT INTO games_archives (partition_name, range_end) VALUES (%s, %s) ON CONFLICT (partition_name) DO NOTHING',
+                (name, range_end)
+            )
+            cur.execute(f'ALTER TABLE games DETACH PARTITION "{name}"')
+            conn.commit()
+
+    def pending(self) -> list:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT partition_name FROM games_archives WHERE status = 'detached' ORDER BY range_end")
+            names = [row[0] for row in cur.fetchall()]
+            conn.rollback()
+        return names
+
+    def _store(self, path: str, filename: str, size: int) -> str:
+        """Кладёт часть в S3 или ARCHIVE_DIR и проверяет, что она сохранена целиком"""
+        if self.bucket:
+            key = f'{self.prefix}{filename}'
+            client = self._s3()
+            client.upload_file(path, self.bucket, key)
+            stored = client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+            location = f's3://{self.bucket}/{key}'
+        else:
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+            stored = os.path.getsize(path)
+            location = path
+        if stored != size:
+            raise RuntimeError(f'{location}: stored {stored} bytes, expected {size}')
+        if self.bucket:
+            os.remove(path)
+        return location
+
+    def _export_part(self, name: str, number: int, after: tuple, deadline: float = None):
+        """Строки после ключа (created_at, id) до part_rows или дедлайна в один файл; None, если строк не осталось"""
+        filename = f'{name}-{number:04d}.{self.sink_class.extension}'
+        directory = tempfile.gettempdir() if self.bucket else self.local_dir
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, filename)
+        rows = 0
+        last = None
+        sink = None
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(name=f'archive_{name}') as cur:
+                cur.itersize = self.chunk_size
+                if after is None:
+                    cur.execute(PART_SQL.format(name=name, where=''))
+                else:
+                    cur.execute(PART_SQL.format(name=name, where='WHERE (created_at, id) > (%s, %s)'), after)
+                while rows < self.part_rows:
+                    chunk = cur.fetchmany(min(self.chunk_size, self.part_rows - rows))
+                    if not chunk:
+                        break
+                    if sink is None:
+                        sink = self.sink_class(path)
+                    sink.write(chunk)
+                    rows += len(chunk)
+                    last = chunk[-1]
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+            conn.rollback()
+        except Exception:
+            if sink is not None:
+                sink.close()
+                os.remove(path)
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+        if sink is None:
+            return None
+        sink.close()
+        size = os.path.getsize(path)
+        return {
+            'rows': rows,
+            'bytes': size,
+            'location': self._store(path, filename, size),
+            'last': (last[COLUMNS.index('created_at')], last[COLUMNS.index('id')])
+        }
+
+    def export(self, name: str, deadline: float = None) -> dict:
+        """Выгружает отсоединённую таблицу частями, продолжая с сохранённого ключа; за вызов — хотя бы одна часть
+
+        Таблица удаляется только когда все части сохранены и их строки сошлись с таблицей.
+        """
+        self._require_destination()
+        started = time.monotonic()
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(PROGRESS_SQL, (name,))
+            parts, total_rows, last_created_at, last_id = cur.fetchone()
+            conn.rollback()
+        after = (last_created_at, last_id) if last_id is not None else None
+        rows = 0
+        size = 0
+        finished = False
+
+        while True:
+            part = self._export_part(name, parts + 1, after, deadline)
+            if part is None:
+                finished = True
+                break
+            parts += 1
+            rows += part['rows']
+            size += part['bytes']
+            after = part['last']
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    'UPDATE games_archives SET parts = %s, rows = COALESCE(rows, 0) + %s, bytes = COALESCE(bytes, 0) + %s, '
+                    'last_created_at = %s, last_id = %s WHERE partition_name = %s',
+                    (parts, part['rows'], part['bytes'], after[0], after[1], name)
+                )
+                conn.commit()
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+        location = f'{self.destination()}{name}-*.{self.sink_class.extension}'
+        if finished:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                cur.execute(f'SELECT COUNT(*) FROM "{name}"')
+                table_rows = cur.fetchone()[0]
+                if table_rows != total_rows + rows:
+                    conn.rollback()
+                    raise RuntimeError(f'{name}: {table_rows} rows in table, {total_rows + rows} archived')
+                cur.execute(
+                    "UPDATE games_archives SET status = 'archived', location = %s, archived_at = CURRENT_TIMESTAMP WHERE partition_name = %s",
+                    (location, name)
+                )
+                cur.execute(f'DROP TABLE "{name}"')
+                conn.commit()
+
+        elapsed = time.monotonic() - started
+        return {
+            'partition': name,
+            'rows': rows,
+            'parts': parts,
+            'bytes': size,
+            'location': location,
+            'finished': finished,
+            'seconds': round(elapsed, 2),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0
+        }
+
+    def _s3(self):
+        if boto3 is None:
+            raise RuntimeError('ARCHIVE_S3_BUCKET is set, but boto3 is not installed')
+        return boto3.client('s3', endpoint_url=os.environ.get('ARCHIVE_S3_ENDPOINT') or None)
+
+    def run(self, max_partitions: int = None, time_budget: float = None) -> dict:
+        """Создаёт будущие партиции, дописывает незавершённые выгрузки и архивирует просроченные месяцы
+
+        Без ARCHIVE_S3_BUCKET и ARCHIVE_DIR партиции не отсоединяются. При time_budget выгрузка
+        останавливается между порциями и продолжается следующим запуском.
+        """
+        created = self.ensure_partitions()
+        if self.destination() is None:
+            return {'partitions_created': created, 'archived': [],
+                    'skipped': 'No durable archive destination: set ARCHIVE_S3_BUCKET or ARCHIVE_DIR'}
+
+        deadline = time.monotonic() + time_budget if time_budget else None
+        exported = []
+        for name in self.pending():
+            if exported and not exported[-1]['finished']:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            exported.append(self.export(name, deadline))
+        for name, range_end in self.expired_partitions():
+            if max_partitions is not None and len(exported) >= max_partitions:
+                break
+            if exported and not exported[-1]['finished']:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self.detach(name, range_end)
+            exported.append(self.export(name, deadline))
+        return {'partitions_created': created, 'archived': exported}
+
+
+def purge_idempotency_keys(pool=None, max_age_hours: float = None, batch_size: int = 10000) -> int:
+    """Удаляет просроченные ключи идемпотентности порциями, каждая в своей короткой транзакции"""
+    pool = pool or get_pool()
+    max_age_hours = max_age_hours or float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24'))
+    deleted = 0
+    with pool.connection() as conn, conn.cursor() as cur:
+        while True:
+            cur.execute(PURGE_IDEMPOTENCY_KEYS_SQL, (max_age_hours, batch_size))
+            batch = cur.rowcount
+            conn.commit()
+            deleted += batch
+            if batch < batch_size:
+                return deleted
+
+
+def take_ledger_snapshot(pool=None, keep: int = None) -> int:
+    """Снимок балансов журнала: ledger_balance и сверка досчитывают только записи после него"""
+    pool = pool or get_pool()
+    keep = keep or int(os.environ.get('LEDGER_SNAPSHOT_KEEP', '3'))
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT ledger_take_snapshot(%s)', (keep,))
+        snapshot_id = cur.fetchone()[0]
+        conn.commit()
+    return snapshot_id
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('run', 'ensure', 'purge_keys', 'ledger_snapshot'):
+        sys.exit('usage: python archive.py run [max_partitions] | ensure [months_ahead] | purge_keys [max_age_hours] | ledger_snapshot')
+    if sys.argv[1] == 'purge_keys':
+        print({'idempotency_keys_deleted': purge_idempotency_keys(max_age_hours=float(sys.argv[2]) if len(sys.argv) > 2 else None)})
+        sys.exit()
+    if sys.argv[1] == 'ledger_snapshot':
+        print({'ledger_snapshot_id': take_ledger_snapshot()})
+        sys.exit()
+    archiver = Archiver()
+    if sys.argv[1] == 'ensure':
+        print({'partitions_created': archiver.ensure_partitions(int(sys.argv[2]) if len(sys.argv) > 2 else 3)})
+    else:
+        print(archiver.run(int(sys.argv[2]) if len(sys.argv) > 2 else None))
@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+
+_connection_factory = None
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Пул соединений PostgreSQL, переживающий тёплые вызовы функции"""
+
+    def __init__(self, dsn: str, max_size: int = 4, timeout: float = 5.0,
+                 check_after: float = 30.0, max_lifetime: float = 1800.0):
+        self.dsn = dsn
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created_at = {}
+        self._size = 0
+        self._active = 0
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+        self._health_checks = 0
+        self._reconnects = 0
+
+    def _open(self):
+        conn = psycopg2.connect(
+            self.dsn,
+            connection_factory=_connection_factory,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3
+        )
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._opened += 1
+        return conn
+
+    def _close(self, conn):
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _is_healthy(self, conn, released_at: float) -> bool:
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - self._created_at.get(id(conn), now) > self.max_lifetime:
+            return False
+        if now - released_at < self.check_after:
+            return True
+        with self._cond:
+            self._health_checks += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn = None
+        released_at = 0.0
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f'No free connection in pool after {self.timeout}s (max_size={self.max_size})')
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._open()
+            elif not self._is_healthy(conn, released_at):
+                self._close(conn)
+                conn = self._open()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._active += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                close = True
+        if close or conn.closed:
+            self._close(conn)
+        with self._cond:
+            self._active -= 1
+            if close or conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'active': self._active,
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'wait_avg_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+                'timeouts': self._timeouts,
+                'opened': self._opened,
+                'discarded': self._discarded,
+                'health_checks': self._health_checks,
+                'reconnects': self._reconnects
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def instrument(connection_factory):
+    """Новые соединения всех пулов открываются через connection_factory (например, с замерами запросов)"""
+    global _connection_factory
+    _connection_factory = connection_factory
+
+
+def get_pool(dsn: str = None) -> ConnectionPool:
+    dsn = dsn or os.environ['DATABASE_URL']
+    pool = _pools.get(dsn)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+                pool = ConnectionPool(
+                    dsn,
+                    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '4')),
+                    timeout=float(os.environ.get('DB_POOL_TIMEOUT', '5')),
+                    check_after=float(os.environ.get('DB_POOL_CHECK_AFTER', '30')),
+                    max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))
+                )
+                _pools[dsn] = pool
+    return pool
+
+
+def connection():
+    return get_pool().connection()
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,50 @@
+import json
+import os
+from archive import Archiver, purge_idempotency_keys, take_ledger_snapshot
+import responses
+
+def handler(event: dict, context) -> dict:
+    """Плановое обслуживание: будущие партиции games, выгрузка старых месяцев, чистка ключей идемпотентности и снимок журнала"""
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return responses.preflight('POST, OPTIONS', 'Content-Type, X-Archive-Token')
+    
+    if method != 'POST':
+        return responses.error(405, 'Method not allowed')
+    
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    token = os.environ.get('ARCHIVE_TOKEN')
+    
+    if not token or headers.get('x-archive-token') != token:
+        return responses.error(403, 'Forbidden')
+    
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return responses.error(400, 'Invalid JSON body')
+    
+    if not isinstance(body, dict):
+        return responses.error(400, 'Invalid JSON body')
+    
+    archiver = Archiver()
+    
+    try:
+        if body.get('action') == 'ensure_partitions':
+            result = {'partitions_created': archiver.ensure_partitions(int(body.get('months_ahead', 3)))}
+        elif body.get('action') == 'purge_idempotency_keys':
+            result = {'idempotency_keys_deleted': purge_idempotency_keys(archiver.pool)}
+        elif body.get('action') == 'ledger_snapshot':
+            result = {'ledger_snapshot_id': take_ledger_snapshot(archiver.pool)}
+        else:
+            result = archiver.run(
+                max_partitions=int(body.get('max_partitions', 1)),
+                time_budget=float(body.get('time_budget', os.environ.get('ARCHIVE_TIME_BUDGET', '20')))
+            )
+            result['idempotency_keys_deleted'] = purge_idempotency_keys(archiver.pool)
+            result['ledger_snapshot_id'] = take_ledger_snapshot(archiver.pool)
+        
+        return responses.response(200, result, event=event)
+    
+    except Exception as e:
+        return responses.error(500, str(e))
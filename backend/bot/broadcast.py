@@ -0,0 +1,194 @@
+"""Рассылка сообщений всем игрокам с ограничением скорости и продолжением после перезапуска"""
+import os
+import sys
+import threading
+import time
+
+from db import get_pool
+from telegram import get_client
+
+LEASE_SECONDS = 60
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class PerChatLimiter:
+    """Не чаще одного сообщения в interval секунд в один чат"""
+
+    def __init__(self, interval: float, max_tracked: int = 10000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        with self._lock:
+            now = time.monotonic()
+            if len(self._next_allowed) > self.max_tracked:
+                self._next_allowed = {chat: at for chat, at in self._next_allowed.items() if at > now}
+            allowed_at = max(now, self._next_allowed.get(chat_id, now))
+            self._next_allowed[chat_id] = allowed_at + self.interval
+        if allowed_at > now:
+            time.sleep(allowed_at - now)
+
+
+class BroadcastEngine:
+    def __init__(self, client=None, pool=None, rate: float = None, per_chat_interval: float = 1.0,
+                 chunk_size: int = 200):
+        self.client = client or get_client()
+        self.pool = pool or get_pool()
+        self.bucket = TokenBucket(rate or float(os.environ.get('BROADCAST_RATE', '25')))
+        self.per_chat = PerChatLimiter(per_chat_interval)
+        self.chunk_size = chunk_size
+
+    def create(self, text: str, created_by: int = None) -> int:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('INSERT INTO broadcasts (text, created_by) VALUES (%s, %s) RETURNING id', (text, created_by))
+            broadcast_id = cur.fetchone()[0]
+            conn.commit()
+        return broadcast_id
+
+    def status(self, broadcast_id: int = None) -> dict:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            if broadcast_id is None:
+                cur.execute('SELECT id FROM broadcasts ORDER BY id DESC LIMIT 1')
+                row = cur.fetchone()
+                if not row:
+                    return None
+                broadcast_id = row[0]
+            cur.execute(
+                'SELECT id, status, sent, failed, send_seconds, last_player_id FROM broadcasts WHERE id = %s',
+                (broadcast_id,)
+            )
+            row = cur.fetchone()
+        if not row:
+            return None
+        sent, failed, seconds = row[2], row[3], row[4]
+        return {
+            'id': row[0],
+            'status': row[1],
+            'sent': sent,
+            'failed': failed,
+            'last_player_id': row[5],
+            'messages_per_sec': round((sent + failed) / seconds, 1) if seconds else 0.0
+        }
+
+    def _claim(self, broadcast_id: int):
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('''
+                UPDATE broadcasts
+                SET locked_until = LOCALTIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = 'running' AND (locked_until IS NULL OR locked_until < LOCALTIMESTAMP)
+                RETURNING text, last_player_id
+            ''', (LEASE_SECONDS, broadcast_id))
+            row = cur.fetchone()
+            conn.commit()
+        return row
+
+    def _send_chunk(self, text: str, recipients: list) -> tuple:
+        futures = []
+        for _, telegram_id in recipients:
+            self.bucket.acquire()
+            self.per_chat.acquire(telegram_id)
+            futures.append(self.client.submit('sendMessage', {
+                'chat_id': telegram_id,
+                'text': text,
+                'parse_mode': 'HTML'
+            }))
+        sent = failed = 0
+        for future in futures:
+            try:
+                future.result()
+                sent += 1
+            except Exception:
+                failed += 1
+        return sent, failed
+
+    def run(self, broadcast_id: int, time_budget: float = None) -> dict:
+        """Отправляет рассылку с места остановки; при time_budget останавливается между порциями"""
+        claimed = self._claim(broadcast_id)
+        if not claimed:
+            return self.status(broadcast_id)
+        text, last_player_id = claimed
+        deadline = time.monotonic() + time_budget if time_budget else None
+
+        reader = self.pool.getconn()
+        writer = self.pool.getconn()
+        finished = False
+        try:
+            with reader.cursor(name=f'broadcast_{broadcast_id}') as stream:
+                stream.itersize = self.chunk_size
+                stream.execute('SELECT id, telegram_id FROM players WHERE id > %s ORDER BY id', (last_player_id,))
+                while True:
+                    recipients = stream.fetchmany(self.chunk_size)
+                    if not recipients:
+                        finished = True
+                        break
+
+                    started = time.monotonic()
+                    sent, failed = self._send_chunk(text, recipients)
+                    with writer.cursor() as cur:
+                        cur.execute('''
+                            UPDATE broadcasts
+                            SET last_player_id = %s, sent = sent + %s, failed = failed + %s,
+                                send_seconds = send_seconds + %s,
+                                locked_until = LOCALTIMESTAMP + make_interval(secs => %s),
+                                updated_at = CURRENT_TIMESTAMP
+                            WHERE id = %s
+                        ''', (recipients[-1][0], sent, failed, time.monotonic() - started, LEASE_SECONDS, broadcast_id))
+                    writer.commit()
+
+                    if deadline and time.monotonic() >= deadline:
+                        break
+
+            with writer.cursor() as cur:
+                if finished:
+                    cur.execute('''
+                        UPDATE broadcasts
+                        SET status = 'completed', locked_until = NULL, finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s
+                    ''', (broadcast_id,))
+                else:
+                    cur.execute('UPDATE broadcasts SET locked_until = NULL WHERE id = %s', (broadcast_id,))
+            writer.commit()
+        finally:
+            self.pool.putconn(reader)
+            self.pool.putconn(writer)
+
+        return self.status(broadcast_id)
+
+    def resume_all(self, time_budget: float = None) -> list:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")
+            ids = [row[0] for row in cur.fetchall()]
+        return [self.run(broadcast_id, time_budget) for broadcast_id in ids]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'resume':
+        sys.exit('usage: python broadcast.py resume [broadcast_id]')
+    engine = BroadcastEngine()
+    if len(sys.argv) > 2:
+        print(engine.run(int(sys.argv[2])))
+    else:
+        for progress in engine.resume_all():
+            print(progress)
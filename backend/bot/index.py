@@ -1,34 +1,32 @@
+import html
 import json
 import os
-import psycopg2
+import urllib.request
 from datetime import datetime
+from db import connection, get_pool, instrument
+from telegram import get_client, observe
+from stats import read_stats, reconcile
+from rollups import recent_totals
+from leaderboard import BOARDS, get_page, PAGE_SIZE
+from transactions import callback_data, fetch_page, parse_callback_data, parse_filters
+from broadcast import BroadcastEngine
+import export
+import perf
+import responses
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+instrument(perf.InstrumentedConnection)
+observe(perf.recorder.telegram_call)
 
+@perf.instrumented('bot', perf.update_action)
 def handler(event: dict, context) -> dict:
     """Telegram бот для CoinFlip с админ-панелью"""
     method = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return responses.preflight('POST, OPTIONS')
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return responses.error(405, 'Method not allowed')
     
     try:
         update = json.loads(event.get('body', '{}'))
@@ -58,6 +56,27 @@ def handler(event: dict, context) -> dict:
             elif text == '/stats' and user_id == admin_id:
                 show_stats(chat_id)
             
+            elif text == '/reconcile' and user_id == admin_id:
+                run_reconcile(chat_id)
+            
+            elif text.startswith('/tx') and user_id == admin_id:
+                show_transactions(chat_id, parse_filters(text.split()[1:]))
+            
+            elif text.startswith('/broadcast') and user_id == admin_id:
+                command, _, broadcast_text = text.partition(' ')
+                run_broadcast(chat_id, command, broadcast_text.strip(), user_id)
+            
+            elif text == '/perf' and user_id == admin_id:
+                show_perf(chat_id)
+            
+            elif text.startswith('/export') and user_id == admin_id:
+                run_export(chat_id, text.split()[1:])
+            
+            elif text.startswith('/volume') and user_id == admin_id:
+                parts = text.split()
+                hours = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 24
+                show_volume(chat_id, hours)
+            
             else:
                 send_message(chat_id, 'Используйте /start чтобы начать игру')
         
@@ -71,77 +90,54 @@ def handler(event: dict, context) -> dict:
             
             if user_id != admin_id:
                 answer_callback(callback['id'], 'Доступ запрещён')
-                return {'statusCode': 200, 'body': 'ok', 'isBase64Encoded': False}
-            
-            if data == 'admin_stats':
-                show_stats(chat_id)
-            elif data == 'admin_players':
-                show_players(chat_id)
-            elif data == 'admin_transactions':
-                show_transactions(chat_id)
+                return responses.response(200, {'ok': True})
             
-            answer_callback(callback['id'], '')
+            answered = get_client().submit('answerCallbackQuery', {'callback_query_id': callback['id'], 'text': ''})
+            try:
+                if data == 'admin_stats':
+                    show_stats(chat_id)
+                elif data == 'admin_players':
+                    show_players(chat_id)
+                elif data.startswith('tx:'):
+                    direction, filters, key = parse_callback_data(data)
+                    show_transactions(chat_id, filters, key, direction, callback['message']['message_id'])
+                elif data.startswith('lb:'):
+                    _, board, page = data.split(':')
+                    if board in BOARDS:
+                        show_players(chat_id, board, int(page), callback['message']['message_id'])
+                elif data == 'admin_transactions':
+                    show_transactions(chat_id)
+            finally:
+                answered.result()
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'ok': True}),
-            'isBase64Encoded': False
-        }
+        return responses.response(200, {'ok': True})
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        perf.error(e)
+        return responses.error(500, str(e))
 
 def send_message(chat_id: int, text: str, reply_markup: dict = None):
-    import urllib.request
-    import urllib.parse
-    
-    token = os.environ['TELEGRAM_BOT_TOKEN']
-    url = f'https://api.telegram.org/bot{token}/sendMessage'
-    
-    data = {
+    return get_client().call('sendMessage', {
         'chat_id': chat_id,
         'text': text,
-        'parse_mode': 'HTML'
-    }
-    
-    if reply_markup:
-        data['reply_markup'] = json.dumps(reply_markup)
-    
-    req = urllib.request.Request(
-        url,
-        data=urllib.parse.urlencode(data).encode('utf-8'),
-        method='POST'
-    )
-    
-    with urllib.request.urlopen(req) as response:
-        return json.loads(response.read().decode('utf-8'))
+        'parse_mode': 'HTML',
+        'reply_markup': reply_markup
+    })
+
+def edit_message(chat_id: int, message_id: int, text: str, reply_markup: dict = None):
+    return get_client().call('editMessageText', {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'text': text,
+        'parse_mode': 'HTML',
+        'reply_markup': reply_markup
+    })
 
 def answer_callback(callback_id: str, text: str):
-    import urllib.request
-    import urllib.parse
-    
-    token = os.environ['TELEGRAM_BOT_TOKEN']
-    url = f'https://api.telegram.org/bot{token}/answerCallbackQuery'
-    
-    data = {
+    return get_client().call('answerCallbackQuery', {
         'callback_query_id': callback_id,
         'text': text
-    }
-    
-    req = urllib.request.Request(
-        url,
-        data=urllib.parse.urlencode(data).encode('utf-8'),
-        method='POST'
-    )
-    
-    with urllib.request.urlopen(req) as response:
-        return json.loads(response.read().decode('utf-8'))
+    })
 
 def show_admin_menu(chat_id: int):
     keyboard = {
@@ -154,80 +150,194 @@ def show_admin_menu(chat_id: int):
     send_message(chat_id, '<b>🔧 Админ-панель</b>\n\nВыберите действие:', keyboard)
 
 def show_stats(chat_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with connection() as conn, conn.cursor() as cur:
+        stats = read_stats(cur)
     
-    cur.execute('SELECT COUNT(*), SUM(balance), SUM(total_games), SUM(wins) FROM players')
-    stats = cur.fetchone()
+    text = f'''<b>📊 Статистика CoinFlip</b>
+
+👥 <b>Игроки:</b> {stats['players']}
+💰 <b>Общий баланс:</b> {float(stats['balance']):.2f} TON
+🎮 <b>Всего игр:</b> {stats['total_games']}
+🏆 <b>Побед:</b> {stats['wins']}
+
+📅 <b>Игр за 24ч:</b> {stats['games_24h']}
+
+💵 <b>Депозиты:</b> {float(stats['deposits']):.2f} TON
+💸 <b>Выводы:</b> {float(stats['withdrawals']):.2f} TON
+'''
     
-    cur.execute('SELECT COUNT(*) FROM games WHERE created_at > NOW() - INTERVAL \'24 hours\'')
-    games_today = cur.fetchone()[0]
+    send_message(chat_id, text)
+
+def show_volume(chat_id: int, hours: int):
+    with connection() as conn, conn.cursor() as cur:
+        volume = recent_totals(cur, hours)
+    
+    text = f'''<b>📈 Объём за {hours}ч</b>
+
+🎮 <b>Игр:</b> {volume['games']}
+🎲 <b>Ставки:</b> {float(volume['wagered']):.2f} TON
+🎉 <b>Выплаты:</b> {float(volume['payouts']):.2f} TON
+🏦 <b>Преимущество казино:</b> {volume['house_edge'] * 100:.2f}%
+
+💵 <b>Депозиты:</b> {float(volume['deposits']):.2f} TON
+💸 <b>Выводы:</b> {float(volume['withdrawals']):.2f} TON
+'''
     
-    cur.execute('SELECT SUM(amount) FROM transactions WHERE type = \'deposit\' AND status = \'completed\'')
-    total_deposits = cur.fetchone()[0] or 0
+    send_message(chat_id, text)
+
+def run_broadcast(chat_id: int, command: str, text: str, user_id: int):
+    engine = BroadcastEngine()
+    time_budget = float(os.environ.get('BROADCAST_TIME_BUDGET', '20'))
     
-    cur.execute('SELECT SUM(amount) FROM transactions WHERE type = \'withdrawal\' AND status = \'completed\'')
-    total_withdrawals = cur.fetchone()[0] or 0
+    if command == '/broadcast':
+        if not text:
+            send_message(chat_id, 'Использование: /broadcast текст сообщения')
+            return
+        progress = engine.run(engine.create(text, user_id), time_budget)
+    elif command == '/broadcast_resume':
+        runs = engine.resume_all(time_budget)
+        progress = runs[-1] if runs else engine.status()
+    else:
+        progress = engine.status()
     
-    cur.close()
-    conn.close()
+    if not progress:
+        send_message(chat_id, 'Рассылок пока не было')
+        return
     
-    text = f'''<b>📊 Статистика CoinFlip</b>
+    text = f'''<b>📣 Рассылка #{progress['id']}</b>
 
-👥 <b>Игроки:</b> {stats[0]}
-💰 <b>Общий баланс:</b> {float(stats[1] or 0):.2f} TON
-🎮 <b>Всего игр:</b> {stats[2] or 0}
-🏆 <b>Побед:</b> {stats[3] or 0}
+Статус: {progress['status']}
+✅ Отправлено: {progress['sent']}
+⚠️ Ошибок: {progress['failed']}
+⚡ Скорость: {progress['messages_per_sec']} сообщ/с
+'''
+    if progress['status'] == 'running':
+        text += '\nПродолжить: /broadcast_resume'
+    send_message(chat_id, text)
 
-📅 <b>Игр за 24ч:</b> {games_today}
+def run_reconcile(chat_id: int):
+    with connection() as conn:
+        drift = reconcile(conn)
+    
+    if not drift:
+        send_message(chat_id, '✅ Статистика сверена, расхождений нет')
+        return
+    
+    text = '<b>🔄 Статистика пересобрана</b>\n\nИсправлены расхождения:\n'
+    for name, delta in drift.items():
+        text += f'• {name}: {delta:+}\n'
+    send_message(chat_id, text)
 
-💵 <b>Депозиты:</b> {float(total_deposits):.2f} TON
-💸 <b>Выводы:</b> {float(total_withdrawals):.2f} TON
-'''
+def run_export(chat_id: int, args: list):
+    parsed = export.parse_args(args)
+    if not parsed:
+        send_message(chat_id, f'Использование: /export {"|".join(export.TABLES)} [csv|jsonl] [после_id]')
+        return
     
+    table, fmt, after_id = parsed
+    client = get_client()
+    result = export.run(
+        get_pool(),
+        table,
+        fmt,
+        lambda path, filename, caption: client.send_document(chat_id, path, filename, caption),
+        after_id=after_id,
+        time_budget=float(os.environ.get('EXPORT_TIME_BUDGET', '20'))
+    )
+    
+    text = f'''<b>📦 Выгрузка {table}</b>
+
+📄 Строк: {result['rows']}
+🗂 Частей: {result['parts']} ({result['bytes'] / 1024 / 1024:.1f} МБ)
+⚡ Скорость: {result['rows_per_sec']:.0f} строк/с
+'''
+    if result['next_after_id'] is not None:
+        text += f"\nПродолжить: /export {table} {fmt} {result['next_after_id']}"
     send_message(chat_id, text)
 
-def show_players(chat_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
+def show_perf(chat_id: int):
+    summaries = [perf.recorder.summary()]
+    game_url = os.environ.get('GAME_FUNCTION_URL')
+    if game_url:
+        try:
+            request = urllib.request.Request(game_url, headers={'X-Metrics-Token': os.environ.get('METRICS_TOKEN', '')})
+            with urllib.request.urlopen(request, timeout=3) as response:
+                summaries.append(json.loads(response.read().decode('utf-8'))['perf'])
+        except Exception as e:
+            summaries.append({'actions': [], 'statements': [], 'error': str(e)})
+    
+    actions = sorted((a for summary in summaries for a in summary['actions']), key=lambda a: a['p95_ms'], reverse=True)
+    statements = sorted((s for summary in summaries for s in summary['statements']), key=lambda s: s['total_ms'], reverse=True)
     
-    cur.execute('SELECT username, balance, total_games, wins FROM players ORDER BY balance DESC LIMIT 10')
-    players = cur.fetchall()
+    text = '<b>⏱ Самые медленные действия</b> (p95, с запуска экземпляра)\n\n'
+    for action in actions[:10]:
+        text += f"• {action['function']} {html.escape(action['action'])}: p95 {action['p95_ms']:.1f} мс, "
+        text += f"ср {action['avg_ms']:.1f} мс, {action['count']} выз., БД {action['round_trips']} обр. / {action['db_ms']:.1f} мс"
+        if action['telegram_ms']:
+            text += f", Telegram {action['telegram_ms']:.1f} мс"
+        if action['errors']:
+            text += f", ошибок {action['errors']}"
+        text += '\n'
+    if not actions:
+        text += 'Замеров пока нет\n'
     
-    cur.close()
-    conn.close()
+    if statements:
+        text += '\n<b>🐢 Запросы с наибольшим суммарным временем</b>\n\n'
+        for statement in statements[:5]:
+            text += f"<code>{html.escape(statement['statement'])}</code>\n"
+            text += f"   {statement['count']} выз., ср {statement['avg_ms']:.1f} мс, макс {statement['max_ms']:.1f} мс\n"
+    
+    for summary in summaries[1:]:
+        if summary.get('error'):
+            text += f"\n⚠️ game недоступна: {html.escape(summary['error'])}"
+    
+    send_message(chat_id, text)
+
+def show_players(chat_id: int, board: str = 'balance', page: int = 0, message_id: int = None):
+    players, has_next = get_page(board, page)
     
-    text = '<b>👥 Топ-10 игроков</b>\n\n'
+    text = f'<b>👥 Рейтинг игроков {BOARDS[board]["title"]}</b>\n\n'
     
-    for i, player in enumerate(players, 1):
+    for i, player in enumerate(players, page * PAGE_SIZE + 1):
         username = player[0] or 'Аноним'
         balance = float(player[1])
         total_games = player[2]
         wins = player[3]
+        total_winnings = float(player[4])
         win_rate = (wins / total_games * 100) if total_games > 0 else 0
         
         text += f'{i}. @{username}\n'
-        text += f'   💰 {balance:.2f} TON | 🎮 {total_games} игр | 📈 {win_rate:.1f}% побед\n\n'
+        text += f'   💰 {balance:.2f} TON | 🏆 {total_winnings:.2f} TON | 🎮 {total_games} игр | 📈 {win_rate:.1f}% побед\n\n'
     
-    send_message(chat_id, text)
-
-def show_transactions(chat_id: int):
-    conn = get_db_connection()
-    cur = conn.cursor()
+    if not players:
+        text += 'Пока никого нет'
     
-    cur.execute('''
-        SELECT t.type, t.amount, t.status, t.created_at, p.username 
-        FROM transactions t 
-        JOIN players p ON t.player_id = p.id 
-        ORDER BY t.created_at DESC 
-        LIMIT 15
-    ''')
-    transactions = cur.fetchall()
+    boards_row = [
+        {'text': ('• ' if name == board else '') + label, 'callback_data': f'lb:{name}:0'}
+        for name, label in (('balance', '💰 Баланс'), ('winnings', '🏆 Выигрыши'), ('winrate', '📈 Победы'))
+    ]
+    paging_row = []
+    if page > 0:
+        paging_row.append({'text': '⬅️ Назад', 'callback_data': f'lb:{board}:{page - 1}'})
+    if has_next:
+        paging_row.append({'text': 'Вперёд ➡️', 'callback_data': f'lb:{board}:{page + 1}'})
+    keyboard = {'inline_keyboard': [boards_row, paging_row] if paging_row else [boards_row]}
     
-    cur.close()
-    conn.close()
+    if message_id:
+        edit_message(chat_id, message_id, text, keyboard)
+    else:
+        send_message(chat_id, text, keyboard)
+
+def show_transactions(chat_id: int, filters: dict = None, key: tuple = None, direction: str = 'n', message_id: int = None):
+    filters = filters or {}
+    with connection() as conn, conn.cursor() as cur:
+        page = fetch_page(cur, filters, key, direction)
     
-    text = '<b>💰 Последние транзакции</b>\n\n'
+    title = 'Последние транзакции' if not key else 'Транзакции'
+    text = f'<b>💰 {title}</b>\n'
+    if filters:
+        text += 'Фильтр: ' + ', '.join(str(value) for value in filters.values()) + '\n'
+    text += '\n'
     
     type_emoji = {
         'deposit': '⬇️',
@@ -236,15 +346,37 @@ def show_transactions(chat_id: int):
         'loss': '❌'
     }
     
-    for txn in transactions:
-        txn_type = txn[0]
-        amount = float(txn[1])
-        status = txn[2]
-        created = txn[3].strftime('%d.%m %H:%M')
-        username = txn[4] or 'Аноним'
+    for txn in page['rows']:
+        txn_type = txn[1]
+        amount = float(txn[2])
+        status = txn[3]
+        created = txn[4].strftime('%d.%m %H:%M')
+        username = txn[5] or 'Аноним'
         
         emoji = type_emoji.get(txn_type, '•')
         text += f'{emoji} {txn_type.upper()} | {amount:.2f} TON\n'
         text += f'   @{username} | {status} | {created}\n\n'
     
-    send_message(chat_id, text)
+    if not page['rows']:
+        text += 'Транзакций нет'
+    
+    filter_row = [
+        {'text': label, 'callback_data': callback_data('n', preset)}
+        for label, preset in (
+            ('Все', {}),
+            ('⬇️ Депозиты', {'type': 'deposit'}),
+            ('⬆️ Выводы', {'type': 'withdrawal'}),
+            ('⏳ Ожидают', {'status': 'pending'})
+        )
+    ]
+    paging_row = []
+    if page['has_newer']:
+        paging_row.append({'text': '⬅️ Новее', 'callback_data': callback_data('p', filters, page['first_key'])})
+    if page['has_older']:
+        paging_row.append({'text': 'Старше ➡️', 'callback_data': callback_data('n', filters, page['last_key'])})
+    keyboard = {'inline_keyboard': [paging_row, filter_row] if paging_row else [filter_row]}
+    
+    if message_id:
+        edit_message(chat_id, message_id, text, keyboard)
+    else:
+        send_message(chat_id, text, keyboard)
@@ -0,0 +1,84 @@
+"""Рейтинги игроков по индексам players с кэшем страниц на время жизни экземпляра функции"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import connection
+
+PAGE_SIZE = 10
+MAX_PAGES = 10
+MIN_GAMES_FOR_WIN_RATE = 20
+
+BOARDS = {
+    'balance': {
+        'title': 'по балансу',
+        'where': '',
+        'order': 'balance DESC, id'
+    },
+    'winnings': {
+        'title': 'по выигрышам',
+        'where': '',
+        'order': 'total_winnings DESC, id'
+    },
+    'winrate': {
+        'title': f'по проценту побед (от {MIN_GAMES_FOR_WIN_RATE} игр)',
+        'where': f'WHERE total_games >= {MIN_GAMES_FOR_WIN_RATE}',
+        'order': 'wins::DECIMAL / total_games DESC, id'
+    }
+}
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = TTLCache(float(os.environ.get('LEADERBOARD_TTL', '30')))
+
+
+def get_page(board: str, page: int) -> tuple:
+    """Возвращает (строки страницы, есть ли следующая страница); повторные запросы в пределах TTL не ходят в БД"""
+    page = max(0, min(page, MAX_PAGES - 1))
+    cached = _cache.get((board, page))
+    if cached is not None:
+        return cached
+
+    spec = BOARDS[board]
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f'SELECT username, balance, total_games, wins, total_winnings FROM players {spec["where"]} '
+            f'ORDER BY {spec["order"]} LIMIT %s OFFSET %s',
+            (PAGE_SIZE + 1, page * PAGE_SIZE)
+        )
+        rows = cur.fetchall()
+
+    result = (rows[:PAGE_SIZE], len(rows) > PAGE_SIZE and page + 1 < MAX_PAGES)
+    _cache.put((board, page), result)
+    return result
@@ -0,0 +1,132 @@
+"""Двойная запись: снимки балансов и потоковая сверка журнала ledger_entries с players"""
+import heapq
+import itertools
+import sys
+import time
+from decimal import Decimal
+
+from db import get_pool
+
+SYSTEM_ACCOUNTS = {
+    -1: 'house',
+    -2: 'external',
+    -3: 'equity',
+    -4: 'pending_withdrawals'
+}
+
+
+def take_snapshot(conn, keep: int = 3) -> int:
+    """Внеплановый снимок; по расписанию его делает каждый запуск функции archive"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT ledger_take_snapshot(%s)', (keep,))
+        snapshot_id = cur.fetchone()[0]
+    conn.commit()
+    return snapshot_id
+
+
+def _stream(conn, name: str, sql: str, params: tuple, chunk_size: int):
+    with conn.cursor(name=name) as cur:
+        cur.itersize = chunk_size
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+
+
+def verify(chunk_size: int = 50000, max_reported: int = 20) -> dict:
+    """Пересчитывает баланс каждого счёта по всему журналу и сравнивает с players и со снимком
+
+    Журнал, players и баланс по снимку читаются тремя серверными курсорами, упорядоченными
+    по счёту, и сливаются; в памяти держится один счёт. Всё читается в одном снимке REPEATABLE READ.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    started = time.monotonic()
+    entries = 0
+    accounts = 0
+    mismatches = []
+    mismatch_count = 0
+    system = {}
+    try:
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cur:
+            cur.execute(
+                'SELECT COUNT(*) FROM (SELECT txn_id FROM ledger_entries GROUP BY txn_id HAVING SUM(amount) <> 0) AS t'
+            )
+            unbalanced = cur.fetchone()[0]
+            cur.execute('SELECT id, last_entry_id FROM ledger_snapshots ORDER BY id DESC LIMIT 1')
+            snapshot_id, last_entry_id = cur.fetchone() or (None, 0)
+
+        def ledger_totals():
+            nonlocal entries
+            rows = _stream(conn, 'ledger_verify_entries',
+                           'SELECT account_id, amount FROM ledger_entries ORDER BY account_id, id', (), chunk_size)
+            for account_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+                total = Decimal(0)
+                for _, amount in group:
+                    total += amount
+                    entries += 1
+                yield account_id, 'ledger', total
+
+        players = ((player_id, 'player', balance) for player_id, balance in _stream(
+            conn, 'ledger_verify_players', 'SELECT id, balance FROM players ORDER BY id', (), chunk_size))
+        derived = ((account_id, 'derived', balance) for account_id, balance in _stream(
+            conn, 'ledger_verify_derived',
+            'SELECT account_id, SUM(balance) FROM ('
+            '    SELECT account_id, balance FROM ledger_snapshot_balances WHERE snapshot_id = %s'
+            '    UNION ALL'
+            '    SELECT account_id, amount FROM ledger_entries WHERE id > %s'
+            ') AS s GROUP BY account_id ORDER BY account_id',
+            (snapshot_id, last_entry_id), chunk_size))
+
+        merged = heapq.merge(ledger_totals(), players, derived, key=lambda item: item[0])
+        for account_id, items in itertools.groupby(merged, key=lambda item: item[0]):
+            values = {source: value for _, source, value in items}
+            ledger = values.get('ledger', Decimal(0))
+            accounts += 1
+            if account_id in SYSTEM_ACCOUNTS:
+                system[SYSTEM_ACCOUNTS[account_id]] = float(ledger)
+            problems = []
+            if values.get('derived', Decimal(0)) != ledger:
+                problems.append('snapshot')
+            if account_id >= 0 and (values.get('player') or Decimal(0)) != ledger:
+                problems.append('players.balance')
+            if problems:
+                mismatch_count += 1
+                if len(mismatches) < max_reported:
+                    mismatches.append({
+                        'account_id': account_id,
+                        'ledger': float(ledger),
+                        'players_balance': float(values['player']) if values.get('player') is not None else None,
+                        'derived': float(values.get('derived', Decimal(0))),
+                        'problems': problems
+                    })
+        conn.rollback()
+    finally:
+        pool.putconn(conn, close=True)
+
+    elapsed = time.monotonic() - started
+    return {
+        'entries': entries,
+        'accounts': accounts,
+        'unbalanced_transactions': unbalanced,
+        'mismatches': mismatch_count,
+        'examples': mismatches,
+        'system_accounts': system,
+        'snapshot_id': snapshot_id,
+        'seconds': round(elapsed, 2),
+        'entries_per_sec': round(entries / elapsed, 1) if elapsed else 0.0
+    }
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'verify':
+        print(verify(int(sys.argv[2]) if len(sys.argv) > 2 else 50000))
+    elif command == 'snapshot':
+        with get_pool().connection() as conn:
+            print({'snapshot_id': take_snapshot(conn)})
+    else:
+        sys.exit('usage: python ledger.py verify [chunk_size] | snapshot')
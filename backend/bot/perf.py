@@ -0,0 +1,333 @@
+"""Замеры горячего пути: каждый запрос к БД и вызов Telegram внутри вызова функции, итоги по действиям"""
+import contextvars
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+import psycopg2.extensions
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_STATEMENTS = 500
+MAX_ACTIONS = 200
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SPACES = re.compile(r'\s+')
+
+_current = contextvars.ContextVar('perf_request', default=None)
+_thread = threading.local()
+
+
+class Histogram:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Stat:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.rows = 0
+        self.round_trips = 0
+        self.db_seconds = 0.0
+        self.telegram_calls = 0
+        self.telegram_seconds = 0.0
+
+
+class Request:
+    def __init__(self, function: str, action: str):
+        self.function = function
+        self.action = action
+        self.started = time.perf_counter()
+        self.round_trips = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.telegram_calls = 0
+        self.telegram_seconds = 0.0
+        self.statements = []
+        self.error = None
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.actions = {}
+        self.statements = {}
+        self.telegram = {}
+        self._labels = {}
+
+    def label(self, query) -> str:
+        """Запрос без литералов и лишних пробелов, обрезанный до 120 символов"""
+        label = self._labels.get(query)
+        if label is None:
+            text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+            label = SPACES.sub(' ', LITERALS.sub('?', text)).strip()[:120]
+            if isinstance(query, str) and len(self._labels) < MAX_STATEMENTS:
+                self._labels[query] = label
+        return label
+
+    def statement(self, query, seconds: float, rows: int, failed: bool):
+        label = self.label(query)
+        request = _current.get()
+        with self._lock:
+            stat = self.statements.get(label)
+            if stat is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    label = 'other'
+                stat = self.statements.setdefault(label, Stat())
+            stat.latency.observe(seconds)
+            stat.rows += max(rows, 0)
+            stat.errors += failed
+            if request is not None:
+                request.round_trips += 1
+                request.rows += max(rows, 0)
+                request.db_seconds += seconds
+                request.statements.append((seconds, label))
+        _thread.round_trips = getattr(_thread, 'round_trips', 0) + 1
+
+    def round_trip(self):
+        """commit или rollback: обращение к серверу без текста запроса"""
+        request = _current.get()
+        if request is not None:
+            with self._lock:
+                request.round_trips += 1
+        _thread.round_trips = getattr(_thread, 'round_trips', 0) + 1
+
+    def telegram_call(self, method: str, seconds: float, ok: bool):
+        request = _current.get()
+        with self._lock:
+            stat = self.telegram.setdefault(method, Stat())
+            stat.latency.observe(seconds)
+            stat.errors += not ok
+            if request is not None:
+                request.telegram_calls += 1
+                request.telegram_seconds += seconds
+
+    def finish(self, request: Request, status: int):
+        elapsed = time.perf_counter() - request.started
+        with self._lock:
+            key = (request.function, request.action[:64])
+            if key not in self.actions and len(self.actions) >= MAX_ACTIONS:
+                key = (request.function, 'other')
+            stat = self.actions.setdefault(key, Stat())
+            stat.latency.observe(elapsed)
+            stat.errors += status >= 500
+            stat.rows += request.rows
+            stat.round_trips += request.round_trips
+            stat.db_seconds += request.db_seconds
+            stat.telegram_calls += request.telegram_calls
+            stat.telegram_seconds += request.telegram_seconds
+        _log(request, status, elapsed)
+
+    def summary(self, limit: int = 10) -> dict:
+        """Самые медленные действия (по p95) и запросы (по суммарному времени)"""
+        with self._lock:
+            actions = [{
+                'function': function,
+                'action': action,
+                'count': stat.latency.count,
+                'errors': stat.errors,
+                'avg_ms': round(stat.latency.total / stat.latency.count * 1000, 3),
+                'p95_ms': round(stat.latency.quantile(0.95) * 1000, 3),
+                'max_ms': round(stat.latency.max * 1000, 3),
+                'round_trips': round(stat.round_trips / stat.latency.count, 2),
+                'db_ms': round(stat.db_seconds / stat.latency.count * 1000, 3),
+                'telegram_ms': round(stat.telegram_seconds / stat.latency.count * 1000, 3)
+            } for (function, action), stat in self.actions.items() if stat.latency.count]
+            statements = [{
+                'statement': label,
+                'count': stat.latency.count,
+                'total_ms': round(stat.latency.total * 1000, 3),
+                'avg_ms': round(stat.latency.total / stat.latency.count * 1000, 3),
+                'max_ms': round(stat.latency.max * 1000, 3),
+                'rows': stat.rows
+            } for label, stat in self.statements.items() if stat.latency.count]
+        actions.sort(key=lambda item: item['p95_ms'], reverse=True)
+        statements.sort(key=lambda item: item['total_ms'], reverse=True)
+        return {'actions': actions[:limit], 'statements': statements[:limit]}
+
+    def prometheus(self, gauges: dict = None) -> str:
+        """Текстовый формат Prometheus: гистограммы действий, сумма и число по запросам и методам Telegram"""
+        lines = []
+
+        def histogram(name: str, labels: str, latency: Histogram):
+            seen = 0
+            for bound, count in zip(BUCKETS, latency.buckets):
+                seen += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {seen}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {latency.count}')
+            lines.append(f'{name}_sum{{{labels}}} {latency.total:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {latency.count}')
+
+        with self._lock:
+            lines.append('# TYPE coinflip_action_duration_seconds histogram')
+            for (function, action), stat in self.actions.items():
+                histogram('coinflip_action_duration_seconds', f'function="{function}",action="{_escape(action)}"', stat.latency)
+            for name, attribute in (('errors', 'errors'), ('db_round_trips', 'round_trips'), ('telegram_calls', 'telegram_calls')):
+                lines.append(f'# TYPE coinflip_action_{name}_total counter')
+                for (function, action), stat in self.actions.items():
+                    lines.append(f'coinflip_action_{name}_total{{function="{function}",action="{_escape(action)}"}} {getattr(stat, attribute)}')
+            lines.append('# TYPE coinflip_statement_duration_seconds summary')
+            for label, stat in self.statements.items():
+                labels = f'statement="{_escape(label)}"'
+                lines.append(f'coinflip_statement_duration_seconds_sum{{{labels}}} {stat.latency.total:.6f}')
+                lines.append(f'coinflip_statement_duration_seconds_count{{{labels}}} {stat.latency.count}')
+            lines.append('# TYPE coinflip_telegram_duration_seconds histogram')
+            for method, stat in self.telegram.items():
+                histogram('coinflip_telegram_duration_seconds', f'method="{method}"', stat.latency)
+        for name, value in (gauges or {}).items():
+            lines.append(f'# TYPE coinflip_{name} gauge')
+            lines.append(f'coinflip_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def _log(request: Request, status: int, elapsed: float):
+    """Структурный лог: PERF_LOG=all — каждый вызов, slow (по умолчанию) — медленные и ошибки, off — ничего"""
+    mode = os.environ.get('PERF_LOG', 'slow')
+    slow = elapsed * 1000 >= float(os.environ.get('PERF_SLOW_MS', '1000'))
+    if mode == 'off' or (mode != 'all' and not slow and status < 500 and request.error is None):
+        return
+    record = {
+        'perf': 'request',
+        'function': request.function,
+        'action': request.action,
+        'status': status,
+        'ms': round(elapsed * 1000, 3),
+        'db_ms': round(request.db_seconds * 1000, 3),
+        'round_trips': request.round_trips,
+        'rows': request.rows,
+        'telegram_calls': request.telegram_calls,
+        'telegram_ms': round(request.telegram_seconds * 1000, 3),
+        'slowest': [{'ms': round(seconds * 1000, 3), 'statement': label}
+                    for seconds, label in sorted(request.statements, reverse=True)[:3]]
+    }
+    if request.error is not None:
+        record['error'] = request.error
+    print(json.dumps(record, ensure_ascii=False), file=sys.stdout, flush=True)
+
+
+recorder = Recorder()
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            recorder.statement(query, time.perf_counter() - started, self.rowcount, failed)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, vars_list)
+            failed = False
+            return result
+        finally:
+            recorder.statement(query, time.perf_counter() - started, self.rowcount, failed)
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Соединение, курсоры которого замеряют запросы; commit и rollback считаются обращениями"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', InstrumentedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            recorder.round_trip()
+        return super().commit()
+
+    def rollback(self):
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            recorder.round_trip()
+        return super().rollback()
+
+
+def instrumented(function: str, action_of):
+    """Декоратор handler: действие берётся из события через action_of, итог пишется по statusCode"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event: dict, context) -> dict:
+            try:
+                action = action_of(event)
+            except Exception:
+                action = 'unknown'
+            request = Request(function, action)
+            token = _current.set(request)
+            status = 500
+            try:
+                response = handler(event, context)
+                status = int(response.get('statusCode', 200))
+                return response
+            except Exception:
+                request.error = traceback.format_exc(limit=5)
+                raise
+            finally:
+                _current.reset(token)
+                recorder.finish(request, status)
+        return wrapper
+    return decorator
+
+
+def error(exc: BaseException):
+    """Запоминает исключение, которое handler превратил в ответ 500, для структурного лога"""
+    request = _current.get()
+    if request is not None:
+        request.error = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__, limit=5))
+
+
+def body_action(event: dict) -> str:
+    if event.get('httpMethod', 'GET') != 'POST':
+        return event.get('httpMethod', 'GET').lower()
+    return str(json.loads(event.get('body') or '{}').get('action'))
+
+
+def update_action(event: dict) -> str:
+    """Команда сообщения (/stats) или префикс callback_data (tx, lb, admin_stats)"""
+    update = json.loads(event.get('body') or '{}')
+    if 'callback_query' in update:
+        return 'callback:' + str(update['callback_query'].get('data', '')).split(':', 1)[0]
+    text = (update.get('message') or {}).get('text') or ''
+    return 'message:' + (text.split()[0] if text.startswith('/') else 'text')
+
+
+def thread_round_trips() -> int:
+    """Обращения к БД, сделанные текущим потоком с начала работы (для бенчмарков)"""
+    return getattr(_thread, 'round_trips', 0)
@@ -0,0 +1,149 @@
+"""Объём игр и платежей по минутным, часовым и суточным бакетам (таблица rollups)"""
+import sys
+import time
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+from db import get_pool
+
+FIELDS = ('games', 'wagered', 'payouts', 'deposits', 'withdrawals')
+
+UPSERT_SQL = '''
+    INSERT INTO rollups (grain, bucket, shard, games, wagered, payouts, deposits, withdrawals) VALUES %s
+    ON CONFLICT (grain, bucket, shard) DO UPDATE
+    SET games = rollups.games + EXCLUDED.games,
+        wagered = rollups.wagered + EXCLUDED.wagered,
+        payouts = rollups.payouts + EXCLUDED.payouts,
+        deposits = rollups.deposits + EXCLUDED.deposits,
+        withdrawals = rollups.withdrawals + EXCLUDED.withdrawals
+'''
+
+MINUTE_RETENTION = timedelta(days=7)
+HOUR_RETENTION = timedelta(days=90)
+
+
+def _with_edge(totals: dict) -> dict:
+    wagered = totals['wagered']
+    totals['house_edge'] = float((wagered - totals['payouts']) / wagered) if wagered else 0.0
+    return totals
+
+
+def window_totals(cur, start, end) -> dict:
+    cur.execute('SELECT * FROM rollup_window(%s, %s)', (start, end))
+    return _with_edge(dict(zip(FIELDS, cur.fetchone())))
+
+
+def recent_totals(cur, hours: int) -> dict:
+    cur.execute(
+        'SELECT * FROM rollup_window(LOCALTIMESTAMP - make_interval(hours => %s), LOCALTIMESTAMP)',
+        (hours,)
+    )
+    return _with_edge(dict(zip(FIELDS, cur.fetchone())))
+
+
+def _buckets(created_at, now):
+    yield 'd', created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if created_at >= now - HOUR_RETENTION:
+        yield 'h', created_at.replace(minute=0, second=0, microsecond=0)
+    if created_at >= now - MINUTE_RETENTION:
+        yield 'm', created_at.replace(second=0, microsecond=0)
+
+
+def _stream(reader, name: str, sql: str, chunk_size: int):
+    with reader.cursor(name=name) as cur:
+        cur.itersize = chunk_size
+        cur.execute(sql)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def _flush(writer, aggregates: dict):
+    if not aggregates:
+        return
+    with writer.cursor() as cur:
+        execute_values(
+            cur,
+            UPSERT_SQL,
+            [(grain, bucket, shard, *values) for (grain, bucket, shard), values in aggregates.items()],
+            page_size=1000
+        )
+    writer.commit()
+    aggregates.clear()
+
+
+def backfill(chunk_size: int = 50000) -> dict:
+    """Пересобирает rollups из истории порциями по chunk_size строк через серверные курсоры
+
+    Запись в games и transactions блокируется только на время очистки rollups и экспорта
+    снимка: всё, что попадает в снимок, досчитывает backfill, всё после него — триггеры.
+    """
+    pool = get_pool()
+    writer = pool.getconn()
+    reader = pool.getconn()
+    started = time.monotonic()
+    processed = 0
+    try:
+        reader.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with writer.cursor() as cur:
+            cur.execute('LOCK TABLE games, transactions IN SHARE MODE')
+            cur.execute('DELETE FROM rollups')
+            cur.execute('SELECT pg_export_snapshot(), LOCALTIMESTAMP')
+            snapshot, now = cur.fetchone()
+            with reader.cursor() as reader_cur:
+                reader_cur.execute('SET TRANSACTION SNAPSHOT %s', (snapshot,))
+        writer.commit()
+
+        sources = (
+            ('rollups_backfill_games',
+             'SELECT player_id % 16, created_at, bet_amount, win_amount FROM games',
+             lambda amount, payout: (1, amount, payout, 0, 0)),
+            ('rollups_backfill_transactions',
+             "SELECT player_id % 16, created_at, amount, type FROM transactions "
+             "WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')",
+             lambda amount, kind: (0, 0, 0, amount, 0) if kind == 'deposit' else (0, 0, 0, 0, amount))
+        )
+        aggregates = {}
+        for name, sql, to_values in sources:
+            for rows in _stream(reader, name, sql, chunk_size):
+                for shard, created_at, amount, extra in rows:
+                    values = to_values(amount, extra)
+                    for grain, bucket in _buckets(created_at, now):
+                        current = aggregates.get((grain, bucket, shard))
+                        aggregates[(grain, bucket, shard)] = values if current is None else tuple(
+                            a + b for a, b in zip(current, values)
+                        )
+                processed += len(rows)
+                _flush(writer, aggregates)
+    finally:
+        pool.putconn(writer)
+        pool.putconn(reader, close=True)
+
+    elapsed = time.monotonic() - started
+    return {
+        'rows': processed,
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(processed / elapsed, 1) if elapsed else 0.0
+    }
+
+
+def prune(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute('SELECT rollups_prune()')
+        removed = cur.fetchone()[0]
+    conn.commit()
+    return removed
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else ''
+    if command == 'backfill':
+        print(backfill(int(sys.argv[2]) if len(sys.argv) > 2 else 50000))
+    elif command == 'prune':
+        with get_pool().connection() as conn:
+            print({'removed': prune(conn)})
+    else:
+        sys.exit('usage: python rollups.py backfill [chunk_size] | prune')
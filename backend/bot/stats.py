@@ -0,0 +1,38 @@
+"""Сводная статистика для админ-панели из предрассчитанных таблиц stats_totals и rollups"""
+import sys
+
+from db import connection
+from rollups import recent_totals
+
+TOTALS_SQL = '''
+    SELECT SUM(players), SUM(balance), SUM(total_games), SUM(wins), SUM(deposits), SUM(withdrawals)
+    FROM stats_totals
+'''
+
+FIELDS = ('players', 'balance', 'total_games', 'wins', 'deposits', 'withdrawals', 'games_24h')
+
+
+def read_stats(cur) -> dict:
+    cur.execute(TOTALS_SQL)
+    totals = cur.fetchone()
+    games_24h = recent_totals(cur, 24)['games']
+    return dict(zip(FIELDS, [value or 0 for value in totals] + [games_24h]))
+
+
+def reconcile(conn) -> dict:
+    """Пересобирает агрегаты из сырых таблиц и возвращает расхождения до пересборки"""
+    with conn.cursor() as cur:
+        cur.execute('LOCK TABLE players, games, transactions IN SHARE MODE')
+        before = read_stats(cur)
+        cur.execute('SELECT stats_rebuild()')
+        after = read_stats(cur)
+    conn.commit()
+    return {name: after[name] - before[name] for name in FIELDS if after[name] != before[name]}
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['reconcile']:
+        sys.exit('usage: python stats.py reconcile')
+    with connection() as conn:
+        drift = reconcile(conn)
+    print(drift or 'no drift')
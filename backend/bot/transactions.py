@@ -0,0 +1,105 @@
+"""Постраничный просмотр транзакций по ключу (created_at, id) для админ-панели"""
+from datetime import datetime
+
+PAGE_SIZE = 15
+
+TYPES = {'d': 'deposit', 'w': 'withdrawal', 'v': 'win', 'l': 'loss'}
+STATUSES = {'p': 'pending', 'c': 'completed', 'f': 'failed'}
+
+KEY_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+def parse_filters(args: list) -> dict:
+    """Фильтры из аргументов команды /tx: тип, статус и/или id игрока"""
+    filters = {}
+    for arg in args:
+        if arg in TYPES.values():
+            filters['type'] = arg
+        elif arg in STATUSES.values():
+            filters['status'] = arg
+        elif arg.isdigit():
+            filters['player_id'] = int(arg)
+    return filters
+
+
+def encode_filters(filters: dict) -> str:
+    parts = []
+    if 'type' in filters:
+        parts.append('t' + next(code for code, name in TYPES.items() if name == filters['type']))
+    if 'status' in filters:
+        parts.append('s' + next(code for code, name in STATUSES.items() if name == filters['status']))
+    if 'player_id' in filters:
+        parts.append(f'u{filters["player_id"]}')
+    return ','.join(parts)
+
+
+def decode_filters(encoded: str) -> dict:
+    filters = {}
+    for part in encoded.split(',') if encoded else []:
+        if part[0] == 't' and part[1:] in TYPES:
+            filters['type'] = TYPES[part[1:]]
+        elif part[0] == 's' and part[1:] in STATUSES:
+            filters['status'] = STATUSES[part[1:]]
+        elif part[0] == 'u' and part[1:].isdigit():
+            filters['player_id'] = int(part[1:])
+    return filters
+
+
+def callback_data(direction: str, filters: dict, key: tuple = None) -> str:
+    """tx:<n|p>:<фильтры>:<created_at>:<id>, укладывается в 64 байта callback_data"""
+    created_at, row_id = key if key else (None, None)
+    return ':'.join([
+        'tx',
+        direction,
+        encode_filters(filters),
+        created_at.strftime(KEY_FORMAT) if created_at else '',
+        str(row_id) if row_id else ''
+    ])
+
+
+def parse_callback_data(data: str) -> tuple:
+    _, direction, encoded, created_at, row_id = data.split(':')
+    key = (datetime.strptime(created_at, KEY_FORMAT), int(row_id)) if created_at else None
+    return direction, decode_filters(encoded), key
+
+
+def fetch_page(cur, filters: dict, key: tuple = None, direction: str = 'n') -> dict:
+    """Страница новее (p) или старше (n) ключа; каждый запрос — диапазонный скан по индексу (…, created_at, id)"""
+    conditions = []
+    params = []
+    for column in ('type', 'status', 'player_id'):
+        if column in filters:
+            conditions.append(f't.{column} = %s')
+            params.append(filters[column])
+    if key:
+        conditions.append('(t.created_at, t.id) < (%s, %s)' if direction == 'n' else '(t.created_at, t.id) > (%s, %s)')
+        params.extend(key)
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    order = 'DESC' if direction == 'n' else 'ASC'
+
+    cur.execute(f'''
+        SELECT t.id, t.type, t.amount, t.status, t.created_at, p.username
+        FROM (
+            SELECT t.id, t.player_id, t.type, t.amount, t.status, t.created_at
+            FROM transactions t
+            {where}
+            ORDER BY t.created_at {order}, t.id {order}
+            LIMIT %s
+        ) t
+        LEFT JOIN players p ON p.id = t.player_id
+        ORDER BY t.created_at {order}, t.id {order}
+    ''', params + [PAGE_SIZE + 1])
+    rows = cur.fetchall()
+
+    has_more = len(rows) > PAGE_SIZE
+    rows = rows[:PAGE_SIZE]
+    if direction == 'p':
+        rows.reverse()
+
+    return {
+        'rows': rows,
+        'has_older': has_more if direction == 'n' else key is not None,
+        'has_newer': key is not None if direction == 'n' else has_more,
+        'first_key': (rows[0][4], rows[0][0]) if rows else None,
+        'last_key': (rows[-1][4], rows[-1][0]) if rows else None
+    }
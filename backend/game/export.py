@@ -0,0 +1,182 @@
+"""Выгрузка players, games и transactions для админов: серверный курсор, gzip CSV/JSONL частями под лимит Telegram"""
+import csv
+import gzip
+import io
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import responses
+
+TABLES = {
+    'players': ('id', 'telegram_id', 'username', 'balance', 'total_games', 'wins', 'total_winnings',
+                'created_at', 'updated_at'),
+    'games': ('id', 'player_id', 'bet_amount', 'selected_side', 'result_side', 'won', 'win_amount',
+              'created_at', 'server_seed_hash', 'nonce'),
+    'transactions': ('id', 'player_id', 'type', 'amount', 'memo', 'ton_address', 'status', 'created_at',
+                     'chain_tx_hash', 'settled_at')
+}
+# DECIMAL(18,8) отдаётся текстом из БД: точно, без экспоненты ('0E-8') и без разбора в Decimal
+AMOUNTS = ('balance', 'total_winnings', 'bet_amount', 'win_amount', 'amount')
+
+# Telegram принимает от бота документы до 50 МБ; запас покрывает то, что ещё не вытолкнул gzip
+PART_BYTES = 45 * 1024 * 1024
+GZIP_LEVEL = 3
+
+
+class _GzipSink:
+    """Одна часть выгрузки: самостоятельный .gz во временном файле, в памяти только буферы сжатия"""
+
+    def __init__(self, columns: tuple, directory: str):
+        fd, self.path = tempfile.mkstemp(suffix=f'.{self.extension}', dir=directory)
+        self._raw = os.fdopen(fd, 'wb')
+        self._file = io.TextIOWrapper(
+            gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=GZIP_LEVEL),
+            encoding='utf-8',
+            newline=''
+        )
+        self.columns = columns
+        self.rows = 0
+        self.first_id = None
+        self.last_id = None
+
+    def write(self, rows: list):
+        self._write(rows)
+        self.rows += len(rows)
+        if self.first_id is None:
+            self.first_id = rows[0][0]
+        self.last_id = rows[-1][0]
+
+    def bytes(self) -> int:
+        return self._raw.tell()
+
+    def close(self) -> int:
+        if not self._raw.closed:
+            self._file.close()
+            self._raw.close()
+        return os.path.getsize(self.path)
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CsvGzipSink(_GzipSink):
+    extension = 'csv.gz'
+
+    def __init__(self, columns: tuple, directory: str):
+        super().__init__(columns, directory)
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def _write(self, rows: list):
+        self._writer.writerows(rows)
+
+
+class JsonlGzipSink(_GzipSink):
+    extension = 'jsonl.gz'
+
+    def _write(self, rows: list):
+        columns = self.columns
+        self._file.write(''.join(responses.dumps(dict(zip(columns, row))) + '\n' for row in rows))
+
+
+SINKS = {'csv': CsvGzipSink, 'jsonl': JsonlGzipSink}
+
+
+def parse_args(args: list):
+    """/export <таблица> [csv|jsonl] [после_id] -> (table, fmt, after_id) или None"""
+    if not args or args[0] not in TABLES:
+        return None
+    fmt = 'csv'
+    after_id = 0
+    for arg in args[1:]:
+        if arg in SINKS:
+            fmt = arg
+        elif arg.isdigit():
+            after_id = int(arg)
+        else:
+            return None
+    return args[0], fmt, after_id
+
+
+def run(pool, table: str, fmt: str, deliver, after_id: int = 0, time_budget: float = None,
+        part_bytes: int = PART_BYTES, chunk_size: int = 20000, directory: str = None) -> dict:
+    """Строки с id > after_id по возрастанию id; готовая часть сразу уходит в deliver(path, filename, caption) и удаляется
+
+    Память не зависит от размера таблицы: серверный курсор отдаёт по chunk_size строк, сжатые части
+    лежат на диске по одной. По истечении time_budget выгрузка останавливается на границе порции,
+    next_after_id — откуда продолжить.
+    """
+    columns = TABLES[table]
+    sink_class = SINKS[fmt]
+    directory = directory or os.environ.get('EXPORT_DIR', tempfile.gettempdir())
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    started = time.monotonic()
+    deadline = started + time_budget if time_budget else None
+    rows = 0
+    parts = 0
+    size = 0
+    finished = False
+    sink = None
+    last_id = after_id
+
+    def flush(sink):
+        nonlocal parts, size
+        parts += 1
+        size += sink.close()
+        try:
+            deliver(
+                sink.path,
+                f'{table}-{stamp}-{parts:03d}.{sink.extension}',
+                f'{table}: id {sink.first_id}–{sink.last_id}, {sink.rows} строк'
+            )
+        finally:
+            os.remove(sink.path)
+
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SET TRANSACTION READ ONLY')
+        with conn.cursor(name=f'export_{table}') as cur:
+            cur.itersize = chunk_size
+            select = ', '.join(f'{column}::TEXT' if column in AMOUNTS else column for column in columns)
+            cur.execute(f'SELECT {select} FROM {table} WHERE id > %s ORDER BY id', (after_id,))
+            while True:
+                chunk = cur.fetchmany(chunk_size)
+                if not chunk:
+                    finished = True
+                    break
+                if sink is None:
+                    sink = sink_class(columns, directory)
+                sink.write(chunk)
+                rows += len(chunk)
+                last_id = chunk[-1][0]
+                if sink.bytes() >= part_bytes:
+                    flush(sink)
+                    sink = None
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        conn.rollback()
+        if sink is not None:
+            flush(sink)
+            sink = None
+    finally:
+        if sink is not None:
+            sink.discard()
+        pool.putconn(conn)
+
+    elapsed = time.monotonic() - started
+    return {
+        'table': table,
+        'format': fmt,
+        'rows': rows,
+        'parts': parts,
+        'bytes': size,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0.0,
+        'last_id': last_id,
+        'next_after_id': None if finished else last_id
+    }
@@ -0,0 +1,153 @@
+"""Доказуемо честные исходы: HMAC-SHA256(server_seed, "client_seed:nonce"), старший бит первого байта
+
+Та же формула вычисляется в SQL (pgcrypto hmac) внутри play, поэтому любой исход из games
+можно пересчитать после раскрытия server_seed.
+"""
+import hashlib
+import hmac
+import math
+import os
+import re
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CLIENT_SEED_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+VERIFY_MAX_NONCES = 1000
+PARALLEL_THRESHOLD = 200000
+
+
+def new_server_seed() -> str:
+    return secrets.token_hex(32)
+
+
+def new_client_seed() -> str:
+    return secrets.token_hex(8)
+
+
+def seed_hash(server_seed: str) -> str:
+    return hashlib.sha256(server_seed.encode('utf-8')).hexdigest()
+
+
+def outcome(server_seed: str, client_seed: str, nonce: int) -> str:
+    digest = hmac.digest(server_seed.encode('utf-8'), f'{client_seed}:{nonce}'.encode('utf-8'), 'sha256')
+    return 'heads' if digest[0] < 128 else 'tails'
+
+
+def _heads_bits(args: tuple) -> bytes:
+    server_seed, client_seed, start, count = args
+    key = server_seed.encode('utf-8')
+    prefix = f'{client_seed}:'.encode('utf-8')
+    digest = hmac.digest
+    return bytes(digest(key, prefix + str(nonce).encode(), 'sha256')[0] < 128 for nonce in range(start, start + count))
+
+
+def batch_heads(server_seed: str, client_seed: str, start: int, count: int, workers: int = None) -> bytes:
+    """Исходы для nonce start..start+count-1 как байты 1 (heads) / 0 (tails)
+
+    Большие пакеты режутся на части и считаются в нескольких процессах.
+    """
+    workers = workers or os.cpu_count() or 1
+    if count < PARALLEL_THRESHOLD or workers == 1:
+        return _heads_bits((server_seed, client_seed, start, count))
+    step = math.ceil(count / workers)
+    parts = [(server_seed, client_seed, offset, min(step, start + count - offset))
+             for offset in range(start, start + count, step)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return b''.join(pool.map(_heads_bits, parts))
+
+
+def verify(server_seed: str, client_seed: str, first_nonce: int, count: int) -> list:
+    bits = batch_heads(server_seed, client_seed, first_nonce, count, workers=1)
+    return [
+        {'nonce': first_nonce + offset, 'result_side': 'heads' if heads else 'tails'}
+        for offset, heads in enumerate(bits)
+    ]
+
+
+def fairness_stats(bits: bytes) -> dict:
+    """Доля орлов, хи-квадрат (1 степень свободы), самая длинная серия и z-оценка критерия серий"""
+    n = len(bits)
+    if n == 0:
+        return {'count': 0}
+    if np is not None:
+        values = np.frombuffer(bits, dtype=np.uint8)
+        heads = int(values.sum())
+        changes = np.flatnonzero(np.diff(values)) if n > 1 else np.array([], dtype=np.int64)
+        runs = len(changes) + 1
+        boundaries = np.concatenate(([-1], changes, [n - 1]))
+        longest = int(np.diff(boundaries).max())
+    else:
+        heads = sum(bits)
+        runs = 1
+        longest = current = 1
+        for previous, value in zip(bits, bits[1:]):
+            if value == previous:
+                current += 1
+                longest = max(longest, current)
+            else:
+                runs += 1
+                current = 1
+    tails = n - heads
+    expected = n / 2
+    chi_square = ((heads - expected) ** 2 + (tails - expected) ** 2) / expected
+    expected_runs = 2 * heads * tails / n + 1
+    variance = (expected_runs - 1) * (expected_runs - 2) / (n - 1) if n > 1 else 0
+    return {
+        'count': n,
+        'heads_ratio': heads / n,
+        'chi_square': round(chi_square, 4),
+        'runs': runs,
+        'runs_z': round((runs - expected_runs) / math.sqrt(variance), 4) if variance > 0 else 0.0,
+        'longest_run': longest
+    }
+
+
+def audit_reveal(conn, reveal_id: int, chunk_size: int = 10000) -> dict:
+    """Пересчитывает все игры раскрытого сида и сравнивает с записанными результатами"""
+    with conn.cursor() as cur:
+        cur.execute(
+            'SELECT player_id, server_seed, server_seed_hash, client_seed FROM fair_seed_reveals WHERE id = %s',
+            (reveal_id,)
+        )
+        player_id, server_seed, server_seed_hash, client_seed = cur.fetchone()
+    checked = mismatches = 0
+    with conn.cursor(name=f'fair_audit_{reveal_id}') as cur:
+        cur.itersize = chunk_size
+        cur.execute(
+            'SELECT nonce, result_side FROM games WHERE player_id = %s AND server_seed_hash = %s ORDER BY nonce',
+            (player_id, server_seed_hash)
+        )
+        for nonce, result_side in cur:
+            checked += 1
+            if outcome(server_seed, client_seed, nonce) != result_side:
+                mismatches += 1
+    conn.rollback()
+    return {
+        'reveal_id': reveal_id,
+        'hash_matches': seed_hash(server_seed) == server_seed_hash,
+        'games_checked': checked,
+        'mismatches': mismatches
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'stats':
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+        server_seed, client_seed = new_server_seed(), new_client_seed()
+        started = time.perf_counter()
+        bits = batch_heads(server_seed, client_seed, 1, count)
+        elapsed = time.perf_counter() - started
+        print({'outcomes_per_sec': round(count / elapsed), **fairness_stats(bits)})
+    elif len(sys.argv) == 3 and sys.argv[1] == 'audit':
+        from db import get_pool
+        with get_pool().connection() as conn:
+            print(audit_reveal(conn, int(sys.argv[2])))
+    else:
+        sys.exit('usage: python fair.py stats [count] | audit <reveal_id>')
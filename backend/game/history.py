@@ -0,0 +1,96 @@
+"""История игр игрока: страницы по ключу (created_at, id) и сводка — серии и итог за окна"""
+from datetime import datetime
+
+import responses
+from cache import get_history_cache
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+WINDOWS = (('24h', '24 hours'), ('7d', '7 days'), ('30d', '30 days'))
+
+COLUMNS = ('id', 'created_at', 'bet_amount', 'selected_side', 'result_side', 'won', 'win_amount', 'nonce')
+
+PAGE_SQL = f'''
+    SELECT {", ".join(COLUMNS)} FROM games
+    WHERE player_id = %(player_id)s
+    ORDER BY created_at DESC, id DESC
+    LIMIT %(limit)s
+'''
+
+NEXT_PAGE_SQL = f'''
+    SELECT {", ".join(COLUMNS)} FROM games
+    WHERE player_id = %(player_id)s AND (created_at, id) < (%(created_at)s, %(id)s)
+    ORDER BY created_at DESC, id DESC
+    LIMIT %(limit)s
+'''
+
+WINDOW_COLUMNS = ',\n            '.join(
+    f"COUNT(*) FILTER (WHERE created_at >= LOCALTIMESTAMP - INTERVAL '{interval}'), "
+    f"COALESCE(SUM(bet_amount) FILTER (WHERE created_at >= LOCALTIMESTAMP - INTERVAL '{interval}'), 0), "
+    f"COALESCE(SUM(win_amount - bet_amount) FILTER (WHERE created_at >= LOCALTIMESTAMP - INTERVAL '{interval}'), 0)"
+    for _, interval in WINDOWS
+)
+
+SUMMARY_SQL = f'''
+    SELECT p.total_games, p.wins, p.current_streak, p.best_win_streak, w.*
+    FROM players p
+    CROSS JOIN LATERAL (
+        SELECT {WINDOW_COLUMNS}
+        FROM games
+        WHERE player_id = p.id AND created_at >= LOCALTIMESTAMP - INTERVAL '{WINDOWS[-1][1]}'
+    ) AS w
+    WHERE p.id = %s
+'''
+
+
+def encode_cursor(created_at: datetime, game_id: int) -> str:
+    return f'{created_at.strftime(CURSOR_FORMAT)}:{game_id}'
+
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора предыдущей страницы или None, если курсор испорчен"""
+    try:
+        created_at, game_id = cursor.split(':')
+        return datetime.strptime(created_at, CURSOR_FORMAT), int(game_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def page(cur, player_id, limit: int, before: tuple = None) -> tuple:
+    """Игры новее-к-старым и курсор следующей страницы (None на последней)"""
+    params = {'player_id': player_id, 'limit': limit + 1}
+    if before is None:
+        cur.execute(PAGE_SQL, params)
+    else:
+        cur.execute(NEXT_PAGE_SQL, {**params, 'created_at': before[0], 'id': before[1]})
+    rows = cur.fetchall()
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [dict(zip(COLUMNS, row)) for row in rows[:limit]], next_cursor
+
+
+def summary(cur, player_id):
+    """Серии и итог за окна из кэша; при промахе — один запрос по покрывающему индексу, None для неизвестного игрока"""
+    cached = get_history_cache().get(player_id)
+    if cached is not None:
+        return cached
+
+    cur.execute(SUMMARY_SQL, (player_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+
+    total_games, wins, current_streak, best_win_streak = row[:4]
+    windows = {}
+    for index, (name, _) in enumerate(WINDOWS):
+        games, wagered, net = row[4 + index * 3:7 + index * 3]
+        windows[name] = {'games': games, 'wagered': responses.amount(wagered), 'net': responses.amount(net)}
+    result = {
+        'total_games': total_games,
+        'wins': wins,
+        'current_streak': current_streak,
+        'best_win_streak': best_win_streak,
+        'windows': windows
+    }
+    get_history_cache().put(player_id, result)
+    return result
@@ -0,0 +1,47 @@
+"""Идемпотентность денежных действий: повтор с тем же request_id получает сохранённый ответ"""
+import re
+
+import responses
+
+ACTIONS = ('play', 'play_many', 'create_deposit', 'create_withdrawal')
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+UNIQUE_VIOLATION = '23505'
+
+
+def valid_request_id(request_id) -> bool:
+    return request_id is None or (isinstance(request_id, str) and REQUEST_ID_PATTERN.match(request_id) is not None)
+
+
+def replay(action: str, stored_action: str, response: dict) -> dict:
+    """Ответ функции из сохранённой записи; чужой action под тем же ключом — конфликт"""
+    if stored_action != action:
+        return responses.error(409, f'request_id was already used for {stored_action}')
+    return responses.response(200, response, {'Idempotent-Replayed': 'true'})
+
+
+def lookup(cur, player_id, request_id, action: str):
+    """Готовый ответ на повтор или None; без request_id запрос в БД не делается"""
+    if request_id is None:
+        return None
+    cur.execute(
+        'SELECT action, response FROM idempotency_keys WHERE player_id = %s AND request_id = %s',
+        (player_id, request_id)
+    )
+    stored = cur.fetchone()
+    return replay(action, *stored) if stored else None
+
+
+def remember(cur, player_id, request_id, action: str, response: dict):
+    """Сохраняет ответ в той же транзакции; параллельный дубль упадёт на первичном ключе"""
+    if request_id is None:
+        return
+    cur.execute(
+        'INSERT INTO idempotency_keys (player_id, request_id, action, response) VALUES (%s, %s, %s, %s)',
+        (player_id, request_id, action, responses.dumps(response))
+    )
+
+
+def is_duplicate(error: Exception) -> bool:
+    diag = getattr(error, 'diag', None)
+    return (getattr(error, 'pgcode', None) == UNIQUE_VIOLATION and diag is not None
+            and diag.constraint_name == 'idempotency_keys_pkey')
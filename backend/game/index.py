@@ -1,216 +1,620 @@
 import json
+import math
 import os
-import psycopg2
-from decimal import Decimal
-import random
+import time
+from decimal import Decimal, InvalidOperation
+from psycopg2.extras import execute_values
+from db import get_pool, instrument
+from cache import get_history_cache, get_player_cache
+from throttle import get_throttle
+from telegram import get_client
+import export
+import fair
+import history
+import idempotency
+import perf
+import responses
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+instrument(perf.InstrumentedConnection)
 
+PLAY_MANY_MAX_BETS = 100
+# DECIMAL(18,8): 10 знаков до запятой
+AMOUNT_MAX = Decimal(10) ** 10
+
+HOUSE_ACCOUNT = -1
+EQUITY_ACCOUNT = -3
+PENDING_WITHDRAWALS_ACCOUNT = -4
+
+PLAY_SQL = f'''
+    WITH replay AS (
+        SELECT action, response FROM idempotency_keys
+        WHERE player_id = %(player_id)s AND request_id = %(request_id)s
+    ), locked AS (
+        SELECT id, balance FROM players
+        WHERE id = %(player_id)s AND NOT EXISTS (SELECT 1 FROM replay)
+        FOR UPDATE
+    ), seed AS (
+        UPDATE fair_seeds f
+        SET nonce = f.nonce + 1
+        FROM locked
+        WHERE f.player_id = locked.id AND locked.balance >= %(bet_amount)s
+        RETURNING f.player_id, f.server_seed_hash, f.nonce,
+            CASE WHEN get_byte(hmac(f.client_seed || ':' || f.nonce, f.server_seed, 'sha256'), 0) < 128
+                THEN 'heads' ELSE 'tails' END AS result_side
+    ), outcome AS (
+        SELECT player_id, server_seed_hash, nonce, result_side,
+            result_side = %(selected_side)s AS won,
+            CASE WHEN result_side = %(selected_side)s THEN %(bet_amount)s * 2 ELSE 0 END AS win_amount
+        FROM seed
+    ), debit AS (
+        UPDATE players p
+        SET balance = p.balance - %(bet_amount)s + outcome.win_amount,
+            total_games = p.total_games + 1,
+            wins = p.wins + CASE WHEN outcome.won THEN 1 ELSE 0 END,
+            current_streak = CASE WHEN outcome.won THEN GREATEST(p.current_streak, 0) + 1 ELSE LEAST(p.current_streak, 0) - 1 END,
+            best_win_streak = CASE WHEN outcome.won THEN GREATEST(p.best_win_streak, GREATEST(p.current_streak, 0) + 1) ELSE p.best_win_streak END,
+            total_winnings = p.total_winnings + outcome.win_amount,
+            updated_at = CURRENT_TIMESTAMP
+        FROM outcome
+        WHERE p.id = outcome.player_id
+        RETURNING p.id, p.telegram_id, p.balance, p.total_games, p.wins, p.total_winnings,
+            outcome.result_side, outcome.won, outcome.win_amount, outcome.server_seed_hash, outcome.nonce
+    ), game AS (
+        INSERT INTO games (player_id, bet_amount, selected_side, result_side, won, win_amount, server_seed_hash, nonce)
+        SELECT id, %(bet_amount)s, %(selected_side)s, result_side, won, win_amount, server_seed_hash, nonce FROM debit
+        RETURNING id, player_id, bet_amount, win_amount
+    ), ledger AS (
+        INSERT INTO ledger_entries (txn_id, account_id, amount, kind, reference_id)
+        SELECT entry.txn_id, leg.account_id, leg.amount, leg.kind, entry.id
+        FROM (SELECT id, player_id, bet_amount, win_amount, nextval('ledger_txn_seq') AS txn_id FROM game) AS entry
+        CROSS JOIN LATERAL (VALUES
+            (entry.player_id, 0 - entry.bet_amount, 'bet'),
+            ({HOUSE_ACCOUNT}, entry.bet_amount, 'bet'),
+            ({HOUSE_ACCOUNT}, 0 - entry.win_amount, 'payout'),
+            (entry.player_id, entry.win_amount, 'payout')
+        ) AS leg(account_id, amount, kind)
+        WHERE leg.amount <> 0
+    ), txn AS (
+        INSERT INTO transactions (player_id, type, amount, status)
+        SELECT id, CASE WHEN won THEN 'win' ELSE 'loss' END, CASE WHEN won THEN win_amount ELSE %(bet_amount)s END, 'completed'
+        FROM debit
+    ), result AS (
+        SELECT id, telegram_id, jsonb_build_object(
+            'result_side', result_side,
+            'won', won,
+            'win_amount', win_amount::DECIMAL(18, 8)::TEXT,
+            'server_seed_hash', server_seed_hash,
+            'nonce', nonce,
+            'balance', balance::TEXT,
+            'total_games', total_games,
+            'wins', wins,
+            'total_winnings', total_winnings::TEXT
+        ) AS response
+        FROM debit
+    ), saved AS (
+        INSERT INTO idempotency_keys (player_id, request_id, action, response)
+        SELECT id, %(request_id)s, 'play', response FROM result
+        WHERE %(request_id)s IS NOT NULL
+    )
+    SELECT locked.id IS NOT NULL, result.telegram_id, result.response, replay.action, replay.response
+    FROM (VALUES (1)) AS one
+    LEFT JOIN replay ON TRUE
+    LEFT JOIN locked ON TRUE
+    LEFT JOIN result ON TRUE
+'''
+
+PLAY_MANY_GAMES_SQL = f'''
+    WITH game AS (
+        INSERT INTO games (player_id, bet_amount, selected_side, result_side, won, win_amount, server_seed_hash, nonce) VALUES %s
+        RETURNING id, player_id, bet_amount, win_amount
+    ), batch AS (
+        SELECT nextval('ledger_txn_seq') AS txn_id
+    )
+    INSERT INTO ledger_entries (txn_id, account_id, amount, kind, reference_id)
+    SELECT batch.txn_id, leg.account_id, leg.amount, leg.kind, game.id
+    FROM game
+    CROSS JOIN batch
+    CROSS JOIN LATERAL (VALUES
+        (game.player_id, 0 - game.bet_amount, 'bet'),
+        ({HOUSE_ACCOUNT}, game.bet_amount, 'bet'),
+        ({HOUSE_ACCOUNT}, 0 - game.win_amount, 'payout'),
+        (game.player_id, game.win_amount, 'payout')
+    ) AS leg(account_id, amount, kind)
+    WHERE leg.amount <> 0
+'''
+
+CREATE_PLAYER_SQL = f'''
+    WITH inserted AS (
+        INSERT INTO players (telegram_id, username, balance) VALUES (%s, %s, %s)
+        ON CONFLICT (telegram_id) DO NOTHING
+        RETURNING id, balance, total_games, wins, total_winnings
+    ), opening AS (
+        INSERT INTO ledger_entries (txn_id, account_id, amount, kind)
+        SELECT entry.txn_id, leg.account_id, leg.amount, 'opening'
+        FROM (SELECT id, balance, nextval('ledger_txn_seq') AS txn_id FROM inserted) AS entry
+        CROSS JOIN LATERAL (VALUES (entry.id, entry.balance), ({EQUITY_ACCOUNT}, 0 - entry.balance)) AS leg(account_id, amount)
+    )
+    SELECT id, balance, total_games, wins, total_winnings FROM inserted
+'''
+
+WITHDRAW_SQL = '''
+    UPDATE players SET balance = balance - %(amount)s, updated_at = CURRENT_TIMESTAMP
+    WHERE id = %(player_id)s AND balance >= %(amount)s
+    RETURNING telegram_id
+'''
+
+WITHDRAWAL_LEDGER_SQL = f'''
+    INSERT INTO ledger_entries (txn_id, account_id, amount, kind, reference_id)
+    SELECT entry.txn_id, leg.account_id, leg.amount, 'withdrawal', %(transaction_id)s
+    FROM (SELECT nextval('ledger_txn_seq') AS txn_id) AS entry
+    CROSS JOIN (VALUES
+        (%(player_id)s::INTEGER, 0 - %(amount)s::DECIMAL),
+        ({PENDING_WITHDRAWALS_ACCOUNT}, %(amount)s::DECIMAL)
+    ) AS leg(account_id, amount)
+'''
+
+def parse_amount(value):
+    """Сумма из запроса: 0 < сумма < AMOUNT_MAX и не больше 8 знаков после запятой; иначе None
+
+    Нечисловые строки, NaN и бесконечность тоже дают None. Лишние знаки balance и ledger округлили бы по-разному.
+    """
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or not 0 < amount < AMOUNT_MAX or amount != amount.quantize(responses.AMOUNT_SCALE):
+        return None
+    return amount
+
+def precheck(event: dict, body: dict):
+    """Действия и отказы без соединения с БД: verify, export, троттлинг, request_id, профиль из кэша; иначе None"""
+    if body.get('action') == 'verify':
+        server_seed = body.get('server_seed')
+        client_seed = body.get('client_seed')
+        nonce = body.get('nonce', 1)
+        count = body.get('count', 1)
+        
+        if (not isinstance(server_seed, str) or not server_seed or not isinstance(client_seed, str)
+                or not isinstance(nonce, int) or nonce < 1
+                or not isinstance(count, int) or not 0 < count <= fair.VERIFY_MAX_NONCES):
+            return responses.error(400, f'Expected server_seed, client_seed, nonce >= 1 and count 1..{fair.VERIFY_MAX_NONCES}')
+        
+        server_seed_hash = fair.seed_hash(server_seed)
+        expected_hash = body.get('server_seed_hash')
+        
+        return responses.response(200, {
+            'server_seed_hash': server_seed_hash,
+            'hash_matches': server_seed_hash == expected_hash if expected_hash else None,
+            'outcomes': fair.verify(server_seed, client_seed, nonce, count)
+        })
+    
+    if body.get('action') == 'export':
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        token = os.environ.get('EXPORT_TOKEN')
+        
+        if not token or headers.get('x-export-token') != token:
+            return responses.error(403, 'Forbidden')
+        
+        table = body.get('table')
+        fmt = body.get('format', 'csv')
+        after_id = body.get('after_id', 0)
+        
+        if table not in export.TABLES or fmt not in export.SINKS or not isinstance(after_id, int) or after_id < 0:
+            return responses.error(400, f'Expected table {", ".join(export.TABLES)}, format csv or jsonl and after_id >= 0')
+        
+        chat_id = int(os.environ.get('ADMIN_TELEGRAM_ID', '0'))
+        client = get_client()
+        
+        result = export.run(
+            get_pool(),
+            table,
+            fmt,
+            lambda path, filename, caption: client.send_document(chat_id, path, filename, caption),
+            after_id=after_id,
+            time_budget=float(body.get('time_budget', os.environ.get('EXPORT_TIME_BUDGET', '20')))
+        )
+        return responses.response(200, result)
+    
+    if body.get('action') in ('play', 'play_many'):
+        retry_after = get_throttle().check(body.get('player_id'))
+        if retry_after:
+            return responses.response(
+                429,
+                {'error': 'Too many requests', 'retry_after': round(retry_after, 3)},
+                {'Retry-After': str(math.ceil(retry_after))}
+            )
+    
+    if body.get('action') in idempotency.ACTIONS and not idempotency.valid_request_id(body.get('request_id')):
+        return responses.error(400, 'request_id must be 8-64 characters of A-Z, a-z, 0-9, _ or -')
+    
+    if body.get('action') == 'get_or_create_player':
+        profile = get_player_cache().get(body.get('telegram_id'))
+        if profile is not None:
+            return responses.response(200, profile)
+    
+    return None
+
+@perf.instrumented('game', perf.body_action)
 def handler(event: dict, context) -> dict:
     """API для игровой механики CoinFlip с TON интеграцией"""
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+        return responses.preflight('GET, POST, OPTIONS', 'Content-Type, X-Export-Token')
     
-    conn = get_db_connection()
+    if method == 'GET':
+        headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+        token = os.environ.get('METRICS_TOKEN')
+        
+        if not token or headers.get('x-metrics-token') != token:
+            return responses.error(405, 'Method not allowed')
+        
+        if (event.get('queryStringParameters') or {}).get('format') == 'prometheus':
+            pool_stats = get_pool().stats()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'},
+                'body': perf.recorder.prometheus({
+                    'pool_active_connections': pool_stats['active'],
+                    'pool_idle_connections': pool_stats['idle'],
+                    'pool_wait_avg_ms': pool_stats['wait_avg_ms'],
+                    'pool_timeouts': pool_stats['timeouts']
+                }),
+                'isBase64Encoded': False
+            }
+        
+        return responses.response(200, {
+            'pool': get_pool().stats(),
+            'player_cache': get_player_cache().stats(),
+            'throttle': get_throttle().stats(),
+            'perf': perf.recorder.summary()
+        }, event=event)
+    
+    body = {}
+    if method == 'POST':
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return responses.error(400, 'Invalid JSON body')
+        
+        if not isinstance(body, dict):
+            return responses.error(400, 'Invalid JSON body')
+        
+        try:
+            early = precheck(event, body)
+        except Exception as e:
+            perf.error(e)
+            return responses.error(500, str(e))
+        
+        if early is not None:
+            return early
+    
+    pool = get_pool()
+    conn = pool.getconn()
     cur = conn.cursor()
     
     try:
         if method == 'POST':
-            body = json.loads(event.get('body', '{}'))
             action = body.get('action')
             
             if action == 'get_or_create_player':
                 telegram_id = body.get('telegram_id')
                 username = body.get('username', '')
+                started = time.perf_counter()
                 
+                conn.autocommit = True
                 cur.execute(
                     'SELECT id, balance, total_games, wins, total_winnings FROM players WHERE telegram_id = %s',
                     (telegram_id,)
                 )
                 player = cur.fetchone()
                 
+                if not player:
+                    cur.execute(CREATE_PLAYER_SQL, (telegram_id, username, 100.0))
+                    player = cur.fetchone()
+                
                 if not player:
                     cur.execute(
-                        'INSERT INTO players (telegram_id, username, balance) VALUES (%s, %s, %s) RETURNING id, balance, total_games, wins, total_winnings',
-                        (telegram_id, username, 100.0)
+                        'SELECT id, balance, total_games, wins, total_winnings FROM players WHERE telegram_id = %s',
+                        (telegram_id,)
                     )
                     player = cur.fetchone()
-                    conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'player_id': player[0],
-                        'balance': float(player[1]),
-                        'total_games': player[2],
-                        'wins': player[3],
-                        'total_winnings': float(player[4])
-                    }),
-                    'isBase64Encoded': False
+                
+                profile = {
+                    'player_id': player[0],
+                    'balance': responses.amount(player[1]),
+                    'total_games': player[2],
+                    'wins': player[3],
+                    'total_winnings': responses.amount(player[4])
                 }
+                get_player_cache().put(telegram_id, profile, load_seconds=time.perf_counter() - started)
+                
+                return responses.response(200, profile)
             
             elif action == 'play':
                 player_id = body.get('player_id')
-                bet_amount = Decimal(str(body.get('bet_amount', 0)))
+                bet_amount = parse_amount(body.get('bet_amount', 0))
                 selected_side = body.get('selected_side')
                 
-                cur.execute('SELECT balance FROM players WHERE id = %s', (player_id,))
-                player = cur.fetchone()
+                if bet_amount is None or selected_side not in ('heads', 'tails'):
+                    return responses.error(400, 'Invalid bet')
                 
-                if not player:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Player not found'}),
-                        'isBase64Encoded': False
-                    }
+                conn.autocommit = True
+                cur.execute(PLAY_SQL, {
+                    'player_id': player_id,
+                    'bet_amount': bet_amount,
+                    'selected_side': selected_side,
+                    'request_id': body.get('request_id')
+                })
+                player_exists, telegram_id, response, replayed_action, replayed = cur.fetchone()
+                
+                if replayed is not None:
+                    return idempotency.replay(action, replayed_action, replayed)
+                
+                if not player_exists:
+                    return responses.error(404, 'Player not found')
+                
+                if response is None:
+                    return responses.error(400, 'Insufficient balance')
+                
+                get_player_cache().invalidate(telegram_id)
+                get_history_cache().invalidate(player_id)
                 
-                balance = player[0]
+                return responses.response(200, response)
+            
+            elif action == 'play_many':
+                player_id = body.get('player_id')
+                bets = body.get('bets') or []
+                
+                if not isinstance(bets, list) or not 0 < len(bets) <= PLAY_MANY_MAX_BETS:
+                    return responses.error(400, f'Expected 1..{PLAY_MANY_MAX_BETS} bets')
                 
-                if balance < bet_amount:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Insufficient balance'}),
-                        'isBase64Encoded': False
-                    }
+                if not all(isinstance(bet, dict) for bet in bets):
+                    return responses.error(400, 'Invalid bet')
                 
-                result_side = 'heads' if random.random() > 0.5 else 'tails'
-                won = result_side == selected_side
-                win_amount = bet_amount * 2 if won else Decimal(0)
+                parsed_bets = [(parse_amount(bet.get('bet_amount', 0)), bet.get('selected_side')) for bet in bets]
                 
-                new_balance = balance + bet_amount if won else balance - bet_amount
+                if any(bet_amount is None or side not in ('heads', 'tails') for bet_amount, side in parsed_bets):
+                    return responses.error(400, 'Invalid bet')
+                
+                replay = idempotency.lookup(cur, player_id, body.get('request_id'), action)
+                if replay:
+                    return replay
                 
                 cur.execute(
-                    'UPDATE players SET balance = %s, total_games = total_games + 1, wins = wins + %s, total_winnings = total_winnings + %s WHERE id = %s',
-                    (new_balance, 1 if won else 0, win_amount, player_id)
+                    'SELECT p.balance, p.current_streak, p.best_win_streak, f.server_seed, f.server_seed_hash, f.client_seed, f.nonce FROM players p JOIN fair_seeds f ON f.player_id = p.id WHERE p.id = %s FOR UPDATE',
+                    (player_id,)
                 )
+                player = cur.fetchone()
+                
+                if not player:
+                    return responses.error(404, 'Player not found')
+                
+                balance, current_streak, best_win_streak, server_seed, server_seed_hash, client_seed, nonce = player
+                heads = fair.batch_heads(server_seed, client_seed, nonce + 1, len(parsed_bets), workers=1)
+                results = []
+                game_rows = []
+                transaction_rows = []
+                wins_delta = 0
+                winnings_delta = Decimal(0)
+                
+                for bet_amount, selected_side in parsed_bets:
+                    if balance < bet_amount:
+                        results.append({
+                            'selected_side': selected_side,
+                            'bet_amount': bet_amount,
+                            'error': 'Insufficient balance'
+                        })
+                        continue
+                    
+                    result_side = 'heads' if heads[len(game_rows)] else 'tails'
+                    nonce += 1
+                    won = result_side == selected_side
+                    win_amount = bet_amount * 2 if won else Decimal(0)
+                    balance = balance + bet_amount if won else balance - bet_amount
+                    wins_delta += 1 if won else 0
+                    current_streak = max(current_streak, 0) + 1 if won else min(current_streak, 0) - 1
+                    best_win_streak = max(best_win_streak, current_streak)
+                    winnings_delta += win_amount
+                    
+                    game_rows.append((player_id, bet_amount, selected_side, result_side, won, win_amount, server_seed_hash, nonce))
+                    transaction_rows.append((player_id, 'win' if won else 'loss', win_amount if won else bet_amount, 'completed'))
+                    results.append({
+                        'selected_side': selected_side,
+                        'bet_amount': bet_amount,
+                        'result_side': result_side,
+                        'won': won,
+                        'win_amount': win_amount,
+                        'nonce': nonce
+                    })
                 
                 cur.execute(
-                    'INSERT INTO games (player_id, bet_amount, selected_side, result_side, won, win_amount) VALUES (%s, %s, %s, %s, %s, %s)',
-                    (player_id, bet_amount, selected_side, result_side, won, win_amount)
+                    'WITH seed AS (UPDATE fair_seeds SET nonce = %s WHERE player_id = %s) UPDATE players SET balance = %s, total_games = total_games + %s, wins = wins + %s, total_winnings = total_winnings + %s, current_streak = %s, best_win_streak = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING telegram_id, balance, total_games, wins, total_winnings',
+                    (nonce, player_id, balance, len(game_rows), wins_delta, winnings_delta, current_streak, best_win_streak, player_id)
                 )
+                telegram_id, balance, total_games, wins, total_winnings = cur.fetchone()
                 
-                if won:
-                    cur.execute(
-                        'INSERT INTO transactions (player_id, type, amount, status) VALUES (%s, %s, %s, %s)',
-                        (player_id, 'win', win_amount, 'completed')
-                    )
-                else:
-                    cur.execute(
-                        'INSERT INTO transactions (player_id, type, amount, status) VALUES (%s, %s, %s, %s)',
-                        (player_id, 'loss', bet_amount, 'completed')
+                if game_rows:
+                    execute_values(cur, PLAY_MANY_GAMES_SQL, game_rows, page_size=len(game_rows))
+                    execute_values(
+                        cur,
+                        'INSERT INTO transactions (player_id, type, amount, status) VALUES %s',
+                        transaction_rows,
+                        page_size=len(transaction_rows)
                     )
                 
+                response = {
+                    'results': results,
+                    'played': len(game_rows),
+                    'server_seed_hash': server_seed_hash,
+                    'balance': balance,
+                    'total_games': total_games,
+                    'wins': wins,
+                    'total_winnings': total_winnings
+                }
+                idempotency.remember(cur, player_id, body.get('request_id'), action, response)
                 conn.commit()
+                get_player_cache().invalidate(telegram_id)
+                get_history_cache().invalidate(player_id)
                 
-                cur.execute('SELECT balance, total_games, wins, total_winnings FROM players WHERE id = %s', (player_id,))
-                updated_player = cur.fetchone()
+                return responses.response(200, response)
+            
+            elif action == 'get_history':
+                player_id = body.get('player_id')
+                limit = body.get('limit', history.PAGE_SIZE)
+                cursor = body.get('cursor')
+                before = history.decode_cursor(cursor) if cursor is not None else None
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'result_side': result_side,
-                        'won': won,
-                        'win_amount': float(win_amount),
-                        'balance': float(updated_player[0]),
-                        'total_games': updated_player[1],
-                        'wins': updated_player[2],
-                        'total_winnings': float(updated_player[3])
-                    }),
-                    'isBase64Encoded': False
-                }
+                if not isinstance(limit, int) or not 0 < limit <= history.MAX_PAGE_SIZE or (cursor is not None and before is None):
+                    return responses.error(400, f'Expected limit 1..{history.MAX_PAGE_SIZE} and cursor from a previous page')
+                
+                conn.autocommit = True
+                summary = history.summary(cur, player_id)
+                
+                if summary is None:
+                    return responses.error(404, 'Player not found')
+                
+                games, next_cursor = history.page(cur, player_id, limit, before)
+                
+                return responses.response(200, {
+                    'games': games,
+                    'next_cursor': next_cursor,
+                    'summary': summary
+                })
+            
+            elif action == 'get_fair_seed':
+                player_id = body.get('player_id')
+                
+                cur.execute('SELECT server_seed_hash, client_seed, nonce FROM fair_seeds WHERE player_id = %s', (player_id,))
+                seed = cur.fetchone()
+                
+                if not seed:
+                    return responses.error(404, 'Player not found')
+                
+                return responses.response(200, {
+                    'server_seed_hash': seed[0],
+                    'client_seed': seed[1],
+                    'nonce': seed[2]
+                })
+            
+            elif action == 'rotate_seed':
+                player_id = body.get('player_id')
+                client_seed = body.get('client_seed')
+                
+                if client_seed is not None and not (isinstance(client_seed, str) and fair.CLIENT_SEED_PATTERN.match(client_seed)):
+                    return responses.error(400, 'client_seed must be 1-64 characters of A-Z, a-z, 0-9, _ or -')
+                
+                cur.execute(
+                    'SELECT server_seed, server_seed_hash, client_seed, nonce, created_at FROM fair_seeds WHERE player_id = %s FOR UPDATE',
+                    (player_id,)
+                )
+                seed = cur.fetchone()
+                
+                if not seed:
+                    return responses.error(404, 'Player not found')
+                
+                cur.execute(
+                    'INSERT INTO fair_seed_reveals (player_id, server_seed, server_seed_hash, client_seed, last_nonce, created_at) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id',
+                    (player_id, seed[0], seed[1], seed[2], seed[3], seed[4])
+                )
+                reveal_id = cur.fetchone()[0]
+                
+                server_seed = fair.new_server_seed()
+                next_client_seed = client_seed or seed[2]
+                cur.execute(
+                    'UPDATE fair_seeds SET server_seed = %s, server_seed_hash = %s, client_seed = %s, nonce = 0, created_at = CURRENT_TIMESTAMP WHERE player_id = %s',
+                    (server_seed, fair.seed_hash(server_seed), next_client_seed, player_id)
+                )
+                conn.commit()
+                
+                return responses.response(200, {
+                    'revealed': {
+                        'reveal_id': reveal_id,
+                        'server_seed': seed[0],
+                        'server_seed_hash': seed[1],
+                        'client_seed': seed[2],
+                        'last_nonce': seed[3]
+                    },
+                    'server_seed_hash': fair.seed_hash(server_seed),
+                    'client_seed': next_client_seed,
+                    'nonce': 0
+                })
             
             elif action == 'create_deposit':
                 player_id = body.get('player_id')
-                amount = Decimal(str(body.get('amount', 0)))
+                amount = parse_amount(body.get('amount', 0))
+                
+                if amount is None:
+                    return responses.error(400, 'Invalid amount')
+                
+                replay = idempotency.lookup(cur, player_id, body.get('request_id'), action)
+                if replay:
+                    return replay
                 
                 cur.execute(
                     'INSERT INTO transactions (player_id, type, amount, status) VALUES (%s, %s, %s, %s) RETURNING id',
                     (player_id, 'deposit', amount, 'pending')
                 )
                 transaction_id = cur.fetchone()[0]
-                conn.commit()
                 
-                ton_wallet = os.environ.get('TON_WALLET_ADDRESS', '')
-                memo = f'DEPOSIT_{transaction_id}'
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'transaction_id': transaction_id,
-                        'ton_wallet': ton_wallet,
-                        'amount': float(amount),
-                        'memo': memo
-                    }),
-                    'isBase64Encoded': False
+                response = {
+                    'transaction_id': transaction_id,
+                    'ton_wallet': os.environ.get('TON_WALLET_ADDRESS', ''),
+                    'amount': amount,
+                    'memo': f'DEPOSIT_{transaction_id}'
                 }
+                idempotency.remember(cur, player_id, body.get('request_id'), action, response)
+                conn.commit()
+                
+                return responses.response(200, response)
             
             elif action == 'create_withdrawal':
                 player_id = body.get('player_id')
-                amount = Decimal(str(body.get('amount', 0)))
+                amount = parse_amount(body.get('amount', 0))
                 ton_address = body.get('ton_address')
                 
-                cur.execute('SELECT balance FROM players WHERE id = %s', (player_id,))
+                if amount is None:
+                    return responses.error(400, 'Invalid amount')
+                
+                replay = idempotency.lookup(cur, player_id, body.get('request_id'), action)
+                if replay:
+                    return replay
+                
+                cur.execute(WITHDRAW_SQL, {'player_id': player_id, 'amount': amount})
                 player = cur.fetchone()
                 
-                if not player or player[0] < amount:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Insufficient balance'}),
-                        'isBase64Encoded': False
-                    }
+                if not player:
+                    return responses.error(400, 'Insufficient balance')
                 
+                telegram_id = player[0]
                 cur.execute(
                     'INSERT INTO transactions (player_id, type, amount, ton_address, status) VALUES (%s, %s, %s, %s, %s) RETURNING id',
                     (player_id, 'withdrawal', amount, ton_address, 'pending')
                 )
                 transaction_id = cur.fetchone()[0]
                 
-                cur.execute('UPDATE players SET balance = balance - %s WHERE id = %s', (amount, player_id))
+                cur.execute(WITHDRAWAL_LEDGER_SQL, {
+                    'transaction_id': transaction_id,
+                    'player_id': player_id,
+                    'amount': amount
+                })
+                
+                response = {'transaction_id': transaction_id, 'status': 'pending'}
+                idempotency.remember(cur, player_id, body.get('request_id'), action, response)
                 conn.commit()
+                get_player_cache().invalidate(telegram_id)
                 
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({
-                        'transaction_id': transaction_id,
-                        'status': 'pending'
-                    }),
-                    'isBase64Encoded': False
-                }
+                return responses.response(200, response)
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return responses.error(405, 'Method not allowed')
     
     except Exception as e:
-        conn.rollback()
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        if not conn.closed:
+            conn.rollback()
+        if idempotency.is_duplicate(e):
+            return idempotency.lookup(cur, body.get('player_id'), body.get('request_id'), body.get('action'))
+        perf.error(e)
+        return responses.error(500, str(e))
     finally:
         cur.close()
-        conn.close()
+        pool.putconn(conn)
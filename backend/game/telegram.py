@@ -0,0 +1,200 @@
+"""Клиент Telegram Bot API: keep-alive соединения, параллельная отправка и повторы при 429"""
+import contextvars
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+_observer = None
+
+
+def observe(callback):
+    """callback(method, seconds, ok) вызывается после каждого вызова API, включая повторы внутри него"""
+    global _observer
+    _observer = callback
+
+
+class TelegramError(Exception):
+    def __init__(self, method: str, status: int, description: str, retry_after: float = None):
+        super().__init__(f'{method}: {status} {description}')
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+
+class MultipartBody:
+    """multipart/form-data с файлом, который читается с диска кусками; при повторе вызова читается заново"""
+
+    def __init__(self, fields: dict, name: str, path: str, filename: str, chunk_size: int = 1 << 16):
+        boundary = uuid.uuid4().hex
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items() if value is not None
+        )
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n')
+        self._head = head.encode('utf-8')
+        self._tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        self.path = path
+        self.chunk_size = chunk_size
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+
+    def __len__(self) -> int:
+        return len(self._head) + os.path.getsize(self.path) + len(self._tail)
+
+    def __iter__(self):
+        yield self._head
+        with open(self.path, 'rb') as file:
+            while True:
+                chunk = file.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+
+class TelegramClient:
+    def __init__(self, token: str, api_url: str = 'https://api.telegram.org', max_workers: int = 4,
+                 timeout: float = 10.0, max_retries: int = 3, backoff: float = 0.3, max_retry_after: float = 30.0):
+        url = urllib.parse.urlsplit(api_url)
+        self._https = url.scheme == 'https'
+        self._host = url.hostname
+        self._port = url.port
+        self._path = f'{url.path.rstrip("/")}/bot{token}/'
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.max_workers = max_workers
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._https:
+                conn = http.client.HTTPSConnection(self._host, self._port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _encode(self, params: dict) -> bytes:
+        fields = {
+            key: json.dumps(value) if isinstance(value, (dict, list)) else value
+            for key, value in (params or {}).items()
+            if value is not None
+        }
+        return urllib.parse.urlencode(fields).encode('utf-8')
+
+    def _send(self, method: str, body: bytes, content_type: str):
+        conn = self._connection()
+        conn.request('POST', self._path + method, body=body, headers={
+            'Content-Type': content_type,
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive'
+        })
+        response = conn.getresponse()
+        return response.status, response.read()
+
+    def call(self, method: str, params: dict = None, body: bytes = None,
+             content_type: str = 'application/x-www-form-urlencoded') -> dict:
+        """Синхронный вызов метода; повторяет при обрыве соединения, 5xx и 429 с учётом retry_after"""
+        if body is None:
+            body = self._encode(params)
+        if _observer is None:
+            return self._call(method, body, content_type)
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = self._call(method, body, content_type)
+            ok = True
+            return result
+        finally:
+            _observer(method, time.perf_counter() - started, ok)
+
+    def _call(self, method: str, body: bytes, content_type: str) -> dict:
+        attempt = 0
+        while True:
+            try:
+                status, raw = self._send(method, body, content_type)
+            except (http.client.HTTPException, OSError):
+                self._drop_connection()
+                if attempt >= self.max_retries:
+                    raise
+                if attempt:
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                attempt += 1
+                continue
+
+            payload = json.loads(raw.decode('utf-8')) if raw else {}
+            if payload.get('ok'):
+                return payload
+
+            description = payload.get('description', '')
+            retry_after = (payload.get('parameters') or {}).get('retry_after')
+            retryable = status == 429 or status >= 500
+            if not retryable or attempt >= self.max_retries:
+                raise TelegramError(method, status, description, retry_after)
+            if status == 429:
+                delay = float(retry_after if retry_after is not None else 1)
+                if delay > self.max_retry_after:
+                    raise TelegramError(method, status, description, retry_after)
+            else:
+                delay = self.backoff * 2 ** attempt
+            time.sleep(delay)
+            attempt += 1
+
+    def send_document(self, chat_id: int, path: str, filename: str, caption: str = None) -> dict:
+        """Отправляет файл с диска документом, не читая его в память целиком"""
+        body = MultipartBody({'chat_id': chat_id, 'caption': caption}, 'document', path, filename)
+        return self.call('sendDocument', body=body, content_type=body.content_type)
+
+    def submit(self, method: str, params: dict = None):
+        """Отправляет вызов в пул потоков и возвращает Future"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='telegram')
+        return self._executor.submit(contextvars.copy_context().run, self.call, method, params)
+
+    def call_many(self, calls: list) -> list:
+        """Выполняет [(method, params), ...] параллельно и возвращает результаты в том же порядке"""
+        futures = [self.submit(method, params) for method, params in calls]
+        return [future.result() for future in futures]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._drop_connection()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TelegramClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient(
+                    os.environ['TELEGRAM_BOT_TOKEN'],
+                    api_url=os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org'),
+                    max_workers=int(os.environ.get('TELEGRAM_MAX_WORKERS', '4'))
+                )
+    return _client
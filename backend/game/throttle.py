@@ -0,0 +1,159 @@
+"""Ограничение частоты ставок: token bucket на игрока и общий, до обращения к БД"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Берёт по токену из всех вёдер сразу или ни из одного. KEYS — вёдра, ARGV — пары rate, burst.
+TAKE_SCRIPT = '''
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    current = math.min(burst, current + math.max(0, now - ts) * rate)
+    if current < 1 then
+        return {i, tostring((1 - current) / rate)}
+    end
+    tokens[i] = current
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 2 - 1])
+    local burst = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return {0, '0'}
+'''
+
+
+class LocalBuckets:
+    """Вёдра в памяти экземпляра; вытесненное ведро считается полным"""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: list) -> tuple:
+        """buckets: [(key, rate, burst)]; возвращает (номер отказавшего ведра с 1 или 0, сколько ждать)"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for index, (key, rate, burst) in enumerate(buckets, 1):
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    return index, (1 - tokens) / rate
+                levels.append(tokens)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return 0, 0.0
+
+
+class RedisBuckets:
+    """Общие для всех экземпляров вёдра: одна Lua-операция на запрос"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError('THROTTLE_URL points to Redis, but the redis package is not installed')
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, buckets: list) -> tuple:
+        args = []
+        for _, rate, burst in buckets:
+            args.extend((rate, burst))
+        index, wait = self._take(keys=[key for key, _, _ in buckets], args=args)
+        return int(index), float(wait)
+
+
+class Throttle:
+    def __init__(self, player_rate: float, player_burst: float, global_rate: float, global_burst: float,
+                 backend=None, fail_open: bool = True):
+        self.player_rate = player_rate
+        self.player_burst = player_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.backend = backend or LocalBuckets()
+        self.fail_open = fail_open
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._rejected = {'player': 0, 'global': 0}
+        self._backend_errors = 0
+
+    def check(self, player_id) -> float:
+        """0, если ставку можно принять, иначе через сколько секунд повторить"""
+        buckets, names = [], []
+        try:
+            player_id = int(player_id)
+        except (TypeError, ValueError):
+            player_id = None
+        if self.player_rate > 0 and player_id is not None:
+            buckets.append((f'throttle:player:{player_id}', self.player_rate, self.player_burst))
+            names.append('player')
+        if self.global_rate > 0:
+            buckets.append(('throttle:global', self.global_rate, self.global_burst))
+            names.append('global')
+        if not buckets:
+            return 0.0
+        try:
+            index, wait = self.backend.take(buckets)
+        except Exception:
+            with self._lock:
+                self._backend_errors += 1
+            if self.fail_open:
+                return 0.0
+            raise
+        with self._lock:
+            if index:
+                self._rejected[names[index - 1]] += 1
+            else:
+                self._allowed += 1
+        return wait if index else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__,
+                'player_rate': self.player_rate,
+                'global_rate': self.global_rate,
+                'allowed': self._allowed,
+                'rejected_player': self._rejected['player'],
+                'rejected_global': self._rejected['global'],
+                'backend_errors': self._backend_errors
+            }
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_throttle() -> Throttle:
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                url = os.environ.get('THROTTLE_URL', '')
+                player_rate = float(os.environ.get('THROTTLE_PLAYER_RATE', '5'))
+                global_rate = float(os.environ.get('THROTTLE_GLOBAL_RATE', '200'))
+                _throttle = Throttle(
+                    player_rate=player_rate,
+                    player_burst=float(os.environ.get('THROTTLE_PLAYER_BURST', str(player_rate * 2))),
+                    global_rate=global_rate,
+                    global_burst=float(os.environ.get('THROTTLE_GLOBAL_BURST', str(global_rate * 2))),
+                    backend=RedisBuckets(url) if url.startswith('redis') else LocalBuckets()
+                )
+    return _throttle
@@ -0,0 +1,219 @@
+"""Кэш профилей игроков по telegram_id и сводок истории по player_id: LRU с TTL в процессе и необязательное общее хранилище"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class MemoryBackend:
+    """Локальная замена Redis с тем же интерфейсом: для разработки и замеров без сервера"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError('PLAYER_CACHE_URL points to Redis, but the redis package is not installed')
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str):
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._client.set(key, value, px=int(ttl * 1000))
+
+    def delete(self, key: str):
+        self._client.delete(key)
+
+
+class PlayerCache:
+    """Read-through кэш: сначала локальный LRU, затем общее хранилище, затем БД
+
+    Общее хранилище нужно, чтобы сброс после изменения баланса был виден другим экземплярам функции;
+    локальные копии других экземпляров живут не дольше local_ttl. local_ttl = 0 отключает локальные копии.
+    """
+
+    def __init__(self, ttl: float = 30.0, local_ttl: float = None, max_entries: int = 10000, shared=None,
+                 prefix: str = 'player'):
+        self.ttl = ttl
+        self.local_ttl = ttl if local_ttl is None else local_ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.prefix = prefix
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._shared_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._shared_errors = 0
+        self._lookup_total = 0.0
+        self._lookup_max = 0.0
+        self._loads = 0
+        self._load_total = 0.0
+        self._load_max = 0.0
+
+    def _key(self, telegram_id) -> str:
+        return f'{self.prefix}:{telegram_id}'
+
+    def _remember(self, key: str, value: dict):
+        if self.local_ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _shared_call(self, method: str, *args):
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception:
+            with self._lock:
+                self._shared_errors += 1
+            return None
+
+    def get(self, telegram_id):
+        if telegram_id is None:
+            return None
+        started = time.perf_counter()
+        key = self._key(telegram_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            value = entry[1] if entry is not None and entry[0] >= time.monotonic() else None
+            if value is not None:
+                self._entries.move_to_end(key)
+        source = 'local' if value is not None else None
+
+        if value is None and self.shared is not None:
+            raw = self._shared_call('get', key)
+            if raw is not None:
+                value = json.loads(raw)
+                source = 'shared'
+                self._remember(key, value)
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if source == 'local':
+                self._hits += 1
+            elif source == 'shared':
+                self._shared_hits += 1
+            else:
+                self._misses += 1
+            self._lookup_total += elapsed
+            self._lookup_max = max(self._lookup_max, elapsed)
+        return value
+
+    def put(self, telegram_id, value: dict, load_seconds: float = None):
+        if telegram_id is None:
+            return
+        key = self._key(telegram_id)
+        self._remember(key, value)
+        if self.shared is not None:
+            self._shared_call('set', key, json.dumps(value).encode('utf-8'), self.ttl)
+        if load_seconds is not None:
+            with self._lock:
+                self._loads += 1
+                self._load_total += load_seconds
+                self._load_max = max(self._load_max, load_seconds)
+
+    def invalidate(self, telegram_id):
+        if telegram_id is None:
+            return
+        key = self._key(telegram_id)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._invalidations += 1
+        if self.shared is not None:
+            self._shared_call('delete', key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._shared_hits + self._misses
+            return {
+                'backend': type(self.shared).__name__ if self.shared is not None else None,
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'shared_hits': self._shared_hits,
+                'misses': self._misses,
+                'hit_rate': round((self._hits + self._shared_hits) / lookups, 4) if lookups else 0.0,
+                'invalidations': self._invalidations,
+                'shared_errors': self._shared_errors,
+                'lookup_avg_ms': round(self._lookup_total / lookups * 1000, 3) if lookups else 0.0,
+                'lookup_max_ms': round(self._lookup_max * 1000, 3),
+                'loads': self._loads,
+                'load_avg_ms': round(self._load_total / self._loads * 1000, 3) if self._loads else 0.0,
+                'load_max_ms': round(self._load_max * 1000, 3)
+            }
+
+
+def _shared_backend(url: str):
+    if not url:
+        return None
+    if url == 'memory://':
+        return MemoryBackend()
+    return RedisBackend(url)
+
+
+_cache = None
+_history_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_player_cache() -> PlayerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = _shared_backend(os.environ.get('PLAYER_CACHE_URL', ''))
+                # Без общего хранилища сброс виден только своему экземпляру: зачисление депозита в settlement
+                # или ставка на другом экземпляре не сбросили бы баланс, поэтому локальный кэш — только явно
+                _cache = PlayerCache(
+                    ttl=float(os.environ.get('PLAYER_CACHE_TTL', '30')),
+                    local_ttl=float(os.environ.get('PLAYER_CACHE_LOCAL_TTL', '5' if shared is not None else '0')),
+                    max_entries=int(os.environ.get('PLAYER_CACHE_MAX_ENTRIES', '10000')),
+                    shared=shared
+                )
+    return _cache
+
+
+def get_history_cache() -> PlayerCache:
+    """Сводки get_history по player_id; play и play_many сбрасывают сводку игрока"""
+    global _history_cache
+    if _history_cache is None:
+        with _cache_lock:
+            if _history_cache is None:
+                shared = _shared_backend(os.environ.get('PLAYER_CACHE_URL', ''))
+                ttl = float(os.environ.get('HISTORY_CACHE_TTL', '60'))
+                _history_cache = PlayerCache(
+                    ttl=ttl,
+                    local_ttl=float(os.environ.get('PLAYER_CACHE_LOCAL_TTL', '5' if shared is not None else str(ttl))),
+                    max_entries=int(os.environ.get('PLAYER_CACHE_MAX_ENTRIES', '10000')),
+                    shared=shared,
+                    prefix='history'
+                )
+    return _history_cache
@@ -0,0 +1,121 @@
+"""Источники переводов TON для сверки: TonCenter API и локальная заглушка"""
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from decimal import Decimal
+
+NANOTON = Decimal(10) ** 9
+
+Transfer = namedtuple('Transfer', 'tx_hash memo amount utime address')
+
+
+def from_nanotons(value) -> Decimal:
+    return (Decimal(int(value)) / NANOTON).quantize(Decimal('0.00000001'))
+
+
+class TonCenterSource:
+    """Транзакции кошелька игры через TonCenter API v2 (getTransactions), от новых к старым"""
+
+    def __init__(self, wallet: str, api_url: str = 'https://toncenter.com/api/v2', api_key: str = None,
+                 page_size: int = 100, timeout: float = 10.0):
+        self.wallet = wallet
+        self.api_url = api_url.rstrip('/')
+        self.api_key = api_key
+        self.page_size = page_size
+        self.timeout = timeout
+
+    def _page(self, lt: str = None, tx_hash: str = None) -> list:
+        params = {'address': self.wallet, 'limit': self.page_size, 'archival': 'true'}
+        if lt:
+            params.update(lt=lt, hash=tx_hash)
+        request = urllib.request.Request(f'{self.api_url}/getTransactions?{urllib.parse.urlencode(params)}')
+        if self.api_key:
+            request.add_header('X-API-Key', self.api_key)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read().decode('utf-8'))
+        if not payload.get('ok'):
+            raise RuntimeError(f'toncenter: {payload.get("error")}')
+        return payload['result']
+
+    def _transactions(self, since: float):
+        lt = tx_hash = None
+        while True:
+            page = self._page(lt, tx_hash)
+            if lt:
+                page = page[1:]
+            if not page:
+                return
+            for tx in page:
+                if tx['utime'] < since:
+                    return
+                yield tx
+            lt, tx_hash = page[-1]['transaction_id']['lt'], page[-1]['transaction_id']['hash']
+
+    def transfers(self, since: float) -> tuple:
+        """(входящие, исходящие) переводы с текстовым комментарием не старше since (unix time)"""
+        incoming, outgoing = [], []
+        for tx in self._transactions(since):
+            tx_hash = tx['transaction_id']['hash']
+            in_msg = tx.get('in_msg') or {}
+            if in_msg.get('source') and in_msg.get('message'):
+                incoming.append(Transfer(tx_hash, in_msg['message'].strip(), from_nanotons(in_msg['value']),
+                                         tx['utime'], in_msg['source']))
+            # Одна транзакция кошелька может оплатить несколько выводов: каждый перевод — свой ключ
+            for index, out_msg in enumerate(tx.get('out_msgs') or []):
+                if out_msg.get('message'):
+                    outgoing.append(Transfer(f'{tx_hash}:{index}', out_msg['message'].strip(),
+                                             from_nanotons(out_msg['value']), tx['utime'], out_msg.get('destination')))
+        return incoming, outgoing
+
+
+class FakeTonSource:
+    """Локальная замена TonCenter для тестов и бенчмарков: переводы добавляются из кода"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._incoming = []
+        self._outgoing = []
+        self._lock = threading.Lock()
+        self._counter = 0
+        # Хэши уникальны между запусками: на той же базе прошлые переводы уже заняли свои chain_tx_hash
+        self._run = os.urandom(8).hex()
+
+    def _hash(self) -> str:
+        self._counter += 1
+        return f'fake{self._run}{self._counter:044d}'
+
+    def deposit(self, memo: str, amount: Decimal, address: str = 'EQfake-sender') -> Transfer:
+        with self._lock:
+            transfer = Transfer(self._hash(), memo, Decimal(amount), time.time(), address)
+            self._incoming.append(transfer)
+        return transfer
+
+    def payout(self, memo: str, amount: Decimal, address: str) -> Transfer:
+        with self._lock:
+            transfer = Transfer(self._hash(), memo, Decimal(amount), time.time(), address)
+            self._outgoing.append(transfer)
+        return transfer
+
+    def transfers(self, since: float) -> tuple:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            return ([t for t in self._incoming if t.utime >= since],
+                    [t for t in self._outgoing if t.utime >= since])
+
+
+def get_source():
+    kind = os.environ.get('SETTLEMENT_SOURCE', 'toncenter')
+    if kind == 'fake':
+        return FakeTonSource()
+    return TonCenterSource(
+        os.environ['TON_WALLET_ADDRESS'],
+        api_url=os.environ.get('TONCENTER_API_URL', 'https://toncenter.com/api/v2'),
+        api_key=os.environ.get('TONCENTER_API_KEY')
+    )
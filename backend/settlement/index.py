@@ -0,0 +1,37 @@
+import json
+import os
+from settlement import SettlementWorker
+import responses
+
+def handler(event: dict, context) -> dict:
+    """Плановое проведение депозитов и выводов по переводам в сети TON"""
+    method = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return responses.preflight('POST, OPTIONS', 'Content-Type, X-Settlement-Token')
+    
+    if method != 'POST':
+        return responses.error(405, 'Method not allowed')
+    
+    headers = {key.lower(): value for key, value in (event.get('headers') or {}).items()}
+    token = os.environ.get('SETTLEMENT_TOKEN')
+    
+    if not token or headers.get('x-settlement-token') != token:
+        return responses.error(403, 'Forbidden')
+    
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return responses.error(400, 'Invalid JSON body')
+    
+    if not isinstance(body, dict):
+        return responses.error(400, 'Invalid JSON body')
+    
+    try:
+        worker = SettlementWorker(batch_size=int(body.get('batch_size', 100)))
+        result = worker.run(time_budget=float(body.get('time_budget', os.environ.get('SETTLEMENT_TIME_BUDGET', '20'))))
+        
+        return responses.response(200, result, event=event)
+    
+    except Exception as e:
+        return responses.error(500, str(e))
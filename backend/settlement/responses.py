@@ -0,0 +1,84 @@
+"""Ответы функций: общие заголовки, JSON с точными суммами (orjson, если установлен) и gzip для больших тел"""
+import base64
+import datetime
+import gzip
+import json
+import os
+from decimal import ROUND_HALF_UP, Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+GZIP_HEADERS = {**HEADERS, 'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '8192'))
+GZIP_LEVEL = 6
+# Масштаб денежных колонок DECIMAL(18,8); округление как у Postgres numeric
+AMOUNT_SCALE = Decimal('0.00000001')
+
+
+def amount(value) -> str:
+    """Сумма строкой в масштабе DECIMAL(18,8) и без экспоненты: '100.00000000', '0.50000000'"""
+    return format(Decimal(value).quantize(AMOUNT_SCALE, ROUND_HALF_UP), 'f')
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return amount(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+if orjson is not None:
+    def dumps(data) -> str:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    _encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps(data) -> str:
+        return _encoder.encode(data)
+
+
+def accepts_gzip(event: dict) -> bool:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding':
+            return 'gzip' in value.lower()
+    return False
+
+
+def response(status: int, data, headers: dict = None, event: dict = None) -> dict:
+    """Ответ функции; с event тело от GZIP_MIN_BYTES сжимается, если клиент принимает gzip"""
+    body = dumps(data)
+    if event is not None and len(body) >= GZIP_MIN_BYTES and accepts_gzip(event):
+        return {
+            'statusCode': status,
+            'headers': {**GZIP_HEADERS, **headers} if headers else GZIP_HEADERS,
+            'body': base64.b64encode(gzip.compress(body.encode('utf-8'), GZIP_LEVEL)).decode('ascii'),
+            'isBase64Encoded': True
+        }
+    return {
+        'statusCode': status,
+        'headers': {**HEADERS, **headers} if headers else HEADERS,
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+
+def error(status: int, message: str, headers: dict = None) -> dict:
+    return response(status, {'error': message}, headers)
+
+
+def preflight(methods: str = 'GET, POST, OPTIONS', allow_headers: str = 'Content-Type') -> dict:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': allow_headers
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
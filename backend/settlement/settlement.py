@@ -0,0 +1,265 @@
+"""Проведение депозитов и выводов: пакетный захват pending-строк и сверка с переводами в сети TON"""
+import os
+import re
+import sys
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from cache import get_player_cache
+from chain import get_source
+from db import get_pool
+
+EXTERNAL_ACCOUNT = -2
+PENDING_WITHDRAWALS_ACCOUNT = -4
+
+MEMO_PATTERNS = {
+    'deposit': re.compile(r'^DEPOSIT_(\d+)$'),
+    'withdrawal': re.compile(r'^WITHDRAWAL_(\d+)$')
+}
+
+SINCE_SQL = '''
+    SELECT type, EXTRACT(EPOCH FROM MIN(created_at)) FROM transactions
+    WHERE status = 'pending' AND type IN ('deposit', 'withdrawal')
+    GROUP BY type
+'''
+
+CLAIM_SQL = '''
+    SELECT id, amount, created_at < LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+    FROM transactions
+    WHERE type = %s AND status = 'pending' AND id > %s
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+'''
+
+# Воркеры зачисляют депозиты одним и тем же игрокам; блокировка в порядке id исключает взаимоблокировки
+LOCK_PLAYERS_SQL = '''
+    SELECT id FROM players
+    WHERE id IN (SELECT player_id FROM transactions WHERE id = ANY(%s))
+    ORDER BY id
+    FOR UPDATE
+'''
+
+SETTLE_DEPOSITS_SQL = f'''
+    WITH matched (id, amount, chain_tx_hash) AS (VALUES %s),
+    settled AS (
+        UPDATE transactions t
+        SET status = 'completed', amount = matched.amount, chain_tx_hash = matched.chain_tx_hash,
+            settled_at = CURRENT_TIMESTAMP
+        FROM matched
+        WHERE t.id = matched.id
+        RETURNING t.id, t.player_id, t.amount
+    ), credited AS (
+        UPDATE players p
+        SET balance = p.balance + s.amount, updated_at = CURRENT_TIMESTAMP
+        FROM (SELECT player_id, SUM(amount) AS amount FROM settled GROUP BY player_id) AS s
+        WHERE p.id = s.player_id
+        RETURNING p.telegram_id
+    ), ledger AS (
+        INSERT INTO ledger_entries (txn_id, account_id, amount, kind, reference_id)
+        SELECT entry.txn_id, leg.account_id, leg.amount, 'deposit', entry.id
+        FROM (SELECT id, player_id, amount, nextval('ledger_txn_seq') AS txn_id FROM settled) AS entry
+        CROSS JOIN LATERAL (VALUES
+            (entry.player_id, entry.amount),
+            ({EXTERNAL_ACCOUNT}, 0 - entry.amount)
+        ) AS leg(account_id, amount)
+    )
+    SELECT telegram_id FROM credited
+'''
+
+SETTLE_WITHDRAWALS_SQL = f'''
+    WITH matched (id, chain_tx_hash) AS (VALUES %s),
+    settled AS (
+        UPDATE transactions t
+        SET status = 'completed', chain_tx_hash = matched.chain_tx_hash, settled_at = CURRENT_TIMESTAMP
+        FROM matched
+        WHERE t.id = matched.id
+        RETURNING t.id, t.amount
+    )
+    INSERT INTO ledger_entries (txn_id, account_id, amount, kind, reference_id)
+    SELECT entry.txn_id, leg.account_id, leg.amount, 'withdrawal', entry.id
+    FROM (SELECT id, amount, nextval('ledger_txn_seq') AS txn_id FROM settled) AS entry
+    CROSS JOIN LATERAL (VALUES
+        ({PENDING_WITHDRAWALS_ACCOUNT}, 0 - entry.amount),
+        ({EXTERNAL_ACCOUNT}, entry.amount)
+    ) AS leg(account_id, amount)
+'''
+
+
+def _percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class SettlementWorker:
+    """Один проход по очереди pending; несколько воркеров делят её через SKIP LOCKED"""
+
+    def __init__(self, source=None, pool=None, batch_size: int = 100, deposit_expiry_hours: float = None,
+                 withdrawal_lookback_hours: float = None):
+        self.source = source or get_source()
+        self.pool = pool or get_pool()
+        self.batch_size = batch_size
+        self.deposit_expiry_hours = deposit_expiry_hours or float(os.environ.get('DEPOSIT_EXPIRY_HOURS', '24'))
+        self.withdrawal_lookback_hours = withdrawal_lookback_hours or float(os.environ.get('WITHDRAWAL_LOOKBACK_HOURS', '48'))
+
+    def _since(self) -> dict:
+        """С какого момента искать переводы каждого вида: самая старая pending-строка, но не раньше окна
+
+        Депозиты старше DEPOSIT_EXPIRY_HOURS всё равно истекают, а выплата по выводу всегда позже
+        запроса, так что окно WITHDRAWAL_LOOKBACK_HOURS теряет только выплаты, пропущенные дольше него.
+        Без окна один неоплаченный вывод заставлял листать всю историю кошелька на каждом запуске.
+        """
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(SINCE_SQL)
+            oldest = dict(cur.fetchall())
+            conn.rollback()
+        now = time.time()
+        windows = {'deposit': self.deposit_expiry_hours, 'withdrawal': self.withdrawal_lookback_hours}
+        return {kind: max(float(oldest[kind]), now - hours * 3600) - 600
+                for kind, hours in windows.items() if oldest.get(kind) is not None}
+
+    def _transfers(self) -> dict:
+        """Переводы по номеру транзакции из комментария, начиная с самой старой pending-строки своего вида"""
+        since = self._since()
+        matched = {'deposit': {}, 'withdrawal': {}}
+        if not since:
+            return matched
+        incoming, outgoing = self.source.transfers(min(since.values()))
+        for kind, transfers in (('deposit', incoming), ('withdrawal', outgoing)):
+            if kind not in since:
+                continue
+            for transfer in sorted(transfers, key=lambda t: t.utime):
+                if transfer.utime < since[kind]:
+                    continue
+                match = MEMO_PATTERNS[kind].match(transfer.memo)
+                if match:
+                    matched[kind].setdefault(int(match.group(1)), transfer)
+        return matched
+
+    def _settle_batch(self, kind: str, transfers: dict, after_id: int):
+        started = time.perf_counter()
+        conn = self.pool.getconn()
+        telegram_ids = []
+        try:
+            with conn.cursor() as cur:
+                cur.execute(CLAIM_SQL, (self.deposit_expiry_hours, kind, after_id, self.batch_size))
+                claimed = cur.fetchall()
+                if not claimed:
+                    conn.rollback()
+                    return None
+
+                if kind == 'deposit':
+                    matched = [(row[0], transfers[row[0]].amount, transfers[row[0]].tx_hash)
+                               for row in claimed if row[0] in transfers]
+                    expired = [row[0] for row in claimed if row[0] not in transfers and row[2]]
+                else:
+                    matched = [(row[0], transfers[row[0]].tx_hash)
+                               for row in claimed if row[0] in transfers and transfers[row[0]].amount == row[1]]
+                    expired = []
+
+                if matched:
+                    cur.execute(
+                        'SELECT chain_tx_hash FROM transactions WHERE chain_tx_hash = ANY(%s)',
+                        ([row[-1] for row in matched],)
+                    )
+                    used = {row[0] for row in cur.fetchall()}
+                    unique = []
+                    for row in matched:
+                        if row[-1] not in used:
+                            used.add(row[-1])
+                            unique.append(row)
+                    matched = unique
+
+                if matched and kind == 'deposit':
+                    cur.execute(LOCK_PLAYERS_SQL, ([row[0] for row in matched],))
+                    telegram_ids = [row[0] for row in execute_values(
+                        cur, SETTLE_DEPOSITS_SQL, matched, page_size=len(matched), fetch=True
+                    )]
+                elif matched:
+                    execute_values(cur, SETTLE_WITHDRAWALS_SQL, matched, page_size=len(matched))
+
+                if expired:
+                    cur.execute(
+                        "UPDATE transactions SET status = 'failed', settled_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+                        (expired,)
+                    )
+            conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
+        for telegram_id in telegram_ids:
+            get_player_cache().invalidate(telegram_id)
+
+        return {
+            'kind': kind,
+            'claimed': len(claimed),
+            'settled': len(matched),
+            'expired': len(expired),
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+            'last_id': claimed[-1][0]
+        }
+
+    def run(self, time_budget: float = None) -> dict:
+        """Проводит все найденные в сети переводы; при time_budget останавливается между пакетами"""
+        started = time.perf_counter()
+        deadline = time.monotonic() + time_budget if time_budget else None
+        transfers = self._transfers()
+        source_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        batches = []
+        for kind in ('deposit', 'withdrawal'):
+            after_id = 0
+            while not (deadline and time.monotonic() >= deadline):
+                batch = self._settle_batch(kind, transfers[kind], after_id)
+                if batch is None:
+                    break
+                after_id = batch.pop('last_id')
+                batches.append(batch)
+
+        elapsed = time.perf_counter() - started
+        settled = sum(batch['settled'] for batch in batches)
+        latencies = [batch['ms'] for batch in batches]
+        return {
+            'source_ms': source_ms,
+            'batches': batches,
+            'claimed': sum(batch['claimed'] for batch in batches),
+            'settled': settled,
+            'expired': sum(batch['expired'] for batch in batches),
+            'batch_p50_ms': _percentile(latencies, 0.50),
+            'batch_p95_ms': _percentile(latencies, 0.95),
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(settled / elapsed, 1) if elapsed else 0.0
+        }
+
+
+def run_parallel(workers: int, **options) -> list:
+    """Запускает несколько воркеров в потоках; каждый берёт свои строки через SKIP LOCKED, ошибка воркера пробрасывается"""
+    results = [None] * workers
+    errors = []
+
+    def target(index: int):
+        try:
+            results[index] = SettlementWorker(**options).run()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'run':
+        sys.exit('usage: python settlement.py run [workers]')
+    for result in run_parallel(int(sys.argv[2]) if len(sys.argv) > 2 else 1):
+        result.pop('batches')
+        print(result)
@@ -0,0 +1,200 @@
+-- Aggregates for the admin /stats dashboard, maintained by statement-level triggers
+-- in the same transaction as the writes. Rows are sharded by player_id % 16 so that
+-- concurrent flips of different players do not queue on a single counter row.
+CREATE TABLE IF NOT EXISTS stats_totals (
+    shard SMALLINT PRIMARY KEY,
+    players BIGINT NOT NULL DEFAULT 0,
+    balance DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    total_games BIGINT NOT NULL DEFAULT 0,
+    wins BIGINT NOT NULL DEFAULT 0,
+    deposits DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    withdrawals DECIMAL(28, 8) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_hourly (
+    bucket TIMESTAMP NOT NULL,
+    shard SMALLINT NOT NULL,
+    games BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (bucket, shard)
+);
+
+-- Transition tables are only visible to the trigger that declares them, so each
+-- operation gets its own branch instead of one query over new_rows and old_rows.
+CREATE OR REPLACE FUNCTION stats_players_changed() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE stats_totals s
+        SET players = s.players + d.players, balance = s.balance + d.balance,
+            total_games = s.total_games + d.total_games, wins = s.wins + d.wins
+        FROM (
+            SELECT id % 16 AS shard, COUNT(*) AS players, COALESCE(SUM(balance), 0) AS balance,
+                   COALESCE(SUM(total_games), 0) AS total_games, COALESCE(SUM(wins), 0) AS wins
+            FROM new_rows
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE stats_totals s
+        SET balance = s.balance + d.balance, total_games = s.total_games + d.total_games, wins = s.wins + d.wins
+        FROM (
+            SELECT n.id % 16 AS shard,
+                   SUM(COALESCE(n.balance, 0) - COALESCE(o.balance, 0)) AS balance,
+                   SUM(COALESCE(n.total_games, 0) - COALESCE(o.total_games, 0)) AS total_games,
+                   SUM(COALESCE(n.wins, 0) - COALESCE(o.wins, 0)) AS wins
+            FROM new_rows n
+            JOIN old_rows o ON o.id = n.id
+            WHERE n.balance IS DISTINCT FROM o.balance
+               OR n.total_games IS DISTINCT FROM o.total_games
+               OR n.wins IS DISTINCT FROM o.wins
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    ELSE
+        UPDATE stats_totals s
+        SET players = s.players - d.players, balance = s.balance - d.balance,
+            total_games = s.total_games - d.total_games, wins = s.wins - d.wins
+        FROM (
+            SELECT id % 16 AS shard, COUNT(*) AS players, COALESCE(SUM(balance), 0) AS balance,
+                   COALESCE(SUM(total_games), 0) AS total_games, COALESCE(SUM(wins), 0) AS wins
+            FROM old_rows
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_transactions_changed() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE stats_totals s
+        SET deposits = s.deposits + d.deposits, withdrawals = s.withdrawals + d.withdrawals
+        FROM (
+            SELECT player_id % 16 AS shard,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'deposit'), 0) AS deposits,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'withdrawal'), 0) AS withdrawals
+            FROM new_rows
+            WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    ELSIF TG_OP = 'UPDATE' THEN
+        UPDATE stats_totals s
+        SET deposits = s.deposits + d.deposits, withdrawals = s.withdrawals + d.withdrawals
+        FROM (
+            SELECT player_id % 16 AS shard,
+                   COALESCE(SUM(sign * amount) FILTER (WHERE type = 'deposit'), 0) AS deposits,
+                   COALESCE(SUM(sign * amount) FILTER (WHERE type = 'withdrawal'), 0) AS withdrawals
+            FROM (
+                SELECT 1 AS sign, player_id, type, amount, status FROM new_rows
+                UNION ALL
+                SELECT -1, player_id, type, amount, status FROM old_rows
+            ) changes
+            WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    ELSE
+        UPDATE stats_totals s
+        SET deposits = s.deposits - d.deposits, withdrawals = s.withdrawals - d.withdrawals
+        FROM (
+            SELECT player_id % 16 AS shard,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'deposit'), 0) AS deposits,
+                   COALESCE(SUM(amount) FILTER (WHERE type = 'withdrawal'), 0) AS withdrawals
+            FROM old_rows
+            WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+            GROUP BY 1
+        ) d
+        WHERE s.shard = d.shard;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_games_inserted() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO stats_hourly (bucket, shard, games)
+    SELECT date_trunc('hour', created_at), player_id % 16, COUNT(*)
+    FROM new_rows
+    GROUP BY 1, 2
+    ON CONFLICT (bucket, shard) DO UPDATE SET games = stats_hourly.games + EXCLUDED.games;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Recomputes both tables from players, games and transactions. Writers are blocked
+-- for the duration so the rebuilt totals match the raw tables exactly.
+CREATE OR REPLACE FUNCTION stats_rebuild() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE players, games, transactions IN SHARE MODE;
+
+    DELETE FROM stats_totals;
+    INSERT INTO stats_totals (shard) SELECT generate_series(0, 15);
+
+    UPDATE stats_totals s
+    SET players = d.players, balance = d.balance, total_games = d.total_games, wins = d.wins
+    FROM (
+        SELECT id % 16 AS shard, COUNT(*) AS players, COALESCE(SUM(balance), 0) AS balance,
+               COALESCE(SUM(total_games), 0) AS total_games, COALESCE(SUM(wins), 0) AS wins
+        FROM players
+        GROUP BY 1
+    ) d
+    WHERE s.shard = d.shard;
+
+    UPDATE stats_totals s
+    SET deposits = d.deposits, withdrawals = d.withdrawals
+    FROM (
+        SELECT player_id % 16 AS shard,
+               COALESCE(SUM(amount) FILTER (WHERE type = 'deposit'), 0) AS deposits,
+               COALESCE(SUM(amount) FILTER (WHERE type = 'withdrawal'), 0) AS withdrawals
+        FROM transactions
+        WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+        GROUP BY 1
+    ) d
+    WHERE s.shard = d.shard;
+
+    DELETE FROM stats_hourly;
+    INSERT INTO stats_hourly (bucket, shard, games)
+    SELECT date_trunc('hour', created_at), player_id % 16, COUNT(*)
+    FROM games
+    GROUP BY 1, 2;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stats_players_insert ON players;
+CREATE TRIGGER stats_players_insert AFTER INSERT ON players
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_players_changed();
+
+DROP TRIGGER IF EXISTS stats_players_update ON players;
+CREATE TRIGGER stats_players_update AFTER UPDATE ON players
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_players_changed();
+
+DROP TRIGGER IF EXISTS stats_players_delete ON players;
+CREATE TRIGGER stats_players_delete AFTER DELETE ON players
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_players_changed();
+
+DROP TRIGGER IF EXISTS stats_transactions_insert ON transactions;
+CREATE TRIGGER stats_transactions_insert AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_transactions_changed();
+
+DROP TRIGGER IF EXISTS stats_transactions_update ON transactions;
+CREATE TRIGGER stats_transactions_update AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_transactions_changed();
+
+DROP TRIGGER IF EXISTS stats_transactions_delete ON transactions;
+CREATE TRIGGER stats_transactions_delete AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_transactions_changed();
+
+DROP TRIGGER IF EXISTS stats_games_insert ON games;
+CREATE TRIGGER stats_games_insert AFTER INSERT ON games
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION stats_games_inserted();
+
+SELECT stats_rebuild();
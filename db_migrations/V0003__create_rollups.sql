@@ -0,0 +1,194 @@
+-- Per-minute/hour/day volume buckets derived from games and transactions.
+-- grain: 'm' minute, 'h' hour, 'd' day. Sharded by player_id % 16 like stats_totals.
+-- History is loaded by the backfill job in backend/bot/rollups.py; triggers keep it current.
+CREATE TABLE IF NOT EXISTS rollups (
+    grain CHAR(1) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    shard SMALLINT NOT NULL,
+    games BIGINT NOT NULL DEFAULT 0,
+    wagered DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    payouts DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    deposits DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    withdrawals DECIMAL(28, 8) NOT NULL DEFAULT 0,
+    PRIMARY KEY (grain, bucket, shard)
+);
+
+CREATE OR REPLACE FUNCTION rollups_games_inserted() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO rollups (grain, bucket, shard, games, wagered, payouts)
+    SELECT g.grain, date_trunc(g.unit, r.created_at), r.player_id % 16, COUNT(*), SUM(r.bet_amount), SUM(r.win_amount)
+    FROM new_rows r
+    CROSS JOIN (VALUES ('m', 'minute'), ('h', 'hour'), ('d', 'day')) AS g(grain, unit)
+    GROUP BY 1, 2, 3
+    ON CONFLICT (grain, bucket, shard) DO UPDATE
+    SET games = rollups.games + EXCLUDED.games,
+        wagered = rollups.wagered + EXCLUDED.wagered,
+        payouts = rollups.payouts + EXCLUDED.payouts;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollups_apply_transactions(changes JSONB) RETURNS VOID AS $$
+BEGIN
+    INSERT INTO rollups (grain, bucket, shard, deposits, withdrawals)
+    SELECT g.grain, date_trunc(g.unit, c.created_at), c.player_id % 16,
+           COALESCE(SUM(c.sign * c.amount) FILTER (WHERE c.type = 'deposit'), 0),
+           COALESCE(SUM(c.sign * c.amount) FILTER (WHERE c.type = 'withdrawal'), 0)
+    FROM jsonb_to_recordset(changes) AS c(sign INTEGER, player_id INTEGER, type VARCHAR, amount DECIMAL, created_at TIMESTAMP)
+    CROSS JOIN (VALUES ('m', 'minute'), ('h', 'hour'), ('d', 'day')) AS g(grain, unit)
+    GROUP BY 1, 2, 3
+    ON CONFLICT (grain, bucket, shard) DO UPDATE
+    SET deposits = rollups.deposits + EXCLUDED.deposits,
+        withdrawals = rollups.withdrawals + EXCLUDED.withdrawals;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Deposits and withdrawals count once they are completed, in the bucket of created_at.
+CREATE OR REPLACE FUNCTION rollups_transactions_changed() RETURNS TRIGGER AS $$
+DECLARE
+    changes JSONB;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT jsonb_agg(jsonb_build_object('sign', 1, 'player_id', player_id, 'type', type, 'amount', amount, 'created_at', created_at))
+        INTO changes
+        FROM new_rows
+        WHERE status = 'completed' AND type IN ('deposit', 'withdrawal');
+    ELSIF TG_OP = 'UPDATE' THEN
+        SELECT jsonb_agg(c) INTO changes
+        FROM (
+            SELECT jsonb_build_object('sign', 1, 'player_id', player_id, 'type', type, 'amount', amount, 'created_at', created_at) AS c
+            FROM new_rows
+            WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+            UNION ALL
+            SELECT jsonb_build_object('sign', -1, 'player_id', player_id, 'type', type, 'amount', amount, 'created_at', created_at)
+            FROM old_rows
+            WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+        ) both_sides;
+    ELSE
+        SELECT jsonb_agg(jsonb_build_object('sign', -1, 'player_id', player_id, 'type', type, 'amount', amount, 'created_at', created_at))
+        INTO changes
+        FROM old_rows
+        WHERE status = 'completed' AND type IN ('deposit', 'withdrawal');
+    END IF;
+
+    IF changes IS NOT NULL THEN
+        PERFORM rollups_apply_transactions(changes);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Totals over [window_start, window_end) from at most two minute runs, two hour runs
+-- and one day run per shard. Minute buckets are kept for 7 days and hour buckets for
+-- 90 days (see rollups_prune); older window edges are widened to the coarser grain.
+CREATE OR REPLACE FUNCTION rollup_window(window_start TIMESTAMP, window_end TIMESTAMP)
+RETURNS TABLE (games BIGINT, wagered DECIMAL, payouts DECIMAL, deposits DECIMAL, withdrawals DECIMAL) AS $$
+DECLARE
+    s TIMESTAMP := date_trunc('minute', window_start);
+    e TIMESTAMP := date_trunc('minute', window_end + INTERVAL '59.999999 seconds');
+    hs TIMESTAMP;
+    he TIMESTAMP;
+    ds TIMESTAMP;
+    de TIMESTAMP;
+BEGIN
+    IF s < LOCALTIMESTAMP - INTERVAL '90 days' THEN
+        s := date_trunc('day', s);
+    ELSIF s < LOCALTIMESTAMP - INTERVAL '7 days' THEN
+        s := date_trunc('hour', s);
+    END IF;
+    IF e < LOCALTIMESTAMP - INTERVAL '90 days' THEN
+        e := date_trunc('day', e + INTERVAL '23 hours 59 minutes');
+    ELSIF e < LOCALTIMESTAMP - INTERVAL '7 days' THEN
+        e := date_trunc('hour', e + INTERVAL '59 minutes');
+    END IF;
+
+    hs := date_trunc('hour', s + INTERVAL '59 minutes');
+    he := date_trunc('hour', e);
+    IF hs >= he THEN
+        hs := e;
+        he := e;
+    END IF;
+
+    ds := date_trunc('day', hs + INTERVAL '23 hours');
+    de := date_trunc('day', he);
+    IF ds >= de THEN
+        ds := he;
+        de := he;
+    END IF;
+
+    RETURN QUERY
+    SELECT COALESCE(SUM(r.games), 0)::BIGINT, COALESCE(SUM(r.wagered), 0), COALESCE(SUM(r.payouts), 0),
+           COALESCE(SUM(r.deposits), 0), COALESCE(SUM(r.withdrawals), 0)
+    FROM rollups r
+    WHERE (r.grain = 'm' AND ((r.bucket >= s AND r.bucket < hs) OR (r.bucket >= he AND r.bucket < e)))
+       OR (r.grain = 'h' AND ((r.bucket >= hs AND r.bucket < ds) OR (r.bucket >= de AND r.bucket < he)))
+       OR (r.grain = 'd' AND r.bucket >= ds AND r.bucket < de);
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION rollups_prune() RETURNS BIGINT AS $$
+DECLARE
+    removed BIGINT;
+BEGIN
+    DELETE FROM rollups
+    WHERE (grain = 'm' AND bucket < date_trunc('hour', LOCALTIMESTAMP - INTERVAL '7 days'))
+       OR (grain = 'h' AND bucket < date_trunc('day', LOCALTIMESTAMP - INTERVAL '90 days'));
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RETURN removed;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS stats_games_insert ON games;
+DROP FUNCTION IF EXISTS stats_games_inserted();
+DROP TABLE IF EXISTS stats_hourly;
+
+CREATE OR REPLACE FUNCTION stats_rebuild() RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE players, transactions IN SHARE MODE;
+
+    DELETE FROM stats_totals;
+    INSERT INTO stats_totals (shard) SELECT generate_series(0, 15);
+
+    UPDATE stats_totals s
+    SET players = d.players, balance = d.balance, total_games = d.total_games, wins = d.wins
+    FROM (
+        SELECT id % 16 AS shard, COUNT(*) AS players, COALESCE(SUM(balance), 0) AS balance,
+               COALESCE(SUM(total_games), 0) AS total_games, COALESCE(SUM(wins), 0) AS wins
+        FROM players
+        GROUP BY 1
+    ) d
+    WHERE s.shard = d.shard;
+
+    UPDATE stats_totals s
+    SET deposits = d.deposits, withdrawals = d.withdrawals
+    FROM (
+        SELECT player_id % 16 AS shard,
+               COALESCE(SUM(amount) FILTER (WHERE type = 'deposit'), 0) AS deposits,
+               COALESCE(SUM(amount) FILTER (WHERE type = 'withdrawal'), 0) AS withdrawals
+        FROM transactions
+        WHERE status = 'completed' AND type IN ('deposit', 'withdrawal')
+        GROUP BY 1
+    ) d
+    WHERE s.shard = d.shard;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS rollups_games_insert ON games;
+CREATE TRIGGER rollups_games_insert AFTER INSERT ON games
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollups_games_inserted();
+
+DROP TRIGGER IF EXISTS rollups_transactions_insert ON transactions;
+CREATE TRIGGER rollups_transactions_insert AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollups_transactions_changed();
+
+DROP TRIGGER IF EXISTS rollups_transactions_update ON transactions;
+CREATE TRIGGER rollups_transactions_update AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollups_transactions_changed();
+
+DROP TRIGGER IF EXISTS rollups_transactions_delete ON transactions;
+CREATE TRIGGER rollups_transactions_delete AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollups_transactions_changed();
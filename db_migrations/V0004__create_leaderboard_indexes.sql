@@ -0,0 +1,6 @@
+-- Index-backed leaderboards: every board page is an index scan instead of a full sort of players.
+-- The win-rate index is partial; queries must use the same expression and minimum of 20 games.
+CREATE INDEX IF NOT EXISTS idx_players_balance ON players (balance DESC, id);
+CREATE INDEX IF NOT EXISTS idx_players_total_winnings ON players (total_winnings DESC, id);
+CREATE INDEX IF NOT EXISTS idx_players_win_rate ON players ((wins::DECIMAL / total_games) DESC, id)
+    WHERE total_games >= 20;
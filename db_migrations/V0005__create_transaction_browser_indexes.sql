@@ -0,0 +1,9 @@
+-- Keyset pagination over transactions by (created_at, id), unfiltered and per filter.
+-- The single-column player_id and status indexes are prefixes of the new ones.
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_type_created_at ON transactions (type, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_status_created_at ON transactions (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_transactions_player_created_at ON transactions (player_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_transactions_player_id;
+DROP INDEX IF EXISTS idx_transactions_status;
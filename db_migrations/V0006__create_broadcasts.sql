@@ -0,0 +1,19 @@
+-- Admin broadcasts to all players. last_player_id is the resume point: recipients are
+-- streamed in players.id order and progress is committed after every chunk.
+-- locked_until is a lease so that only one invocation sends a given broadcast at a time.
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id SERIAL PRIMARY KEY,
+    text TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    last_player_id INTEGER NOT NULL DEFAULT 0,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    send_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    created_by BIGINT,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts(status);
@@ -0,0 +1,59 @@
+-- Provably fair coin flips. Each player has an active server seed (only its SHA-256 is
+-- shown until rotation), a client seed they may choose and a nonce that increases by one
+-- per game. The result of game N is heads when the first byte of
+-- HMAC-SHA256(key = server_seed, message = client_seed || ':' || N) is below 128.
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS fair_seeds (
+    player_id INTEGER PRIMARY KEY,
+    server_seed VARCHAR(64) NOT NULL,
+    server_seed_hash VARCHAR(64) NOT NULL,
+    client_seed VARCHAR(64) NOT NULL,
+    nonce BIGINT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Seeds that were rotated out; games are matched to them by (player_id, server_seed_hash).
+CREATE TABLE IF NOT EXISTS fair_seed_reveals (
+    id SERIAL PRIMARY KEY,
+    player_id INTEGER NOT NULL,
+    server_seed VARCHAR(64) NOT NULL,
+    server_seed_hash VARCHAR(64) NOT NULL,
+    client_seed VARCHAR(64) NOT NULL,
+    last_nonce BIGINT NOT NULL,
+    created_at TIMESTAMP,
+    revealed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_fair_seed_reveals_player_id ON fair_seed_reveals(player_id, id DESC);
+
+ALTER TABLE games ADD COLUMN IF NOT EXISTS server_seed_hash VARCHAR(64);
+ALTER TABLE games ADD COLUMN IF NOT EXISTS nonce BIGINT;
+
+-- The seed is generated in a CTE so that gen_random_bytes runs once per player row.
+CREATE OR REPLACE FUNCTION fair_seeds_players_inserted() RETURNS TRIGGER AS $$
+BEGIN
+    WITH seeds AS (
+        SELECT id, encode(gen_random_bytes(32), 'hex') AS server_seed, encode(gen_random_bytes(8), 'hex') AS client_seed
+        FROM new_rows
+    )
+    INSERT INTO fair_seeds (player_id, server_seed, server_seed_hash, client_seed)
+    SELECT id, server_seed, encode(digest(server_seed, 'sha256'), 'hex'), client_seed FROM seeds
+    ON CONFLICT (player_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS fair_seeds_players_inserted ON players;
+CREATE TRIGGER fair_seeds_players_inserted
+    AFTER INSERT ON players
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION fair_seeds_players_inserted();
+
+WITH seeds AS (
+    SELECT id, encode(gen_random_bytes(32), 'hex') AS server_seed, encode(gen_random_bytes(8), 'hex') AS client_seed
+    FROM players
+)
+INSERT INTO fair_seeds (player_id, server_seed, server_seed_hash, client_seed)
+SELECT id, server_seed, encode(digest(server_seed, 'sha256'), 'hex'), client_seed FROM seeds
+ON CONFLICT (player_id) DO NOTHING;
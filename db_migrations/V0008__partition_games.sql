@@ -0,0 +1,96 @@
+-- Monthly range partitioning of games by created_at.
+-- Existing rows are not rewritten: the old table is attached as the partition games_legacy
+-- covering everything before the current month, and only the current month's rows are moved
+-- into their monthly partition. Monthly partitions are named games_pYYYY_MM and are created
+-- ahead of time by games_ensure_partitions(); games_default only catches rows outside them.
+-- Old partitions are detached and exported by backend/archive (tracked in games_archives).
+ALTER TABLE games RENAME TO games_legacy;
+ALTER TABLE games_legacy RENAME CONSTRAINT games_pkey TO games_legacy_pkey;
+ALTER INDEX idx_games_player_id RENAME TO games_legacy_player_id_idx;
+ALTER INDEX idx_games_created_at RENAME TO games_legacy_created_at_idx;
+DROP TRIGGER IF EXISTS rollups_games_insert ON games_legacy;
+
+CREATE TABLE games (
+    id INTEGER NOT NULL DEFAULT nextval('games_id_seq'),
+    player_id INTEGER NOT NULL,
+    bet_amount DECIMAL(18, 8) NOT NULL,
+    selected_side VARCHAR(10) NOT NULL,
+    result_side VARCHAR(10) NOT NULL,
+    won BOOLEAN NOT NULL,
+    win_amount DECIMAL(18, 8) DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    server_seed_hash VARCHAR(64),
+    nonce BIGINT,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE games_id_seq OWNED BY games.id;
+
+CREATE TABLE IF NOT EXISTS games_default PARTITION OF games DEFAULT;
+
+CREATE OR REPLACE FUNCTION games_ensure_partitions(months_ahead INTEGER DEFAULT 3) RETURNS INTEGER AS $$
+DECLARE
+    month_start TIMESTAMP;
+    created INTEGER := 0;
+BEGIN
+    FOR month_start IN
+        SELECT generate_series(
+            date_trunc('month', LOCALTIMESTAMP),
+            date_trunc('month', LOCALTIMESTAMP) + make_interval(months => months_ahead),
+            INTERVAL '1 month'
+        )
+    LOOP
+        IF to_regclass('games_p' || to_char(month_start, 'YYYY_MM')) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF games FOR VALUES FROM (%L) TO (%L)',
+                'games_p' || to_char(month_start, 'YYYY_MM'), month_start, month_start + INTERVAL '1 month'
+            );
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT games_ensure_partitions(3);
+
+INSERT INTO games (id, player_id, bet_amount, selected_side, result_side, won, win_amount, created_at, server_seed_hash, nonce)
+SELECT id, player_id, bet_amount, selected_side, result_side, won, win_amount, created_at, server_seed_hash, nonce
+FROM games_legacy
+WHERE created_at >= date_trunc('month', LOCALTIMESTAMP);
+
+DELETE FROM games_legacy WHERE created_at >= date_trunc('month', LOCALTIMESTAMP);
+
+ALTER TABLE games_legacy ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE games_legacy ALTER COLUMN id DROP DEFAULT;
+ALTER TABLE games_legacy DROP CONSTRAINT games_legacy_pkey;
+
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE games ATTACH PARTITION games_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+        date_trunc('month', LOCALTIMESTAMP)
+    );
+END;
+$$;
+
+-- Equivalent indexes that already exist on games_legacy are attached instead of rebuilt.
+CREATE INDEX IF NOT EXISTS idx_games_player_id ON games(player_id);
+CREATE INDEX IF NOT EXISTS idx_games_created_at ON games(created_at);
+
+CREATE TRIGGER rollups_games_insert AFTER INSERT ON games
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION rollups_games_inserted();
+
+-- status: 'detached' once the partition left games, 'archived' after the file is stored
+-- and the table dropped. A 'detached' row is resumed by the next archive run.
+CREATE TABLE IF NOT EXISTS games_archives (
+    partition_name VARCHAR(63) PRIMARY KEY,
+    range_end TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'detached',
+    rows BIGINT,
+    bytes BIGINT,
+    location TEXT,
+    detached_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    archived_at TIMESTAMP
+);
@@ -0,0 +1,131 @@
+-- Double-entry ledger. Every balance change is a ledger transaction (txn_id) of two or more
+-- immutable entries whose amounts sum to zero. account_id is the player id, or one of the
+-- system accounts:
+--   -1 house                (stakes in, payouts out)
+--   -2 external             (TON side: deposits in, settled withdrawals out)
+--   -3 equity               (opening balances and sign-up bonuses)
+--   -4 pending withdrawals  (requested, not yet settled)
+-- players.balance stays as the row-locked projection used by play; balances are derived
+-- from ledger_snapshot_balances plus the entries after the snapshot (ledger_balance) and
+-- checked against players by backend/bot/ledger.py verify.
+CREATE SEQUENCE IF NOT EXISTS ledger_txn_seq;
+
+CREATE TABLE IF NOT EXISTS ledger_entries (
+    id BIGSERIAL PRIMARY KEY,
+    txn_id BIGINT NOT NULL,
+    account_id INTEGER NOT NULL,
+    amount DECIMAL(18, 8) NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    reference_id INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_account_id ON ledger_entries(account_id, id);
+CREATE INDEX IF NOT EXISTS idx_ledger_entries_txn_id ON ledger_entries(txn_id);
+
+CREATE OR REPLACE FUNCTION ledger_entries_immutable() RETURNS TRIGGER AS $$
+BEGIN
+    RAISE EXCEPTION 'ledger_entries is append-only';
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ledger_entries_immutable ON ledger_entries;
+CREATE TRIGGER ledger_entries_immutable BEFORE UPDATE OR DELETE ON ledger_entries
+    FOR EACH STATEMENT EXECUTE FUNCTION ledger_entries_immutable();
+
+-- All legs of a ledger transaction are written by one statement, so the balance check
+-- only needs that statement's rows.
+CREATE OR REPLACE FUNCTION ledger_entries_balanced() RETURNS TRIGGER AS $$
+DECLARE
+    unbalanced BIGINT;
+BEGIN
+    SELECT txn_id INTO unbalanced FROM new_rows GROUP BY txn_id HAVING SUM(amount) <> 0 LIMIT 1;
+    IF unbalanced IS NOT NULL THEN
+        RAISE EXCEPTION 'ledger transaction % does not balance', unbalanced;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ledger_entries_balanced ON ledger_entries;
+CREATE TRIGGER ledger_entries_balanced AFTER INSERT ON ledger_entries
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION ledger_entries_balanced();
+
+CREATE TABLE IF NOT EXISTS ledger_snapshots (
+    id SERIAL PRIMARY KEY,
+    last_entry_id BIGINT NOT NULL,
+    entries BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ledger_snapshot_balances (
+    snapshot_id INTEGER NOT NULL,
+    account_id INTEGER NOT NULL,
+    balance DECIMAL(28, 8) NOT NULL,
+    PRIMARY KEY (snapshot_id, account_id)
+);
+
+-- Incremental: the previous snapshot plus the entries since it. SHARE mode waits for
+-- in-flight writers, so every entry up to last_entry_id is committed and none can appear
+-- below it later; writers are blocked only while the tail is summed.
+CREATE OR REPLACE FUNCTION ledger_take_snapshot(keep INTEGER DEFAULT 3) RETURNS INTEGER AS $$
+DECLARE
+    previous_id INTEGER;
+    previous_last BIGINT := 0;
+    upto BIGINT;
+    new_snapshot_id INTEGER;
+BEGIN
+    LOCK TABLE ledger_entries IN SHARE MODE;
+    SELECT id, last_entry_id INTO previous_id, previous_last FROM ledger_snapshots ORDER BY id DESC LIMIT 1;
+    previous_last := COALESCE(previous_last, 0);
+    SELECT COALESCE(MAX(id), 0) INTO upto FROM ledger_entries;
+
+    INSERT INTO ledger_snapshots (last_entry_id, entries)
+    VALUES (upto, (SELECT COUNT(*) FROM ledger_entries WHERE id > previous_last AND id <= upto))
+    RETURNING id INTO new_snapshot_id;
+
+    INSERT INTO ledger_snapshot_balances (snapshot_id, account_id, balance)
+    SELECT new_snapshot_id, account_id, SUM(balance)
+    FROM (
+        SELECT account_id, balance FROM ledger_snapshot_balances WHERE snapshot_id = previous_id
+        UNION ALL
+        SELECT account_id, amount FROM ledger_entries WHERE id > previous_last AND id <= upto
+    ) s
+    GROUP BY account_id;
+
+    DELETE FROM ledger_snapshot_balances
+    WHERE snapshot_id IN (SELECT id FROM ledger_snapshots ORDER BY id DESC OFFSET keep);
+    DELETE FROM ledger_snapshots WHERE id IN (SELECT id FROM ledger_snapshots ORDER BY id DESC OFFSET keep);
+    RETURN new_snapshot_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION ledger_balance(account INTEGER) RETURNS DECIMAL AS $$
+    WITH latest AS (
+        SELECT id, last_entry_id FROM ledger_snapshots ORDER BY id DESC LIMIT 1
+    )
+    SELECT COALESCE((
+        SELECT b.balance FROM ledger_snapshot_balances b, latest
+        WHERE b.snapshot_id = latest.id AND b.account_id = account
+    ), 0) + COALESCE((
+        SELECT SUM(e.amount) FROM ledger_entries e
+        WHERE e.account_id = account AND e.id > COALESCE((SELECT last_entry_id FROM latest), 0)
+    ), 0);
+$$ LANGUAGE sql STABLE;
+
+-- Opening balances of existing players and of withdrawals still pending, as one ledger
+-- transaction against equity.
+WITH balances AS (
+    SELECT id AS account_id, balance AS amount FROM players WHERE balance <> 0
+    UNION ALL
+    SELECT -4, SUM(amount) FROM transactions
+    WHERE type = 'withdrawal' AND status = 'pending'
+    HAVING SUM(amount) <> 0
+), opening AS (
+    SELECT nextval('ledger_txn_seq') AS txn_id FROM (SELECT 1 FROM balances LIMIT 1) AS any_balance
+)
+INSERT INTO ledger_entries (txn_id, account_id, amount, kind)
+SELECT opening.txn_id, account_id, amount, 'opening' FROM opening, balances
+UNION ALL
+SELECT opening.txn_id, -3, -SUM(amount), 'opening' FROM opening, balances GROUP BY opening.txn_id;
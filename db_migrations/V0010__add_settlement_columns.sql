@@ -0,0 +1,11 @@
+-- Settlement of deposits and withdrawals against TON transfers (backend/settlement).
+-- chain_tx_hash is unique so that one on-chain transfer can settle at most one row,
+-- whichever worker sees it first.
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS chain_tx_hash VARCHAR(128);
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS settled_at TIMESTAMP;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_chain_tx_hash ON transactions(chain_tx_hash)
+    WHERE chain_tx_hash IS NOT NULL;
+
+-- The claim queue: workers walk pending rows of one type in id order with SKIP LOCKED.
+CREATE INDEX IF NOT EXISTS idx_transactions_pending ON transactions(type, id) WHERE status = 'pending';
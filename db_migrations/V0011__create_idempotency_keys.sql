@@ -0,0 +1,12 @@
+-- Client-supplied request ids for play, play_many, create_deposit and create_withdrawal.
+-- A retry with the same (player_id, request_id) gets the stored response instead of running
+-- the action again. Only the primary key is maintained on the hot path; expired rows are
+-- removed by the archive function in batches (a sequential scan over roughly one TTL of keys).
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    player_id INTEGER NOT NULL,
+    request_id VARCHAR(64) NOT NULL,
+    action VARCHAR(20) NOT NULL,
+    response JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (player_id, request_id)
+);
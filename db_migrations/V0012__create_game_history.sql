@@ -0,0 +1,15 @@
+-- Per-player game history for the get_history action.
+-- The covering index serves both the keyset page, ordered by (created_at DESC, id DESC), and the
+-- window aggregates as index-only scans without a sort. It replaces idx_games_player_id, which
+-- needed a heap fetch per row and a sort on created_at; queries filtering only by player_id use
+-- its leading column. Created on the partitioned parent, it is built on every partition,
+-- games_legacy included.
+CREATE INDEX IF NOT EXISTS idx_games_player_history ON games (player_id, created_at DESC, id DESC)
+    INCLUDE (bet_amount, selected_side, result_side, won, win_amount, nonce);
+DROP INDEX IF EXISTS idx_games_player_id;
+
+-- Streaks are maintained by play and play_many in the same UPDATE as the balance.
+-- current_streak > 0 counts consecutive wins, < 0 consecutive losses. Existing players are not
+-- backfilled: their streaks start counting from this migration.
+ALTER TABLE players ADD COLUMN IF NOT EXISTS current_streak INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE players ADD COLUMN IF NOT EXISTS best_win_streak INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,8 @@
+-- Resumable archive exports (backend/archive). A detached partition is exported in parts of
+-- ARCHIVE_PART_ROWS rows ordered by (created_at, id). Each stored part advances the key below,
+-- so games_legacy, which can hold years of games, is exported over several invocations
+-- instead of one. rows and bytes now accumulate per part; the table is dropped only after
+-- the last part is stored and the archived row count matches the table.
+ALTER TABLE games_archives ADD COLUMN IF NOT EXISTS parts INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE games_archives ADD COLUMN IF NOT EXISTS last_created_at TIMESTAMP;
+ALTER TABLE games_archives ADD COLUMN IF NOT EXISTS last_id INTEGER;
@@ -0,0 +1,54 @@
+-- ledger_take_snapshot without LOCK TABLE. The SHARE lock of V0009 queued every play,
+-- deposit and withdrawal behind the snapshot while the tail was summed.
+--
+-- The snapshot is still bounded by an entry id (upto), but upto alone is not enough: an entry
+-- with a lower id can belong to a transaction that has not committed yet and would be missed
+-- by this snapshot and skipped by the next one. So upto is read from the id sequence first.
+-- Then the function waits for every transaction that held ROW EXCLUSIVE on ledger_entries at
+-- that moment. A writer takes that lock before its INSERT draws an id, so each id <= upto
+-- was drawn by one of those transactions and is committed (or rolled back) once they end.
+-- Writers are never blocked; the snapshot waits only for inserts that were already running.
+CREATE OR REPLACE FUNCTION ledger_take_snapshot(keep INTEGER DEFAULT 3) RETURNS INTEGER AS $$
+DECLARE
+    previous_id INTEGER;
+    previous_last BIGINT := 0;
+    upto BIGINT;
+    writers TEXT[];
+    deadline TIMESTAMPTZ := clock_timestamp() + INTERVAL '30 seconds';
+    new_snapshot_id INTEGER;
+BEGIN
+    upto := COALESCE(pg_sequence_last_value(pg_get_serial_sequence('ledger_entries', 'id')::regclass), 0);
+    SELECT array_agg(virtualtransaction) INTO writers FROM pg_locks
+    WHERE relation = 'ledger_entries'::regclass AND mode = 'RowExclusiveLock' AND granted
+        AND pid IS DISTINCT FROM pg_backend_pid();
+
+    WHILE EXISTS (SELECT 1 FROM pg_locks WHERE virtualtransaction = ANY(writers)) LOOP
+        IF clock_timestamp() > deadline THEN
+            RAISE EXCEPTION 'ledger writers still running after 30 seconds';
+        END IF;
+        PERFORM pg_sleep(0.01);
+    END LOOP;
+
+    SELECT id, last_entry_id INTO previous_id, previous_last FROM ledger_snapshots ORDER BY id DESC LIMIT 1;
+    previous_last := COALESCE(previous_last, 0);
+    upto := GREATEST(upto, previous_last);
+
+    INSERT INTO ledger_snapshots (last_entry_id, entries)
+    VALUES (upto, (SELECT COUNT(*) FROM ledger_entries WHERE id > previous_last AND id <= upto))
+    RETURNING id INTO new_snapshot_id;
+
+    INSERT INTO ledger_snapshot_balances (snapshot_id, account_id, balance)
+    SELECT new_snapshot_id, account_id, SUM(balance)
+    FROM (
+        SELECT account_id, balance FROM ledger_snapshot_balances WHERE snapshot_id = previous_id
+        UNION ALL
+        SELECT account_id, amount FROM ledger_entries WHERE id > previous_last AND id <= upto
+    ) s
+    GROUP BY account_id;
+
+    DELETE FROM ledger_snapshot_balances
+    WHERE snapshot_id IN (SELECT id FROM ledger_snapshots ORDER BY id DESC OFFSET keep);
+    DELETE FROM ledger_snapshots WHERE id IN (SELECT id FROM ledger_snapshots ORDER BY id DESC OFFSET keep);
+    RETURN new_snapshot_id;
+END;
+$$ LANGUAGE plpgsql;
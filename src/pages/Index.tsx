@@ -7,6 +7,48 @@ import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
 
 const GAME_API = 'https://functions.poehali.dev/916c4eac-fecb-4f01-a7f5-c151543ae44f';
+const MONEY_RETRIES = 2;
+const HISTORY_PAGE_SIZE = 20;
+
+type HistoryGame = {
+  id: number;
+  created_at: string;
+  bet_amount: string;
+  selected_side: 'heads' | 'tails';
+  result_side: 'heads' | 'tails';
+  won: boolean;
+  win_amount: string;
+};
+
+type HistorySummary = {
+  current_streak: number;
+  best_win_streak: number;
+  windows: Record<'24h' | '7d' | '30d', { games: number; wagered: string; net: string }>;
+};
+
+const postMoneyAction = async (body: Record<string, unknown>) => {
+  const payload = JSON.stringify({ ...body, request_id: crypto.randomUUID() });
+  let lastError: unknown;
+
+  for (let attempt = 0; attempt <= MONEY_RETRIES; attempt++) {
+    try {
+      const response = await fetch(GAME_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: payload
+      });
+
+      if (response.status < 500) {
+        return response.json();
+      }
+      lastError = new Error(`HTTP ${response.status}`);
+    } catch (error) {
+      lastError = error;
+    }
+  }
+
+  throw lastError;
+};
 
 const Index = () => {
   const [playerId, setPlayerId] = useState<number | null>(null);
@@ -22,6 +64,39 @@ const Index = () => {
   const [depositAmount, setDepositAmount] = useState('');
   const [withdrawAmount, setWithdrawAmount] = useState('');
   const [withdrawAddress, setWithdrawAddress] = useState('');
+  const [history, setHistory] = useState<HistoryGame[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [historySummary, setHistorySummary] = useState<HistorySummary | null>(null);
+
+  const loadHistory = async (cursor: string | null = null) => {
+    if (!playerId) return;
+
+    try {
+      const response = await fetch(GAME_API, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          action: 'get_history',
+          player_id: playerId,
+          limit: HISTORY_PAGE_SIZE,
+          ...(cursor ? { cursor } : {})
+        })
+      });
+
+      const data = await response.json();
+      if (data.error) return;
+
+      setHistory((previous) => (cursor ? [...previous, ...data.games] : data.games));
+      setHistoryCursor(data.next_cursor);
+      setHistorySummary(data.summary);
+    } catch (error) {
+      console.error('Failed to load history:', error);
+    }
+  };
+
+  useEffect(() => {
+    loadHistory();
+  }, [playerId, totalGames]);
 
   useEffect(() => {
     const initPlayer = async () => {
@@ -41,10 +116,10 @@ const Index = () => {
         
         const data = await response.json();
         setPlayerId(data.player_id);
-        setBalance(data.balance);
+        setBalance(Number(data.balance));
         setTotalGames(data.total_games);
         setWins(data.wins);
-        setTotalWinnings(data.total_winnings);
+        setTotalWinnings(Number(data.total_winnings));
       } catch (error) {
         console.error('Failed to init player:', error);
         toast.error('Ошибка подключения');
@@ -73,26 +148,26 @@ const Index = () => {
     setIsFlipping(true);
     
     try {
-      const response = await fetch(GAME_API, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          action: 'play',
-          player_id: playerId,
-          bet_amount: betAmount,
-          selected_side: selectedSide
-        })
+      const data = await postMoneyAction({
+        action: 'play',
+        player_id: playerId,
+        bet_amount: betAmount,
+        selected_side: selectedSide
       });
       
-      const data = await response.json();
+      if (data.error) {
+        setIsFlipping(false);
+        toast.error(data.error);
+        return;
+      }
       
       setTimeout(() => {
         setLastResult(data.result_side);
         setIsFlipping(false);
-        setBalance(data.balance);
+        setBalance(Number(data.balance));
         setTotalGames(data.total_games);
         setWins(data.wins);
-        setTotalWinnings(data.total_winnings);
+        setTotalWinnings(Number(data.total_winnings));
         
         if (data.won) {
           toast.success(`Вы выиграли ${data.win_amount} TON!`);
@@ -115,23 +190,20 @@ const Index = () => {
     }
     
     try {
-      const response = await fetch(GAME_API, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          action: 'create_deposit',
-          player_id: playerId,
-          amount: Number(depositAmount)
-        })
-      });
-      
-      const data = await response.json();
-      
-      toast.success('Инструкция создана!', {
-        description: `Отправьте ${data.amount} TON на адрес:\n${data.ton_wallet}\nС memo: ${data.memo}`
+      const data = await postMoneyAction({
+        action: 'create_deposit',
+        player_id: playerId,
+        amount: Number(depositAmount)
       });
       
-      setDepositAmount('');
+      if (data.error) {
+        toast.error(data.error);
+      } else {
+        toast.success('Инструкция создана!', {
+          description: `Отправьте ${data.amount} TON на адрес:\n${data.ton_wallet}\nС memo: ${data.memo}`
+        });
+        setDepositAmount('');
+      }
     } catch (error) {
       toast.error('Ошибка создания депозита');
     }
@@ -144,19 +216,13 @@ const Index = () => {
     }
     
     try {
-      const response = await fetch(GAME_API, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          action: 'create_withdrawal',
-          player_id: playerId,
-          amount: Number(withdrawAmount),
-          ton_address: withdrawAddress
-        })
+      const data = await postMoneyAction({
+        action: 'create_withdrawal',
+        player_id: playerId,
+        amount: Number(withdrawAmount),
+        ton_address: withdrawAddress
       });
       
-      const data = await response.json();
-      
       if (data.error) {
         toast.error(data.error);
       } else {
@@ -415,8 +481,65 @@ const Index = () => {
                     <span className="text-muted-foreground">Средняя ставка:</span>
                     <span className="font-semibold">{totalGames > 0 ? (totalWinnings / totalGames / 2).toFixed(2) : '0.00'} TON</span>
                   </div>
+                  {historySummary && (
+                    <>
+                      <div className="flex justify-between items-center">
+                        <span className="text-muted-foreground">Текущая серия:</span>
+                        <span className="font-semibold">
+                          {historySummary.current_streak > 0
+                            ? `${historySummary.current_streak} побед`
+                            : historySummary.current_streak < 0
+                              ? `${-historySummary.current_streak} поражений`
+                              : '—'}
+                        </span>
+                      </div>
+                      <div className="flex justify-between items-center">
+                        <span className="text-muted-foreground">Лучшая серия побед:</span>
+                        <span className="font-semibold">{historySummary.best_win_streak}</span>
+                      </div>
+                      <div className="flex justify-between items-center">
+                        <span className="text-muted-foreground">Итог за 24ч / 7д:</span>
+                        <span className="font-semibold">
+                          {Number(historySummary.windows['24h'].net).toFixed(2)} / {Number(historySummary.windows['7d'].net).toFixed(2)} TON
+                        </span>
+                      </div>
+                    </>
+                  )}
                 </div>
               </Card>
+
+              <Card className="p-6 bg-muted border-border mt-6">
+                <h3 className="text-lg font-semibold mb-4 flex items-center gap-2">
+                  <Icon name="History" size={20} className="text-primary" />
+                  История игр
+                </h3>
+                {history.length === 0 ? (
+                  <div className="text-center py-8 text-muted-foreground">
+                    <Icon name="FileText" size={48} className="mx-auto mb-3 opacity-50" />
+                    <p>Игр пока нет</p>
+                  </div>
+                ) : (
+                  <div className="space-y-2">
+                    {history.map((game) => (
+                      <div key={game.id} className="flex justify-between items-center text-sm">
+                        <span className="text-muted-foreground">
+                          {new Date(game.created_at).toLocaleString()} · {game.selected_side === 'heads' ? '🪙' : '💎'} → {game.result_side === 'heads' ? '🪙' : '💎'}
+                        </span>
+                        <span className={`font-semibold ${game.won ? 'text-primary' : 'text-muted-foreground'}`}>
+                          {game.won
+                            ? `+${(Number(game.win_amount) - Number(game.bet_amount)).toFixed(2)}`
+                            : `-${Number(game.bet_amount).toFixed(2)}`} TON
+                        </span>
+                      </div>
+                    ))}
+                    {historyCursor && (
+                      <Button variant="outline" className="w-full mt-2" onClick={() => loadHistory(historyCursor)}>
+                        Показать ещё
+                      </Button>
+                    )}
+                  </div>
+                )}
+              </Card>
             </Card>
           </TabsContent>
         </Tabs>
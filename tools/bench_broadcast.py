@@ -0,0 +1,76 @@
+"""Прогон движка рассылок против заглушки Bot API и локального Postgres
+
+Проверяет, что после прерывания по time_budget и «холодного» продолжения каждый игрок
+получил сообщение ровно один раз, и печатает фактическую скорость отправки:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_broadcast.py --players 2000 --rate 200
+"""
+import argparse
+import os
+from collections import Counter
+
+import psycopg2
+
+from fake_telegram import FakeTelegram
+from functions import Timer, load_function
+
+TELEGRAM_ID_BASE = 7_000_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200.0)
+    parser.add_argument('--latency-ms', type=float, default=30.0)
+    parser.add_argument('--rate-limit-every', type=int, default=50)
+    parser.add_argument('--first-budget', type=float, default=2.0)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency=args.latency_ms / 1000, rate_limit_every=args.rate_limit_every, retry_after=0)
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['TELEGRAM_BOT_TOKEN'] = 'bench'
+    os.environ['TELEGRAM_API_URL'] = fake.start()
+    os.environ['TELEGRAM_MAX_WORKERS'] = '16'
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM players')
+    existing = cur.fetchone()[0]
+    cur.execute(
+        "INSERT INTO players (telegram_id, username) SELECT %s + g, 'bcast' || g FROM generate_series(1, %s) g "
+        "ON CONFLICT (telegram_id) DO NOTHING",
+        (TELEGRAM_ID_BASE, args.players)
+    )
+
+    try:
+        bot = load_function('bot')
+        engine = bot.BroadcastEngine(rate=args.rate)
+        broadcast_id = engine.create('bench broadcast')
+        with Timer() as first:
+            progress = engine.run(broadcast_id, time_budget=args.first_budget)
+        print({'phase': 'interrupted', 'seconds': round(first.elapsed, 2), **progress})
+
+        resumed = bot.BroadcastEngine(rate=args.rate)
+        with Timer() as second:
+            progress = resumed.run(broadcast_id)
+        print({'phase': 'resumed', 'seconds': round(second.elapsed, 2), **progress})
+
+        deliveries = Counter(params['chat_id'] for params in fake.methods('sendMessage'))
+        print({
+            'recipients': existing + args.players,
+            'delivered_chats': len(deliveries),
+            'duplicates': sum(count - 1 for count in deliveries.values() if count > 1),
+            'rate_limited_responses': fake.rejected,
+            'overall_messages_per_sec': round(len(deliveries) / (first.elapsed + second.elapsed), 1)
+        })
+    finally:
+        cur.execute('DELETE FROM broadcasts WHERE text = %s', ('bench broadcast',))
+        cur.execute('DELETE FROM players WHERE telegram_id > %s AND telegram_id <= %s',
+                    (TELEGRAM_ID_BASE, TELEGRAM_ID_BASE + args.players))
+        conn.close()
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
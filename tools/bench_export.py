@@ -0,0 +1,79 @@
+"""Замер выгрузки export.run: строки в секунду и память на большой таблице
+
+Части уходят в заглушку Bot API; каждая проверяется (распаковка, число строк) и сразу
+выбрасывается, так что пик памяти процесса — это память самой выгрузки:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_export.py --table games --format csv --part-mb 10
+"""
+import argparse
+import gzip
+import os
+import resource
+import time
+
+from fake_telegram import FakeTelegram
+from functions import load_function
+
+
+def part_rows(raw: bytes, fmt: str) -> int:
+    """Строки данных в части: multipart-тело -> gzip -> строки без заголовка CSV"""
+    start = raw.index(b'\r\n\r\n', raw.index(b'filename=')) + 4
+    payload = raw[start:raw.rindex(b'\r\n--')]
+    lines = gzip.decompress(payload).count(b'\n')
+    return lines - 1 if fmt == 'csv' else lines
+
+
+def max_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--table', default='games', choices=('players', 'games', 'transactions'))
+    parser.add_argument('--format', default='csv', choices=('csv', 'jsonl'))
+    parser.add_argument('--part-mb', type=float, default=45.0)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--time-budget', type=float, default=0.0, help='0 — без ограничения')
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    os.environ.update({'DATABASE_URL': args.dsn, 'TELEGRAM_BOT_TOKEN': 'test', 'TELEGRAM_API_URL': fake.start()})
+    bot = load_function('bot')
+    client = bot.get_client()
+    delivered = []
+
+    def deliver(path: str, filename: str, caption: str):
+        client.send_document(1, path, filename, caption)
+        raw = fake.documents.pop()
+        delivered.append({'filename': filename, 'bytes': os.path.getsize(path), 'rows': part_rows(raw, args.format)})
+        print({'part': filename, 'caption': caption, 'max_rss_mb': max_rss_mb()})
+
+    rss_before = max_rss_mb()
+    started = time.monotonic()
+    try:
+        result = bot.export.run(
+            bot.get_pool(),
+            args.table,
+            args.format,
+            deliver,
+            time_budget=args.time_budget or None,
+            part_bytes=int(args.part_mb * 1024 * 1024),
+            chunk_size=args.chunk_size
+        )
+    finally:
+        fake.stop()
+
+    result.update({
+        'wall_seconds': round(time.monotonic() - started, 3),
+        'rows_in_parts': sum(part['rows'] for part in delivered),
+        'largest_part_mb': round(max((part['bytes'] for part in delivered), default=0) / 1024 / 1024, 2),
+        'max_rss_before_mb': rss_before,
+        'max_rss_after_mb': max_rss_mb()
+    })
+    print(result)
+    if result['rows_in_parts'] != result['rows']:
+        raise SystemExit(f"rows mismatch: exported {result['rows']}, found {result['rows_in_parts']} in parts")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Замер get_history у игрока с большой историей: страницы по ключу и сводка с кэшем и без
+
+Создаёт игрока и --games игр за последние 60 дней, проверяет планы (index-only scan без сортировки)
+и печатает задержки первой страницы, глубоких страниц по курсору и сводки:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_history.py --games 100000 --calls 2000
+"""
+import argparse
+import json
+import os
+
+import psycopg2
+
+from bench_play import cleanup, setup_players
+from functions import Timer, call, load_function, percentile
+
+SEED_GAMES_SQL = '''
+    INSERT INTO games (player_id, bet_amount, selected_side, result_side, won, win_amount, created_at, server_seed_hash, nonce)
+    SELECT %(player_id)s, 1, 'heads', CASE WHEN n %% 2 = 0 THEN 'heads' ELSE 'tails' END, n %% 2 = 0,
+        CASE WHEN n %% 2 = 0 THEN 2 ELSE 0 END,
+        LOCALTIMESTAMP - make_interval(secs => n * 60 * 24 * 3600.0 / %(games)s), 'bench', n
+    FROM generate_series(1, %(games)s) AS n
+'''
+
+
+def seed_games(dsn: str, player_id: int, games: int):
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute(SEED_GAMES_SQL, {'player_id': player_id, 'games': games})
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        # Видимость страниц для index-only scan
+        cur.execute('VACUUM ANALYZE games')
+    conn.close()
+
+
+def plan(dsn: str, sql: str, params) -> dict:
+    """Узлы плана, сортировка и чтения кучи при index-only scan"""
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+        root = cur.fetchone()[0][0]
+    conn.close()
+    nodes, heap_fetches = set(), 0
+    stack = [root['Plan']]
+    while stack:
+        node = stack.pop()
+        nodes.add(node['Node Type'])
+        heap_fetches += node.get('Heap Fetches', 0)
+        stack.extend(node.get('Plans', []))
+    return {
+        'nodes': sorted(nodes),
+        'sorted': 'Sort' in nodes,
+        'heap_fetches': heap_fetches,
+        'execution_ms': round(root['Execution Time'], 3)
+    }
+
+
+def timed(handler, body: dict, calls: int, before=None) -> dict:
+    latencies = []
+    for _ in range(calls):
+        if before:
+            before()
+        with Timer() as t:
+            call(handler, body)
+        latencies.append(t.elapsed)
+    return {'p50_ms': round(percentile(latencies, 0.50) * 1000, 3), 'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.update({'THROTTLE_PLAYER_RATE': '0', 'THROTTLE_GLOBAL_RATE': '0'})
+    player_ids = setup_players(args.dsn, 1)
+    player_id = player_ids[0]
+    try:
+        with Timer() as seeding:
+            seed_games(args.dsn, player_id, args.games)
+        print({'games': args.games, 'seed_seconds': round(seeding.elapsed, 1)})
+
+        game = load_function('game')
+        history = game.history
+        print({'query': 'first_page', **plan(args.dsn, history.PAGE_SQL, {'player_id': player_id, 'limit': args.limit + 1})})
+        print({'query': 'summary', **plan(args.dsn, history.SUMMARY_SQL, (player_id,))})
+
+        body = {'action': 'get_history', 'player_id': player_id, 'limit': args.limit}
+        first = call(game.handler, body)
+        print({'summary': json.dumps(first['summary'])})
+        print({'mode': 'first_page_cached_summary', **timed(game.handler, body, args.calls)})
+        print({'mode': 'first_page_cold_summary', **timed(
+            game.handler, body, max(args.calls // 10, 10), lambda: game.get_history_cache().invalidate(player_id)
+        )})
+
+        cursor, pages, deep = first['next_cursor'], 0, []
+        while cursor and pages < args.calls:
+            with Timer() as t:
+                page = call(game.handler, {**body, 'cursor': cursor})
+            deep.append(t.elapsed)
+            cursor, pages = page['next_cursor'], pages + 1
+        print({
+            'mode': 'cursor_walk',
+            'pages': pages,
+            'p50_ms': round(percentile(deep, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(deep, 0.99) * 1000, 3)
+        })
+        game.get_pool().close_all()
+    finally:
+        cleanup(args.dsn, player_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Цена ключей идемпотентности на горячем пути play и проверка повторов
+
+Сравнивает play без request_id, с новым request_id на каждую ставку и повтор уже сыгранного
+request_id; число обращений к индексу idempotency_keys берётся из pg_stat_user_indexes.
+В конце несколько потоков одновременно шлют один и тот же request_id — игра должна быть одна:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_idempotency.py --flips 5000 --concurrency 8
+"""
+import argparse
+import os
+import threading
+import time
+import uuid
+
+import psycopg2
+
+from bench_play import cleanup, run, setup_players
+from functions import call, load_function, post_event
+
+
+def index_scans(dsn: str) -> int:
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT idx_scan FROM pg_stat_user_indexes WHERE indexrelname = 'idempotency_keys_pkey'")
+        scans = cur.fetchone()[0]
+    conn.close()
+    return scans
+
+
+def measured(dsn: str, game, name: str, flip, player_ids: list, flips: int, concurrency: int) -> dict:
+    """Прогон bench_play.run плюс обращения к индексу ключей на один вызов"""
+    before = index_scans(dsn)
+    result = run(name, flip, player_ids, flips, concurrency)
+    # Завершившиеся backend-процессы сбрасывают свою статистику сразу
+    game.get_pool().close_all()
+    time.sleep(0.5)
+    result['key_index_scans_per_call'] = round((index_scans(dsn) - before) / result['calls'], 3)
+    print({'mode': name, 'key_index_scans_per_call': result['key_index_scans_per_call']})
+    return result
+
+
+def games_played(dsn: str, player_id: int) -> int:
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute('SELECT COUNT(*) FROM games WHERE player_id = %s', (player_id,))
+        count = cur.fetchone()[0]
+    conn.close()
+    return count
+
+
+def race(dsn: str, game, player_id: int, threads: int) -> dict:
+    before = games_played(dsn, player_id)
+    request_id = uuid.uuid4().hex
+    statuses, replayed = [], []
+    barrier = threading.Barrier(threads)
+    event = post_event({'action': 'play', 'player_id': player_id, 'bet_amount': 1, 'selected_side': 'heads',
+                        'request_id': request_id})
+
+    def worker():
+        barrier.wait()
+        response = game.handler(event, None)
+        statuses.append(response['statusCode'])
+        replayed.append('Idempotent-Replayed' in response['headers'])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    result = {'mode': 'same_request_id_race', 'threads': threads, 'statuses': sorted(set(statuses)),
+              'replayed': sum(replayed), 'games': games_played(dsn, player_id) - before}
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--flips', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    os.environ.update({'THROTTLE_PLAYER_RATE': '0', 'THROTTLE_GLOBAL_RATE': '0'})
+    game = load_function('game')
+    player_ids = setup_players(args.dsn, args.players)
+    played = {}
+
+    def plain(player_id):
+        call(game.handler, {'action': 'play', 'player_id': player_id, 'bet_amount': 1, 'selected_side': 'heads'})
+
+    def keyed(player_id):
+        request_id = uuid.uuid4().hex
+        call(game.handler, {'action': 'play', 'player_id': player_id, 'bet_amount': 1, 'selected_side': 'heads',
+                            'request_id': request_id})
+        played.setdefault(player_id, request_id)
+
+    def replayed(player_id):
+        call(game.handler, {'action': 'play', 'player_id': player_id, 'bet_amount': 1, 'selected_side': 'heads',
+                            'request_id': played[player_id]})
+
+    try:
+        measured(args.dsn, game, 'play_without_request_id', plain, player_ids, args.flips, args.concurrency)
+        measured(args.dsn, game, 'play_with_request_id', keyed, player_ids, args.flips, args.concurrency)
+        measured(args.dsn, game, 'play_replay', replayed, player_ids, args.flips, args.concurrency)
+        race(args.dsn, game, player_ids[0], args.concurrency)
+    finally:
+        cleanup(args.dsn, player_ids)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Бенчмарк действий play и play_many: прежняя последовательность запросов, атомарный CTE и пакеты по N ставок
+
+Запуск против локального Postgres с применёнными миграциями:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_play.py --flips 5000 --concurrency 8
+"""
+import argparse
+import os
+import random
+import threading
+from decimal import Decimal
+
+import psycopg2
+
+from functions import Timer, call, load_function, percentile
+
+TELEGRAM_ID_BASE = 9_000_000_000
+
+
+def setup_players(dsn: str, count: int) -> list:
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        ids = []
+        for i in range(count):
+            cur.execute(
+                'INSERT INTO players (telegram_id, username, balance) VALUES (%s, %s, %s) '
+                'ON CONFLICT (telegram_id) DO UPDATE SET balance = EXCLUDED.balance RETURNING id',
+                (TELEGRAM_ID_BASE + i, f'bench{i}', Decimal('1000000'))
+            )
+            ids.append(cur.fetchone()[0])
+    conn.close()
+    return ids
+
+
+def cleanup(dsn: str, player_ids: list):
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute('DELETE FROM games WHERE player_id = ANY(%s)', (player_ids,))
+        cur.execute('DELETE FROM transactions WHERE player_id = ANY(%s)', (player_ids,))
+        cur.execute('DELETE FROM fair_seeds WHERE player_id = ANY(%s)', (player_ids,))
+        cur.execute('DELETE FROM idempotency_keys WHERE player_id = ANY(%s)', (player_ids,))
+        cur.execute('DELETE FROM players WHERE id = ANY(%s)', (player_ids,))
+    conn.close()
+
+
+def legacy_play(conn, player_id: int, bet_amount: Decimal, selected_side: str):
+    """Прежняя реализация play: шесть запросов и гонка между чтением и записью баланса"""
+    cur = conn.cursor()
+    cur.execute('SELECT balance FROM players WHERE id = %s', (player_id,))
+    balance = cur.fetchone()[0]
+    result_side = 'heads' if random.random() > 0.5 else 'tails'
+    won = result_side == selected_side
+    win_amount = bet_amount * 2 if won else Decimal(0)
+    new_balance = balance + bet_amount if won else balance - bet_amount
+    cur.execute(
+        'UPDATE players SET balance = %s, total_games = total_games + 1, wins = wins + %s, total_winnings = total_winnings + %s WHERE id = %s',
+        (new_balance, 1 if won else 0, win_amount, player_id)
+    )
+    cur.execute(
+        'INSERT INTO games (player_id, bet_amount, selected_side, result_side, won, win_amount) VALUES (%s, %s, %s, %s, %s, %s)',
+        (player_id, bet_amount, selected_side, result_side, won, win_amount)
+    )
+    cur.execute(
+        'INSERT INTO transactions (player_id, type, amount, status) VALUES (%s, %s, %s, %s)',
+        (player_id, 'win' if won else 'loss', win_amount if won else bet_amount, 'completed')
+    )
+    conn.commit()
+    cur.execute('SELECT balance, total_games, wins, total_winnings FROM players WHERE id = %s', (player_id,))
+    cur.fetchone()
+    cur.close()
+
+
+def run(name: str, flip, player_ids: list, flips: int, concurrency: int, flips_per_call: int = 1) -> dict:
+    latencies = []
+    lock = threading.Lock()
+    per_worker = max(1, flips // flips_per_call // concurrency)
+
+    def worker(n: int):
+        local = []
+        for i in range(per_worker):
+            player_id = player_ids[(n + i * concurrency) % len(player_ids)]
+            with Timer() as t:
+                flip(player_id)
+            local.append(t.elapsed)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    with Timer() as total:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    result = {
+        'mode': name,
+        'calls': len(latencies),
+        'flips': len(latencies) * flips_per_call,
+        'concurrency': concurrency,
+        'flips_per_sec': round(len(latencies) * flips_per_call / total.elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--flips', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-sizes', default='1,10,100')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.concurrency))
+    os.environ.update({'THROTTLE_PLAYER_RATE': '0', 'THROTTLE_GLOBAL_RATE': '0'})
+    game = load_function('game')
+    bet = Decimal('1')
+    player_ids = setup_players(args.dsn, args.players)
+
+    def legacy_fresh(player_id):
+        conn = psycopg2.connect(args.dsn)
+        try:
+            legacy_play(conn, player_id, bet, 'heads')
+        finally:
+            conn.close()
+
+    def legacy_pooled(player_id):
+        with game.get_pool().connection() as conn:
+            legacy_play(conn, player_id, bet, 'heads')
+
+    def atomic(player_id):
+        call(game.handler, {'action': 'play', 'player_id': player_id, 'bet_amount': 1, 'selected_side': 'heads'})
+
+    try:
+        run('legacy_fresh_connection', legacy_fresh, player_ids, args.flips, args.concurrency)
+        run('legacy_pooled', legacy_pooled, player_ids, args.flips, args.concurrency)
+        run('atomic_cte_pooled', atomic, player_ids, args.flips, args.concurrency)
+        for size in [int(n) for n in args.batch_sizes.split(',')]:
+            bets = [{'bet_amount': 1, 'selected_side': 'heads'}] * size
+
+            def batch(player_id):
+                call(game.handler, {'action': 'play_many', 'player_id': player_id, 'bets': bets})
+
+            run(f'play_many_n{size}', batch, player_ids, args.flips, args.concurrency, flips_per_call=size)
+    finally:
+        cleanup(args.dsn, player_ids)
+
+
+if __name__ == '__main__':
+    main()
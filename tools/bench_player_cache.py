@@ -0,0 +1,83 @@
+"""Замер get_or_create_player с кэшем профилей и без него
+
+Часть открытий Mini App сменяется ставками, которые сбрасывают кэш игрока:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_player_cache.py --opens 5000 --play-ratio 0.1
+"""
+import argparse
+import os
+import random
+
+import psycopg2
+
+from functions import Timer, call, load_function, percentile
+
+TELEGRAM_ID_BASE = 8_000_000_000
+
+MODES = {
+    'no_cache': {'PLAYER_CACHE_TTL': '0', 'PLAYER_CACHE_URL': ''},
+    'local_lru': {'PLAYER_CACHE_TTL': '30', 'PLAYER_CACHE_LOCAL_TTL': '30', 'PLAYER_CACHE_URL': ''},
+    'local_lru_and_shared': {'PLAYER_CACHE_TTL': '30', 'PLAYER_CACHE_URL': 'memory://'}
+}
+
+
+def run(mode: str, players: int, opens: int, play_ratio: float, seed: int) -> dict:
+    os.environ.pop('PLAYER_CACHE_LOCAL_TTL', None)
+    os.environ.update(MODES[mode])
+    os.environ.update({'THROTTLE_PLAYER_RATE': '0', 'THROTTLE_GLOBAL_RATE': '0'})
+    game = load_function('game')
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(players)]
+    latencies = []
+
+    with Timer() as total:
+        for telegram_id in rng.choices(range(TELEGRAM_ID_BASE, TELEGRAM_ID_BASE + players), weights, k=opens):
+            with Timer() as t:
+                profile = call(game.handler, {'action': 'get_or_create_player', 'telegram_id': telegram_id, 'username': 'cache'})
+            latencies.append(t.elapsed)
+            if rng.random() < play_ratio:
+                call(game.handler, {'action': 'play', 'player_id': profile['player_id'], 'bet_amount': 0.01, 'selected_side': 'heads'})
+
+    stats = game.get_player_cache().stats()
+    game.get_pool().close_all()
+    result = {
+        'mode': mode,
+        'opens': opens,
+        'opens_per_sec': round(opens / total.elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'hit_rate': stats['hit_rate'],
+        'invalidations': stats['invalidations'],
+        'load_avg_ms': stats['load_avg_ms']
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--opens', type=int, default=5000)
+    parser.add_argument('--play-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    try:
+        for mode in MODES:
+            run(mode, args.players, args.opens, args.play_ratio, args.seed)
+    finally:
+        conn = psycopg2.connect(args.dsn)
+        with conn, conn.cursor() as cur:
+            cur.execute('SELECT id FROM players WHERE telegram_id >= %s AND telegram_id < %s',
+                        (TELEGRAM_ID_BASE, TELEGRAM_ID_BASE + args.players))
+            player_ids = [row[0] for row in cur.fetchall()]
+            cur.execute('DELETE FROM games WHERE player_id = ANY(%s)', (player_ids,))
+            cur.execute('DELETE FROM transactions WHERE player_id = ANY(%s)', (player_ids,))
+            cur.execute('DELETE FROM fair_seeds WHERE player_id = ANY(%s)', (player_ids,))
+            cur.execute('DELETE FROM players WHERE id = ANY(%s)', (player_ids,))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Микробенчмарк сборки ответов: цена сериализации на тип ответа
+
+Сравнивает прежнюю сборку (float() для сумм и json.dumps) с responses.response на stdlib json
+и на orjson, если он установлен; для большого админского ответа отдельно замеряется gzip.
+База данных не нужна:
+    python tools/bench_responses.py --repeat 20000
+"""
+import argparse
+import importlib.util
+import json
+import sys
+import time
+from decimal import Decimal
+
+from functions import BACKEND_DIR
+
+
+def load_responses(fast: bool):
+    """Отдельная копия backend/game/responses.py; без fast импорт orjson принудительно падает"""
+    stashed = sys.modules.pop('orjson', None)
+    if not fast:
+        sys.modules['orjson'] = None
+    try:
+        spec = importlib.util.spec_from_file_location(f'responses_{"orjson" if fast else "stdlib"}', BACKEND_DIR / 'game' / 'responses.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.modules.pop('orjson', None)
+        if stashed is not None:
+            sys.modules['orjson'] = stashed
+    return module
+
+
+def money(value: str) -> Decimal:
+    return Decimal(value).quantize(Decimal('0.00000001'))
+
+
+def payloads() -> dict:
+    """Типичные тела ответов game и админских функций с Decimal, как их возвращает psycopg2"""
+    profile = {'player_id': 42, 'balance': money('1234.5678'), 'total_games': 870, 'wins': 431,
+               'total_winnings': money('9876.54321')}
+    play = {'result_side': 'heads', 'won': True, 'win_amount': '20.00000000', 'server_seed_hash': 'ab' * 32, 'nonce': 871,
+            'balance': '1244.56780000', 'total_games': 871, 'wins': 432, 'total_winnings': '9896.54321000'}
+    play_many = {
+        'results': [{'selected_side': 'heads', 'bet_amount': Decimal('0.5'), 'result_side': 'tails' if i % 3 else 'heads',
+                     'won': not i % 3, 'win_amount': Decimal('1.0') if not i % 3 else Decimal(0), 'nonce': 900 + i}
+                    for i in range(100)],
+        'played': 100, 'server_seed_hash': 'ab' * 32, 'balance': money('1200.5'), 'total_games': 971, 'wins': 465,
+        'total_winnings': money('9930.54321')
+    }
+    admin_stats = {
+        'pool': {'active': 3, 'idle': 5, 'checkouts': 123456, 'wait_avg_ms': 0.41, 'timeouts': 0},
+        'perf': {
+            'actions': [{'function': 'game', 'action': f'action_{i}', 'count': 1000 + i, 'errors': i % 4,
+                         'avg_ms': 3.217, 'p95_ms': 10.0, 'max_ms': 48.113, 'round_trips': 1.0, 'db_ms': 2.9,
+                         'telegram_ms': 0.0} for i in range(100)],
+            'statements': [{'statement': f'SELECT id, balance, total_games FROM players WHERE telegram_id = ? /* {i} */',
+                            'count': 5000 + i, 'total_ms': 12000.5, 'avg_ms': 2.4, 'max_ms': 40.2, 'rows': 5000}
+                           for i in range(100)]
+        },
+        'players': [{'player_id': i, 'balance': money(f'{i}.125'), 'total_winnings': money(f'{i * 3}.5')}
+                    for i in range(200)]
+    }
+    return {
+        'error': {'error': 'Insufficient balance'},
+        'get_or_create_player': profile,
+        'play': play,
+        'play_many': play_many,
+        'admin_stats': admin_stats
+    }
+
+
+def floats(value):
+    """Суммы через float(), как handler делал это при сборке словаря"""
+    if isinstance(value, dict):
+        return {key: floats(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [floats(item) for item in value]
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def legacy_response(data) -> dict:
+    """Прежняя сборка ответа: новый словарь заголовков и json.dumps"""
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(data),
+        'isBase64Encoded': False
+    }
+
+
+def per_call_us(build, data, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        build(data)
+    return round((time.perf_counter() - started) / repeat * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    backends = {'legacy_float_json': legacy_response}
+    stdlib = load_responses(fast=False)
+    backends['responses_stdlib'] = lambda data: stdlib.response(200, data)
+    fast = load_responses(fast=True)
+    if fast.orjson is not None:
+        backends['responses_orjson'] = lambda data: fast.response(200, data)
+    else:
+        print({'orjson': 'not installed, only the stdlib backend is measured'})
+
+    for name, data in payloads().items():
+        repeat = max(args.repeat // (50 if name in ('play_many', 'admin_stats') else 1), 100)
+        result = {'response': name, 'body_bytes': len(stdlib.dumps(data).encode('utf-8'))}
+        for backend, build in backends.items():
+            result[f'{backend}_us'] = per_call_us(build, floats(data) if build is legacy_response else data, repeat)
+        print(result)
+
+    admin_stats = payloads()['admin_stats']
+    event = {'headers': {'Accept-Encoding': 'gzip, deflate, br'}}
+    module = fast if fast.orjson is not None else stdlib
+    compressed = module.response(200, admin_stats, event=event)
+    print({
+        'response': 'admin_stats_gzip',
+        'body_bytes': len(module.dumps(admin_stats).encode('utf-8')),
+        'gzip_bytes': len(compressed['body']) * 3 // 4,
+        'plain_us': per_call_us(lambda data: module.response(200, data), admin_stats, max(args.repeat // 50, 100)),
+        'gzip_us': per_call_us(lambda data: module.response(200, data, event=event), admin_stats, max(args.repeat // 50, 100))
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Параллельные воркеры проведения против заглушки TON и локального Postgres
+
+Создаёт депозиты и выводы через функцию game, кладёт соответствующие переводы в FakeTonSource,
+запускает несколько воркеров и проверяет, что каждая строка проведена ровно один раз.
+Балансы и журнал остаются в базе (ledger_entries только дописывается), поэтому запускать
+на отдельной базе с применёнными миграциями:
+    DATABASE_URL=postgresql://localhost/coinflip_bench python tools/bench_settlement.py --deposits 5000 --workers 4
+"""
+import argparse
+import os
+import sys
+from decimal import Decimal
+
+import psycopg2
+
+from functions import BACKEND_DIR, Timer, call, load_function, percentile
+
+TELEGRAM_ID_BASE = 6_000_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--deposits', type=int, default=5000)
+    parser.add_argument('--withdrawals', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.workers + 1))
+    sys.path.insert(0, str(BACKEND_DIR / 'settlement'))
+    import chain
+    import settlement
+    game = load_function('game')
+
+    players = [
+        call(game.handler, {'action': 'get_or_create_player', 'telegram_id': TELEGRAM_ID_BASE + i, 'username': f'settle{i}'})['player_id']
+        for i in range(args.players)
+    ]
+    source = chain.FakeTonSource()
+    deposit_ids, withdrawal_ids = [], []
+    with Timer() as created:
+        for i in range(args.deposits):
+            response = call(game.handler, {'action': 'create_deposit', 'player_id': players[i % len(players)], 'amount': 1})
+            deposit_ids.append(response['transaction_id'])
+            source.deposit(response['memo'], Decimal('1'))
+        for i in range(args.withdrawals):
+            response = call(game.handler, {
+                'action': 'create_withdrawal',
+                'player_id': players[i % len(players)],
+                'amount': 0.5,
+                'ton_address': 'EQbench'
+            })
+            withdrawal_ids.append(response['transaction_id'])
+            source.payout(f'WITHDRAWAL_{response["transaction_id"]}', Decimal('0.5'), 'EQbench')
+    print({'phase': 'created', 'rows': len(deposit_ids) + len(withdrawal_ids), 'seconds': round(created.elapsed, 2)})
+
+    with Timer() as total:
+        results = settlement.run_parallel(args.workers, source=source, batch_size=args.batch_size)
+    latencies = [batch['ms'] for result in results for batch in result['batches']]
+    print({
+        'workers': args.workers,
+        'settled': sum(result['settled'] for result in results),
+        'per_worker': [result['settled'] for result in results],
+        'batches': len(latencies),
+        'batch_p50_ms': percentile(latencies, 0.50),
+        'batch_p95_ms': percentile(latencies, 0.95),
+        'rows_per_sec': round(sum(result['settled'] for result in results) / total.elapsed, 1)
+    })
+
+    conn = psycopg2.connect(args.dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT COUNT(*) FILTER (WHERE status <> 'completed') FROM transactions WHERE id = ANY(%s)",
+            (deposit_ids + withdrawal_ids,)
+        )
+        unsettled = cur.fetchone()[0]
+        cur.execute(
+            'SELECT COUNT(*) FROM (SELECT reference_id FROM ledger_entries '
+            "WHERE kind = 'deposit' AND reference_id = ANY(%s) "
+            'GROUP BY reference_id HAVING COUNT(*) <> %s) AS t',
+            (deposit_ids, 2)
+        )
+        double_posted = cur.fetchone()[0]
+    conn.close()
+    print({'unsettled': unsettled, 'deposits_not_posted_exactly_once': double_posted})
+
+
+if __name__ == '__main__':
+    main()
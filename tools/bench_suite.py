@@ -0,0 +1,333 @@
+"""Нагрузочный прогон функций по смесям запросов с локальным Postgres и заглушкой Telegram
+
+Сначала выполняет все сценарии из backend/*/tests.json, затем гоняет смеси действий (открытие
+Mini App, ставки, депозиты, выводы, админские кнопки бота) на каждом уровне параллельности.
+Шаблоны запросов берутся из tests.json, меняются только игрок и параметры. Результат — JSON:
+пропускная способность, p50/p95/p99, обращения к БД на запрос, ожидание блокировок и пула.
+Депозиты и выводы остаются в базе, поэтому запускать на отдельной базе с миграциями:
+    DATABASE_URL=postgresql://localhost/coinflip_bench python tools/bench_suite.py --concurrency 1,8,32 --output bench.json
+    python tools/bench_suite.py --compare bench-main.json --output bench.json
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import psycopg2
+
+from fake_telegram import FakeTelegram
+from functions import BACKEND_DIR, load_function, percentile
+
+TELEGRAM_ID_BASE = 5_000_000_000
+ADMIN_TELEGRAM_ID = 4_999_999_999
+
+MIXES = {
+    'player': {'open': 30, 'play': 60, 'deposit': 5, 'withdraw': 5},
+    'wallet': {'open': 20, 'play': 20, 'deposit': 30, 'withdraw': 30},
+    'admin': {'open': 40, 'play': 40, 'admin': 20}
+}
+
+ADMIN_CALLBACKS = ('admin_stats', 'admin_players', 'admin_transactions', 'lb:balance:0', 'lb:winnings:1')
+
+class LockSampler:
+    """Раз в interval секунд считает backend-процессы базы, ждущие блокировку"""
+
+    def __init__(self, dsn: str, interval: float = 0.01):
+        self.dsn = dsn
+        self.interval = interval
+        self.samples = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            while not self._stop.wait(self.interval):
+                cur.execute(
+                    "SELECT COUNT(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND datname = current_database()"
+                )
+                waiting = cur.fetchone()[0]
+                self.samples += 1
+                self.waiting += waiting
+                self.max_waiting = max(self.max_waiting, waiting)
+        conn.close()
+
+    def stats(self) -> dict:
+        return {
+            'lock_wait_ms': round(self.waiting * self.interval * 1000, 1),
+            'lock_waiters_max': self.max_waiting
+        }
+
+
+def load_specs(names: list) -> dict:
+    specs = {}
+    for name in names:
+        path = BACKEND_DIR / name / 'tests.json'
+        if path.exists():
+            specs[name] = {case['name']: case for case in json.loads(path.read_text())['tests']}
+    return specs
+
+
+def matches(expected, actual) -> bool:
+    """bodyMatcher partial: вложенные ключи сравниваются, "number"/"string"/"boolean" проверяют тип"""
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(key in actual and matches(value, actual[key]) for key, value in expected.items())
+    if isinstance(expected, list):
+        return isinstance(actual, list) and len(actual) >= len(expected) and all(map(matches, expected, actual))
+    if expected == 'number':
+        return isinstance(actual, (int, float)) and not isinstance(actual, bool)
+    if expected == 'string':
+        return isinstance(actual, str)
+    if expected == 'boolean':
+        return isinstance(actual, bool)
+    return expected == actual
+
+
+def event(case: dict, body=None) -> dict:
+    body = case.get('body') if body is None else body
+    return {
+        'httpMethod': case.get('method', 'POST'),
+        'path': case.get('path', '/'),
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False
+    }
+
+
+def smoke(functions: dict, specs: dict) -> list:
+    results = []
+    for name, cases in specs.items():
+        for case in cases.values():
+            response = functions[name].handler(event(case), None)
+            try:
+                body = json.loads(response.get('body') or 'null')
+            except ValueError:
+                body = response.get('body')
+            ok = response['statusCode'] == case.get('expectedStatus', 200)
+            if ok and 'expectedBody' in case and isinstance(body, dict):
+                ok = matches(case['expectedBody'], body)
+            results.append({'function': name, 'name': case['name'], 'status': response['statusCode'], 'ok': ok})
+    return results
+
+
+class Workload:
+    """Строит запросы действий смеси из шаблонов tests.json"""
+
+    def __init__(self, functions: dict, specs: dict, players: list, perf):
+        self.functions = functions
+        self.perf = perf
+        self.open_case = specs['game']['Get or create player']
+        self.bot_case = specs['bot']['Bot webhook test']
+        self.players = players
+        self._update_ids = iter(range(10 ** 9, 2 * 10 ** 9))
+
+    def request(self, action: str, rng: random.Random) -> tuple:
+        telegram_id, player_id = rng.choice(self.players)
+        if action == 'open':
+            body = dict(self.open_case['body'], telegram_id=telegram_id, username=f'suite{telegram_id}')
+            return 'game', event(self.open_case, body)
+        if action == 'play':
+            body = {'action': 'play', 'player_id': player_id, 'bet_amount': 0.01, 'selected_side': rng.choice(('heads', 'tails'))}
+        elif action == 'deposit':
+            body = {'action': 'create_deposit', 'player_id': player_id, 'amount': 1}
+        elif action == 'withdraw':
+            body = {'action': 'create_withdrawal', 'player_id': player_id, 'amount': 0.01, 'ton_address': 'EQsuite'}
+        else:
+            return 'bot', event(self.bot_case, self._admin_update(rng))
+        return 'game', event(self.open_case, body)
+
+    def _admin_update(self, rng: random.Random) -> dict:
+        update = copy.deepcopy(self.bot_case['body'])
+        update['update_id'] = next(self._update_ids)
+        message = update.pop('message')
+        message['from']['id'] = message['chat']['id'] = ADMIN_TELEGRAM_ID
+        if rng.random() < 0.2:
+            message['text'] = '/stats'
+            update['message'] = message
+        else:
+            update['callback_query'] = {
+                'id': str(update['update_id']),
+                'from': message['from'],
+                'message': message,
+                'data': rng.choice(ADMIN_CALLBACKS)
+            }
+        return update
+
+
+def pool_wait_ms(pool) -> float:
+    stats = pool.stats()
+    return stats['wait_avg_ms'] * stats['checkouts']
+
+
+def run(workload: Workload, pool, dsn: str, mix: str, concurrency: int, requests: int, seed: int) -> dict:
+    actions, weights = zip(*MIXES[mix].items())
+    samples = []
+    lock = threading.Lock()
+    per_worker = max(1, requests // concurrency)
+
+    def worker(n: int):
+        rng = random.Random(seed * 1000 + n)
+        local = []
+        for action in rng.choices(actions, weights, k=per_worker):
+            function, request = workload.request(action, rng)
+            trips = workload.perf.thread_round_trips()
+            started = time.perf_counter()
+            response = workload.functions[function].handler(request, None)
+            elapsed = time.perf_counter() - started
+            local.append((action, response['statusCode'], elapsed, workload.perf.thread_round_trips() - trips))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    wait_before = pool_wait_ms(pool)
+    with LockSampler(dsn) as locks:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    def summary(rows: list) -> dict:
+        latencies = [row[2] for row in rows]
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[1] >= 500),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'db_round_trips_per_request': round(sum(row[3] for row in rows) / len(rows), 2) if rows else 0.0
+        }
+
+    result = {
+        'mix': mix,
+        'concurrency': concurrency,
+        'throughput_rps': round(len(samples) / elapsed, 1),
+        **summary(samples),
+        **locks.stats(),
+        'pool_wait_ms': round(pool_wait_ms(pool) - wait_before, 1),
+        'statuses': {str(status): sum(1 for row in samples if row[1] == status) for status in sorted({row[1] for row in samples})},
+        'actions': {action: summary([row for row in samples if row[0] == action]) for action in actions}
+    }
+    print(json.dumps({key: value for key, value in result.items() if key != 'actions'}), file=sys.stderr)
+    return result
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """Строки с ухудшением больше tolerance: падение throughput или рост p99"""
+    previous = {(run['mix'], run['concurrency']): run for run in baseline['runs']}
+    regressions = []
+    for run in current['runs']:
+        before = previous.get((run['mix'], run['concurrency']))
+        if before is None:
+            continue
+        throughput = run['throughput_rps'] / before['throughput_rps'] - 1 if before['throughput_rps'] else 0.0
+        p99 = run['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0.0
+        row = {
+            'mix': run['mix'],
+            'concurrency': run['concurrency'],
+            'throughput_change': round(throughput, 3),
+            'p99_change': round(p99, 3),
+            'db_round_trips_change': round(run['db_round_trips_per_request'] - before['db_round_trips_per_request'], 2)
+        }
+        print(json.dumps(row), file=sys.stderr)
+        if throughput < -tolerance or p99 > tolerance:
+            regressions.append(row)
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--mixes', default=','.join(MIXES))
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=2000, help='запросов на один прогон смеси')
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--telegram-latency-ms', type=float, default=20.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None, help='JSON прошлого прогона')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(',')]
+    fake = FakeTelegram(latency=args.telegram_latency_ms / 1000)
+    os.environ.update({
+        'DATABASE_URL': args.dsn,
+        'DB_POOL_MAX_SIZE': os.environ.get('DB_POOL_MAX_SIZE', str(max(levels))),
+        'TELEGRAM_API_URL': fake.start(),
+        'TELEGRAM_BOT_TOKEN': 'suite',
+        'ADMIN_TELEGRAM_ID': str(ADMIN_TELEGRAM_ID),
+        'THROTTLE_PLAYER_RATE': '0',
+        'THROTTLE_GLOBAL_RATE': '0'
+    })
+    names = list(json.loads((BACKEND_DIR / 'func2url.json').read_text()))
+    shared = {}
+    functions = {name: load_function(name, shared=shared) for name in names}
+    modules = {module_name: module for (module_name, _), module in shared.items()}
+    pool = modules['db'].get_pool()
+    specs = load_specs(names)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'params': {key: value for key, value in vars(args).items() if key not in ('dsn', 'output', 'compare')},
+        'smoke': smoke(functions, specs),
+        'runs': []
+    }
+
+    open_case = specs['game']['Get or create player']
+    players = []
+    for i in range(args.players):
+        telegram_id = TELEGRAM_ID_BASE + i
+        body = dict(open_case['body'], telegram_id=telegram_id, username=f'suite{i}')
+        players.append((telegram_id, json.loads(functions['game'].handler(event(open_case, body), None)['body'])['player_id']))
+    workload = Workload(functions, specs, players, modules['perf'])
+
+    try:
+        for mix in args.mixes.split(','):
+            for concurrency in levels:
+                report['runs'].append(run(workload, pool, args.dsn, mix, concurrency, args.requests, args.seed))
+    finally:
+        fake.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    failed = [case for case in report['smoke'] if not case['ok']]
+    regressions = compare(json.loads(open(args.compare).read()), report, args.tolerance) if args.compare else []
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
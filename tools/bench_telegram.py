@@ -0,0 +1,84 @@
+"""Бенчмарк клиента Telegram против локальной заглушки: urllib на каждый вызов, keep-alive и параллельная отправка
+
+    python tools/bench_telegram.py --calls 200 --latency-ms 20
+"""
+import argparse
+import json
+import sys
+import urllib.parse
+import urllib.request
+
+from fake_telegram import FakeTelegram
+from functions import BACKEND_DIR, Timer, percentile
+
+sys.path.insert(0, str(BACKEND_DIR / 'bot'))
+from telegram import TelegramClient  # noqa: E402
+
+TOKEN = 'bench'
+
+
+def urllib_call(base_url: str, method: str, params: dict) -> dict:
+    req = urllib.request.Request(
+        f'{base_url}/bot{TOKEN}/{method}',
+        data=urllib.parse.urlencode(params).encode('utf-8'),
+        method='POST'
+    )
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def measure(name: str, calls: int, fn) -> dict:
+    latencies = []
+    with Timer() as total:
+        for i in range(calls):
+            with Timer() as t:
+                fn(i)
+            latencies.append(t.elapsed)
+    result = {
+        'mode': name,
+        'calls': calls,
+        'per_sec': round(calls / total.elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency=args.latency_ms / 1000)
+    base_url = fake.start()
+    client = TelegramClient(TOKEN, api_url=base_url)
+    message = {'chat_id': 1, 'text': 'bench', 'parse_mode': 'HTML'}
+    answer = {'callback_query_id': '1', 'text': ''}
+
+    try:
+        measure('urllib_send', args.calls, lambda i: urllib_call(base_url, 'sendMessage', message))
+        measure('client_send_keepalive', args.calls, lambda i: client.call('sendMessage', message))
+        measure('callback_sequential_urllib', args.calls, lambda i: (
+            urllib_call(base_url, 'sendMessage', message),
+            urllib_call(base_url, 'answerCallbackQuery', answer)
+        ))
+        measure('callback_parallel_client', args.calls, lambda i: client.call_many([
+            ('answerCallbackQuery', answer),
+            ('sendMessage', message)
+        ]))
+
+        limited = FakeTelegram(rate_limit_every=5, retry_after=0)
+        limited_client = TelegramClient(TOKEN, api_url=limited.start())
+        measure('client_send_with_429_every_5th', args.calls, lambda i: limited_client.call('sendMessage', message))
+        print({'rate_limited_responses': limited.rejected, 'delivered': len(limited.methods('sendMessage'))})
+        limited_client.close()
+        limited.stop()
+    finally:
+        client.close()
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Нагрузочный тест ограничения ставок: «злые» клиенты долбят play без пауз
+
+Сравнивает функцию без ограничений и с ограничениями; частота обращений к БД считается
+по выдачам соединений из пула (каждый пропущенный запрос берёт одно соединение):
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_throttle.py --threads 32 --seconds 10
+"""
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+
+from bench_play import cleanup, setup_players
+from functions import load_function, post_event
+
+MODES = {
+    'unthrottled': {'THROTTLE_PLAYER_RATE': '0', 'THROTTLE_GLOBAL_RATE': '0'},
+    'throttled': {}
+}
+
+
+def run(mode: str, player_ids: list, threads: int, seconds: float, player_rate: str, global_rate: str) -> dict:
+    os.environ.update({'THROTTLE_PLAYER_RATE': player_rate, 'THROTTLE_GLOBAL_RATE': global_rate})
+    os.environ.update(MODES[mode])
+    game = load_function('game')
+    statuses = Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker(n: int):
+        local = Counter()
+        player_id = player_ids[n % len(player_ids)]
+        event = post_event({'action': 'play', 'player_id': player_id, 'bet_amount': 0.01, 'selected_side': 'heads'})
+        while time.monotonic() < deadline:
+            local[game.handler(event, None)['statusCode']] += 1
+        with lock:
+            statuses.update(local)
+
+    checkouts_before = game.get_pool().stats()['checkouts']
+    started = time.monotonic()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - started
+    db_requests = game.get_pool().stats()['checkouts'] - checkouts_before
+    game.get_pool().close_all()
+
+    result = {
+        'mode': mode,
+        'requests_per_sec': round(sum(statuses.values()) / elapsed, 1),
+        'db_requests_per_sec': round(db_requests / elapsed, 1),
+        'statuses': dict(statuses),
+        'throttle': game.get_throttle().stats()
+    }
+    print(result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--player-rate', default='5')
+    parser.add_argument('--global-rate', default='50')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ.setdefault('DB_POOL_MAX_SIZE', '8')
+    player_ids = setup_players(args.dsn, args.players)
+    try:
+        for mode in MODES:
+            run(mode, player_ids, args.threads, args.seconds, args.player_rate, args.global_rate)
+    finally:
+        cleanup(args.dsn, player_ids)
+
+
+if __name__ == '__main__':
+    main()
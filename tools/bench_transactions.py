@@ -0,0 +1,120 @@
+"""Бенчмарк браузера транзакций на синтетическом журнале (по умолчанию 10 млн строк)
+
+Журнал создаётся в отдельной схеме bench_ledger с теми же индексами, что и public.transactions:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/bench_transactions.py --rows 10000000
+"""
+import argparse
+import os
+import sys
+
+import psycopg2
+
+from functions import BACKEND_DIR, Timer, percentile
+
+sys.path.insert(0, str(BACKEND_DIR / 'bot'))
+from transactions import PAGE_SIZE, fetch_page  # noqa: E402
+
+SCHEMA = 'bench_ledger'
+
+
+def build(cur, rows: int, players: int):
+    cur.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cur.execute(f'CREATE SCHEMA {SCHEMA}')
+    cur.execute(f'CREATE TABLE {SCHEMA}.players (LIKE public.players INCLUDING ALL)')
+    cur.execute(f'CREATE TABLE {SCHEMA}.transactions (LIKE public.transactions INCLUDING DEFAULTS)')
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.players (id, telegram_id, username, balance) "
+        f"SELECT g, 8000000000 + g, 'bench' || g, 100 FROM generate_series(1, %s) g",
+        (players,)
+    )
+    cur.execute(f'''
+        INSERT INTO {SCHEMA}.transactions (id, player_id, type, amount, status, created_at)
+        SELECT g,
+               1 + (g * 7919) %% %s,
+               (ARRAY['win', 'loss', 'loss', 'win', 'deposit', 'withdrawal'])[1 + g %% 6],
+               1 + g %% 50,
+               CASE WHEN g %% 6 >= 4 AND g %% 97 = 0 THEN 'pending' ELSE 'completed' END,
+               TIMESTAMP '2024-01-01' + g * INTERVAL '3 seconds'
+        FROM generate_series(1, %s) g
+    ''', (players, rows))
+    cur.execute(
+        "SELECT indexdef FROM pg_indexes WHERE schemaname = 'public' AND tablename = 'transactions' "
+        "AND indexname <> 'transactions_pkey'"
+    )
+    for (indexdef,) in cur.fetchall():
+        cur.execute(indexdef.replace('ON public.transactions', f'ON {SCHEMA}.transactions').replace(
+            'CREATE INDEX ', 'CREATE INDEX bench_', 1))
+    cur.execute(f'ALTER TABLE {SCHEMA}.transactions ADD PRIMARY KEY (id)')
+    cur.execute(f'ANALYZE {SCHEMA}.players')
+    cur.execute(f'ANALYZE {SCHEMA}.transactions')
+
+
+def walk(cur, filters: dict, pages: int) -> dict:
+    latencies = []
+    key = None
+    for _ in range(pages):
+        with Timer() as t:
+            page = fetch_page(cur, filters, key, 'n')
+        latencies.append(t.elapsed)
+        if not page['has_older']:
+            break
+        key = page['last_key']
+    return {
+        'filters': filters,
+        'pages': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3)
+    }
+
+
+def offset_page(cur, depth: int) -> float:
+    with Timer() as t:
+        cur.execute(
+            'SELECT id FROM transactions ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s',
+            (PAGE_SIZE, depth * PAGE_SIZE)
+        )
+        cur.fetchall()
+    return round(t.elapsed * 1000, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--players', type=int, default=100_000)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--reuse', action='store_true', help='не пересоздавать синтетический журнал')
+    parser.add_argument('--keep', action='store_true', help='не удалять схему после прогона')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        if not args.reuse:
+            with Timer() as t:
+                build(cur, args.rows, args.players)
+            print({'built_rows': args.rows, 'seconds': round(t.elapsed, 1)})
+
+        cur.execute(f'SET search_path = {SCHEMA}, public')
+        cur.execute('SELECT player_id FROM transactions ORDER BY created_at DESC LIMIT 1')
+        busy_player = cur.fetchone()[0]
+
+        for filters in ({}, {'type': 'deposit'}, {'status': 'pending'}, {'player_id': busy_player}):
+            print(walk(cur, filters, args.pages))
+
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT TEXT) SELECT id FROM transactions '
+                    'WHERE (created_at, id) < (TIMESTAMP \'2024-06-01\', 0) ORDER BY created_at DESC, id DESC LIMIT 16')
+        print('\n'.join(row[0] for row in cur.fetchall()))
+
+        for depth in (1, 1000, 100000):
+            print({'offset_depth_pages': depth, 'offset_ms': offset_page(cur, depth)})
+    finally:
+        if not args.keep:
+            cur.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Проверка плановых функций на реальном Postgres: вызовы handler и их работа с настройками по умолчанию
+
+Функции settlement и archive вызываются так же, как по расписанию: с токеном и без параметров.
+Переводы TON подставляются через FakeTonSource, архив пишется во временный каталог.
+Проверки оставляют строки в базе, поэтому запускать на отдельной базе с применёнными миграциями:
+    DATABASE_URL=postgresql://localhost/coinflip_check python tools/check_scheduled.py
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+import psycopg2
+
+from functions import BACKEND_DIR, call, load_function
+
+TELEGRAM_ID_BASE = 7_000_000_000
+TOKEN = 'check'
+
+
+def scheduled_event(header: str, body: dict = None) -> dict:
+    return {
+        'httpMethod': 'POST',
+        'headers': {'Content-Type': 'application/json', header: TOKEN},
+        'body': json.dumps(body or {}),
+        'isBase64Encoded': False
+    }
+
+
+def statuses(dsn: str, ids: list) -> dict:
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute('SELECT id, status FROM transactions WHERE id = ANY(%s)', (ids,))
+        rows = dict(cur.fetchall())
+    conn.close()
+    return rows
+
+
+def check_settlement(dsn: str, game) -> list:
+    """Handler отвечает 200; SettlementWorker без deposit_expiry_hours проводит, просрочивает и ждёт"""
+    failures = []
+    settlement_function = load_function('settlement')
+    response = settlement_function.handler(scheduled_event('X-Settlement-Token'), None)
+    if response['statusCode'] != 200:
+        failures.append({'check': 'settlement_handler', 'status': response['statusCode'], 'body': response['body']})
+
+    sys.path.insert(0, str(BACKEND_DIR / 'settlement'))
+    import chain
+    import settlement
+
+    opening = call(game.handler, {'action': 'get_or_create_player', 'telegram_id': TELEGRAM_ID_BASE, 'username': 'check'})
+    player_id = opening['player_id']
+    matched, stale, fresh = (
+        call(game.handler, {'action': 'create_deposit', 'player_id': player_id, 'amount': 1}) for _ in range(3)
+    )
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute("UPDATE transactions SET created_at = LOCALTIMESTAMP - INTERVAL '25 hours' WHERE id = %s",
+                    (stale['transaction_id'],))
+    conn.close()
+    source = chain.FakeTonSource()
+    source.deposit(matched['memo'], Decimal('1'))
+
+    worker = settlement.SettlementWorker(source=source)
+    result = worker.run()
+    expected = {matched['transaction_id']: 'completed', stale['transaction_id']: 'failed', fresh['transaction_id']: 'pending'}
+    actual = statuses(dsn, list(expected))
+    if actual != expected:
+        failures.append({'check': 'settlement_default_expiry', 'expected': expected, 'actual': actual})
+    print({'check': 'settlement', 'expiry_hours': worker.deposit_expiry_hours, 'settled': result['settled'],
+           'expired': result['expired'], 'statuses': actual})
+
+    # Зачисление в settlement видно игре сразу, хотя у функций разные экземпляры кэша профилей
+    profile = call(game.handler, {'action': 'get_or_create_player', 'telegram_id': TELEGRAM_ID_BASE, 'username': 'check'})
+    if Decimal(profile['balance']) != Decimal(opening['balance']) + 1:
+        failures.append({'check': 'settlement_player_cache', 'before': opening['balance'], 'after': profile['balance']})
+
+    # Давний неоплаченный вывод не тянет начало поиска переводов дальше WITHDRAWAL_LOOKBACK_HOURS
+    stale_withdrawal = call(game.handler, {'action': 'create_withdrawal', 'player_id': player_id, 'amount': '0.5',
+                                           'ton_address': 'EQcheck'})
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute("UPDATE transactions SET created_at = LOCALTIMESTAMP - INTERVAL '100 hours' WHERE id = %s",
+                    (stale_withdrawal['transaction_id'],))
+    conn.close()
+    requested = []
+    original = source.transfers
+    source.transfers = lambda since: requested.append(since) or original(since)
+    started = time.time()
+    worker.run()
+    lookback = started - min(requested) if requested else None
+    if lookback is None or lookback > worker.withdrawal_lookback_hours * 3600 + 660:
+        failures.append({'check': 'settlement_withdrawal_lookback', 'lookback_seconds': lookback})
+    print({'check': 'settlement_lookback', 'lookback_hours': worker.withdrawal_lookback_hours,
+           'lookback_seconds': lookback})
+    return failures
+
+
+CHECK_PARTITION = 'games_check_detached'
+
+
+def archived_rows(directory: str) -> int:
+    rows = 0
+    for filename in os.listdir(directory):
+        with gzip.open(os.path.join(directory, filename), 'rt', newline='') as f:
+            rows += sum(1 for _ in csv.reader(f)) - 1
+    return rows
+
+
+def check_archive(dsn: str) -> list:
+    """Без места назначения ничего не отсоединяется; выгрузка частями продолжается и удаляет таблицу в конце"""
+    failures = []
+    sys.path.insert(0, str(BACKEND_DIR / 'archive'))
+    import archive
+
+    result = archive.Archiver(fmt='csv').run()
+    if 'skipped' not in result or result['archived']:
+        failures.append({'check': 'archive_without_destination', 'result': result})
+
+    conn = psycopg2.connect(dsn)
+    with conn, conn.cursor() as cur:
+        cur.execute(f'DROP TABLE IF EXISTS {CHECK_PARTITION}')
+        cur.execute(f'CREATE TABLE {CHECK_PARTITION} (LIKE games)')
+        cur.execute(
+            f"INSERT INTO {CHECK_PARTITION} (id, player_id, bet_amount, selected_side, result_side, won, win_amount, created_at) "
+            "SELECT n, 1, 1, 'heads', 'heads', TRUE, 2, TIMESTAMP '2020-01-01' + (n / 3) * INTERVAL '1 minute' "
+            'FROM generate_series(1, 2500) AS n'
+        )
+        cur.execute('DELETE FROM games_archives WHERE partition_name = %s', (CHECK_PARTITION,))
+        cur.execute("INSERT INTO games_archives (partition_name, range_end) VALUES (%s, '2020-02-01')", (CHECK_PARTITION,))
+
+    directory = tempfile.mkdtemp(prefix='archive-check-')
+    archiver = archive.Archiver(local_dir=directory, fmt='csv', chunk_size=100, part_rows=1000)
+    # Истёкший дедлайн: одна часть за вызов, как у функции, упёршейся в time_budget
+    invocations = []
+    while not (invocations and invocations[-1]['finished']) and len(invocations) < 50:
+        invocations.append(archiver.export(CHECK_PARTITION, deadline=0))
+    with conn, conn.cursor() as cur:
+        cur.execute('SELECT to_regclass(%s), status, rows, parts FROM games_archives WHERE partition_name = %s',
+                    (CHECK_PARTITION, CHECK_PARTITION))
+        table, status, rows, parts = cur.fetchone()
+    conn.close()
+    files = archived_rows(directory)
+    if table is not None or status != 'archived' or rows != 2500 or files != 2500 or parts != len(os.listdir(directory)):
+        failures.append({'check': 'archive_resumable_export', 'table': table, 'status': status, 'rows': rows,
+                         'rows_in_files': files, 'parts': parts})
+    print({'check': 'archive', 'invocations': len(invocations), 'parts': parts, 'rows': rows, 'rows_in_files': files,
+           'status': status})
+    return failures
+
+
+def check_archive_handler(dsn: str) -> list:
+    """Вызов по расписанию и purge_idempotency_keys отвечают 200 и удаляют только просроченные ключи; вызов по расписанию снимает журнал"""
+    failures = []
+    archive_function = load_function('archive')
+    conn = psycopg2.connect(dsn)
+    for body in ({}, {'action': 'purge_idempotency_keys'}):
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM idempotency_keys WHERE request_id LIKE 'check-%%'")
+            cur.execute(
+                "INSERT INTO idempotency_keys (player_id, request_id, action, response, created_at) VALUES "
+                "(1, 'check-expired', 'play', '{}', LOCALTIMESTAMP - INTERVAL '25 hours'), "
+                "(1, 'check-fresh', 'play', '{}', LOCALTIMESTAMP)"
+            )
+        response = archive_function.handler(scheduled_event('X-Archive-Token', body), None)
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT request_id FROM idempotency_keys WHERE request_id LIKE 'check-%%'")
+            left = sorted(row[0] for row in cur.fetchall())
+        snapshot_id = json.loads(response['body']).get('ledger_snapshot_id')
+        if response['statusCode'] != 200 or left != ['check-fresh'] or (not body and snapshot_id is None):
+            failures.append({'check': 'archive_handler', 'body': body, 'status': response['statusCode'],
+                             'response': response['body'], 'keys_left': left})
+        print({'check': 'archive_handler', 'body': body, 'status': response['statusCode'], 'keys_left': left,
+               'ledger_snapshot_id': snapshot_id})
+    conn.close()
+    return failures
+
+
+def check_malformed_bodies() -> list:
+    """Битый или не объектный JSON в теле — 400, а не 500"""
+    failures = []
+    for name, header in (('settlement', 'X-Settlement-Token'), ('archive', 'X-Archive-Token')):
+        function = load_function(name)
+        for raw in ('{', '[]', '"text"'):
+            event = dict(scheduled_event(header), body=raw)
+            response = function.handler(event, None)
+            if response['statusCode'] != 400:
+                failures.append({'check': 'malformed_body', 'function': name, 'body': raw,
+                                 'status': response['statusCode'], 'response': response['body']})
+        print({'check': 'malformed_body', 'function': name})
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    args = parser.parse_args()
+
+    os.environ.update({
+        'DATABASE_URL': args.dsn,
+        'SETTLEMENT_TOKEN': TOKEN,
+        'SETTLEMENT_SOURCE': 'fake',
+        'ARCHIVE_TOKEN': TOKEN,
+        'THROTTLE_PLAYER_RATE': '0',
+        'THROTTLE_GLOBAL_RATE': '0'
+    })
+    for name in ('DEPOSIT_EXPIRY_HOURS', 'WITHDRAWAL_LOOKBACK_HOURS', 'PLAYER_CACHE_URL', 'PLAYER_CACHE_LOCAL_TTL',
+                 'ARCHIVE_DIR', 'ARCHIVE_S3_BUCKET'):
+        os.environ.pop(name, None)
+    game = load_function('game')
+
+    failures = (check_settlement(args.dsn, game) + check_archive(args.dsn) + check_archive_handler(args.dsn)
+                + check_malformed_bodies())
+    for failure in failures:
+        print(failure)
+    if failures:
+        raise SystemExit(f'{len(failures)} scheduled checks failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""Локальная заглушка Telegram Bot API для проверок и замеров задержек
+
+Запуск отдельно:
+    python tools/fake_telegram.py --port 8081 --latency-ms 50 --rate-limit-every 20
+    TELEGRAM_API_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=test ...
+
+Или из кода: FakeTelegram(latency=0.05).start() возвращает базовый URL; вызовы копятся в .calls.
+"""
+import argparse
+import itertools
+import json
+import socket
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTelegram:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 rate_limit_every: int = 0, retry_after: int = 1, per_chat_interval: float = 0.0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.per_chat_interval = per_chat_interval
+        self.calls = []
+        self.documents = []
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._requests = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._last_by_chat = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def methods(self, name: str) -> list:
+        with self._lock:
+            return [params for method, params in self.calls if method == name]
+
+    def _should_limit(self, params: dict) -> bool:
+        with self._lock:
+            number = next(self._requests)
+            if self.rate_limit_every and number % self.rate_limit_every == 0:
+                self.rejected += 1
+                return True
+            chat_id = params.get('chat_id')
+            if self.per_chat_interval and chat_id is not None:
+                now = time.monotonic()
+                last = self._last_by_chat.get(chat_id)
+                self._last_by_chat[chat_id] = now
+                if last is not None and now - last < self.per_chat_interval:
+                    self.rejected += 1
+                    return True
+        return False
+
+    def _result(self, method: str, params: dict):
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            return {
+                'message_id': next(self._message_ids),
+                'chat': {'id': int(params.get('chat_id', 0) or 0)},
+                'date': int(time.time()),
+                'text': params.get('text', '')
+            }
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'CoinFlip', 'username': 'coinflip_test_bot'}
+        if method == 'getWebhookInfo':
+            return {'url': '', 'pending_update_count': 0}
+        return True
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _params(self) -> dict:
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+                if content_type.startswith('application/json'):
+                    query.update(json.loads(raw or b'{}'))
+                elif content_type.startswith('multipart/form-data'):
+                    query['_multipart_bytes'] = len(raw)
+                    with fake._lock:
+                        fake.documents.append(raw)
+                else:
+                    query.update(urllib.parse.parse_qsl(raw.decode('utf-8')))
+                return query
+
+            def _reply(self, status: int, payload: dict):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self):
+                method = self.path.split('?')[0].rsplit('/', 1)[-1]
+                params = self._params()
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if fake._should_limit(params):
+                    self._reply(429, {
+                        'ok': False,
+                        'error_code': 429,
+                        'description': f'Too Many Requests: retry after {fake.retry_after}',
+                        'parameters': {'retry_after': fake.retry_after}
+                    })
+                    return
+                with fake._lock:
+                    fake.calls.append((method, params))
+                self._reply(200, {'ok': True, 'result': fake._result(method, params)})
+
+            do_GET = _handle
+            do_POST = _handle
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--rate-limit-every', type=int, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+    server = FakeTelegram(args.host, args.port, args.latency_ms / 1000, args.rate_limit_every, args.retry_after)
+    print(f'Fake Telegram Bot API on {server.url}')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
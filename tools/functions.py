@@ -0,0 +1,73 @@
+"""Загрузка облачных функций из backend/ для локальных скриптов и бенчмарков"""
+import hashlib
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+
+
+def load_function(name: str, shared: dict = None):
+    """Импортирует backend/<name>/index.py, не смешивая локальные модули разных функций
+
+    shared — словарь {(имя, sha256 файла): модуль}, общий для нескольких вызовов: побайтно
+    одинаковые копии (db.py, cache.py, telegram.py) разных функций получают один модуль,
+    а с ним общий пул соединений и кэш.
+    """
+    path = BACKEND_DIR / name
+    local_names = [p.stem for p in path.glob('*.py') if p.stem != 'index']
+    stashed = {n: sys.modules.pop(n) for n in local_names if n in sys.modules}
+    digests = {}
+    if shared is not None:
+        for n in local_names:
+            digests[n] = hashlib.sha256((path / f'{n}.py').read_bytes()).hexdigest()
+            if (n, digests[n]) in shared:
+                sys.modules[n] = shared[(n, digests[n])]
+    sys.path.insert(0, str(path))
+    try:
+        spec = importlib.util.spec_from_file_location(f'{name.replace("-", "_")}_index', path / 'index.py')
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        if shared is not None:
+            for n in local_names:
+                if n in sys.modules:
+                    shared.setdefault((n, digests[n]), sys.modules[n])
+    finally:
+        sys.path.remove(str(path))
+        for n in local_names:
+            sys.modules.pop(n, None)
+        sys.modules.update(stashed)
+    return module
+
+
+def post_event(body: dict) -> dict:
+    return {
+        'httpMethod': 'POST',
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
+
+
+def call(handler, body: dict) -> dict:
+    response = handler(post_event(body), None)
+    return json.loads(response['body']) if response.get('body') else {}
+
+
+def percentile(samples: list, q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Timer:
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
@@ -0,0 +1,343 @@
+"""Долгоживущий HTTP-сервер для облачных функций из backend/ на своих машинах
+
+Каждая функция доступна по /<имя> (/game, /bot, /bot-setup, …) и вызывается как на платформе:
+handler(event, context) в ограниченном пуле потоков. Побайтно одинаковые db.py, cache.py и
+telegram.py загружаются один раз, поэтому пул соединений и кэш у функций общие.
+GET /_status — время старта, счётчики по маршрутам и состояние пулов. SIGTERM/SIGINT
+перестают принимать запросы, дожидаются начатых и закрывают соединения:
+    DATABASE_URL=postgresql://localhost/coinflip python tools/serve.py --port 8080 --workers 16
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from types import SimpleNamespace
+
+from functions import BACKEND_DIR, load_function
+
+STARTED = time.perf_counter()
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Route:
+    def __init__(self, name: str, handler, import_ms: float):
+        self.name = name
+        self.handler = handler
+        self.import_ms = import_ms
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.first_ms = None
+        self.statuses = {}
+
+    def record(self, status: int, elapsed_ms: float):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if self.first_ms is None:
+            self.first_ms = round(elapsed_ms, 3)
+
+    def stats(self) -> dict:
+        return {
+            'import_ms': self.import_ms,
+            'first_request_ms': self.first_ms,
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.requests, 3) if self.requests else 0.0,
+            'statuses': self.statuses
+        }
+
+
+class FunctionServer:
+    def __init__(self, names: list, workers: int = 16, backlog: int = 64, grace: float = 30.0):
+        self.workers = workers
+        self.backlog = backlog
+        self.grace = grace
+        self.shared = {}
+        self.routes = {}
+        self.startup = {}
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._server = None
+        self._writers = set()
+        self._idle = None
+        self._stopping = None
+
+        for name in names:
+            started = time.perf_counter()
+            module = load_function(name, shared=self.shared)
+            self.routes[name] = Route(name, module.handler, round((time.perf_counter() - started) * 1000, 3))
+        self.startup['import_ms'] = round(sum(route.import_ms for route in self.routes.values()), 3)
+
+        users = {}
+        for name in names:
+            for path in (BACKEND_DIR / name).glob('*.py'):
+                if path.stem != 'index':
+                    users.setdefault((path.stem, hashlib.sha256(path.read_bytes()).hexdigest()), []).append(name)
+        self.startup['shared'] = {f'{module}.py': functions for (module, _), functions in users.items() if len(functions) > 1}
+
+    def warm(self):
+        """Открывает по соединению в каждом общем пуле до приёма запросов"""
+        started = time.perf_counter()
+        pools = 0
+        for (module_name, _), module in self.shared.items():
+            if module_name == 'db' and os.environ.get('DATABASE_URL'):
+                pool = module.get_pool()
+                pool.putconn(pool.getconn())
+                pools += 1
+        self.startup['warm_pools'] = pools
+        self.startup['warm_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    def status(self) -> dict:
+        pools = {}
+        for (module_name, digest), module in self.shared.items():
+            if module_name == 'db' and os.environ.get('DATABASE_URL'):
+                pools[digest[:12]] = module.get_pool().stats()
+        return {
+            'startup': self.startup,
+            'uptime_s': round(time.perf_counter() - STARTED, 1),
+            'workers': self.workers,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'routes': {name: route.stats() for name, route in self.routes.items()},
+            'pools': pools
+        }
+
+    async def _read_request(self, reader) -> tuple:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise HttpError(400, 'Incomplete request')
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, 'Request headers too large')
+
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, 'Malformed request line')
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            key, _, value = line.partition(':')
+            headers[key.strip()] = value.strip()
+        lowered = {key.lower(): value for key, value in headers.items()}
+
+        if 'chunked' in lowered.get('transfer-encoding', '').lower():
+            raise HttpError(411, 'Chunked request bodies are not supported')
+        length = int(lowered.get('content-length') or 0)
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, 'Request body too large')
+        body = await reader.readexactly(length) if length else b''
+
+        keep_alive = lowered.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+        return method.upper(), target, headers, body, keep_alive
+
+    def _event(self, method: str, target: str, headers: dict, body: bytes) -> tuple:
+        parsed = urllib.parse.urlsplit(target)
+        parts = parsed.path.strip('/').split('/', 1)
+        route = self.routes.get(parts[0])
+        try:
+            text, encoded = body.decode('utf-8'), False
+        except UnicodeDecodeError:
+            text, encoded = base64.b64encode(body).decode('ascii'), True
+        event = {
+            'httpMethod': method,
+            'path': '/' + (parts[1] if len(parts) > 1 else ''),
+            'headers': headers,
+            'queryStringParameters': dict(urllib.parse.parse_qsl(parsed.query)),
+            'body': text if text or method != 'POST' else '{}',
+            'isBase64Encoded': encoded,
+            'requestContext': {'requestId': uuid.uuid4().hex}
+        }
+        return route, event
+
+    def _call(self, route: Route, event: dict) -> dict:
+        context = SimpleNamespace(request_id=event['requestContext']['requestId'], function_name=route.name)
+        try:
+            return route.handler(event, context)
+        except Exception as e:
+            with self._lock:
+                route.errors += 1
+            print(json.dumps({'event': 'handler_error', 'route': route.name, 'error': repr(e)}), file=sys.stderr, flush=True)
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+
+    async def _respond(self, writer, response: dict, keep_alive: bool):
+        status = int(response.get('statusCode', 200))
+        body = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(body)
+        else:
+            payload = body.encode('utf-8') if isinstance(body, str) else bytes(body)
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f'HTTP/1.1 {status} {reason}']
+        for key, value in (response.get('headers') or {}).items():
+            if key.lower() not in ('content-length', 'connection', 'transfer-encoding'):
+                lines.append(f'{key}: {value}')
+        lines.append(f'Content-Length: {len(payload)}')
+        lines.append(f'Connection: {"keep-alive" if keep_alive else "close"}')
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+    def _error(self, status: int, message: str, retry_after: int = None) -> dict:
+        headers = {'Content-Type': 'application/json'}
+        if retry_after:
+            headers['Retry-After'] = str(retry_after)
+        return {'statusCode': status, 'headers': headers, 'body': json.dumps({'error': message}), 'isBase64Encoded': False}
+
+    async def _handle(self, reader, writer):
+        self._writers.add(writer)
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._respond(writer, self._error(e.status, str(e)), False)
+                    return
+                if request is None:
+                    return
+                method, target, headers, body, keep_alive = request
+
+                if target.split('?', 1)[0].rstrip('/') == '/_status':
+                    await self._respond(writer, {
+                        'statusCode': 200,
+                        'headers': {'Content-Type': 'application/json'},
+                        'body': json.dumps(self.status())
+                    }, keep_alive)
+                    continue
+
+                route, event = self._event(method, target, headers, body)
+                if route is None:
+                    await self._respond(writer, self._error(404, 'Unknown function'), keep_alive)
+                    continue
+                if self.in_flight >= self.workers + self.backlog:
+                    self.rejected += 1
+                    await self._respond(writer, self._error(503, 'Server busy', retry_after=1), keep_alive)
+                    continue
+
+                self.in_flight += 1
+                self._idle.clear()
+                started = time.perf_counter()
+                try:
+                    response = await loop.run_in_executor(self._executor, self._call, route, event)
+                finally:
+                    self.in_flight -= 1
+                    if not self.in_flight:
+                        self._idle.set()
+                route.record(int(response.get('statusCode', 200)), (time.perf_counter() - started) * 1000)
+                await self._respond(writer, response, keep_alive and not self._stopping.is_set())
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def serve(self, host: str, port: int, warm: bool = False):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='handler')
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = asyncio.Event()
+        if warm:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.warm)
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_HEADER_BYTES, backlog=1024)
+        self.startup['ready_ms'] = round((time.perf_counter() - STARTED) * 1000, 3)
+        print(json.dumps({
+            'event': 'listening',
+            'address': f'http://{host}:{self._server.sockets[0].getsockname()[1]}',
+            'routes': [f'/{name}' for name in self.routes],
+            **self.startup
+        }), flush=True)
+
+        await self._stopping.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """Закрывает приём, ждёт начатые вызовы не дольше grace и освобождает общие ресурсы"""
+        started = time.perf_counter()
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.grace)
+        except asyncio.TimeoutError:
+            pass
+        abandoned = self.in_flight
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.get_running_loop().run_in_executor(None, self._close_resources)
+        print(json.dumps({
+            'event': 'stopped',
+            'drain_ms': round((time.perf_counter() - started) * 1000, 3),
+            'abandoned': abandoned,
+            'routes': {name: route.stats() for name, route in self.routes.items()}
+        }), flush=True)
+
+    def _close_resources(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        for (module_name, _), module in self.shared.items():
+            if module_name == 'db':
+                module.close_all()
+            elif module_name == 'telegram' and getattr(module, '_client', None) is not None:
+                module._client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--functions', default=None, help='через запятую; по умолчанию из backend/func2url.json')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--backlog', type=int, default=64, help='запросов сверх workers, после которых отвечаем 503')
+    parser.add_argument('--grace', type=float, default=30.0)
+    parser.add_argument('--warm', action='store_true', help='открыть соединения с БД до приёма запросов')
+    args = parser.parse_args()
+
+    if args.functions:
+        names = args.functions.split(',')
+    else:
+        names = list(json.loads((BACKEND_DIR / 'func2url.json').read_text()))
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.workers))
+
+    server = FunctionServer(names, workers=args.workers, backlog=args.backlog, grace=args.grace)
+    asyncio.run(server.serve(args.host, args.port, warm=args.warm))
+
+
+if __name__ == '__main__':
+    main()